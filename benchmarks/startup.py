@@ -0,0 +1,93 @@
+"""Startup benchmark.
+Checks that importing the cli stays within its time budget and does not
+pull in the api stack, and that `duobot --help` works without credentials.
+Exits with status 1 if a check fails. Usage: python benchmarks/startup.py --help
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import click
+
+# modules only needed once lessons are solved
+LAZY_MODULES = ["requests", "urllib3", "dotenv", "asyncio", "sqlite3", "duobot.api"]
+
+
+def import_time(module: str) -> tuple[float, dict[str, float]]:
+    """Measure cumulative import time of a module with -X importtime.
+
+    Args:
+        module (str): module
+
+    Returns:
+        tuple[float, dict[str, float]]: import time of module and all imports in ms
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        imports[name.strip()] = int(cumulative) / 1000
+    return imports[module], imports
+
+
+def help_time() -> float:
+    """Measure wall time of `duobot --help` without credentials.
+
+    Returns:
+        float: time in ms
+    """
+    env = {k: v for k, v in os.environ.items() if not k.startswith("DUO_")}
+    ts_start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "from duobot.main import cli; cli()", "--help"],
+        capture_output=True,
+        check=True,
+        env=env,
+    )
+    return (time.perf_counter() - ts_start) * 1000
+
+
+@click.command()
+@click.option(
+    "--budget",
+    default=150.0,
+    show_default=True,
+    help="Max import time of duobot.main in ms.",
+)
+@click.option("-r", "--runs", default=5, show_default=True, type=click.INT)
+def cli(budget: float, runs: int):
+    """Check cli startup time against its budget."""
+    failed = False
+    samples = []
+    for _ in range(runs):
+        total, imports = import_time("duobot.main")
+        samples.append(total)
+        loaded = [m for m in LAZY_MODULES if m in imports]
+        if loaded:
+            print(f"FAIL duobot.main imports {', '.join(loaded)}")
+            failed = True
+            break
+    best = min(samples)
+    print(f"import duobot.main: {best:.1f} ms (budget {budget:.0f} ms)")
+    if best > budget:
+        print("FAIL import time over budget")
+        failed = True
+    try:
+        print(f"duobot --help: {min(help_time() for _ in range(runs)):.1f} ms")
+    except subprocess.CalledProcessError as e:
+        print(f"FAIL duobot --help exited with {e.returncode}: {e.stderr.decode()}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    cli()
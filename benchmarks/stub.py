@@ -0,0 +1,533 @@
+"""Stub server.
+Local stand-in for the Duolingo endpoints duobot uses, with synthetic
+payloads, configurable latency and error injection. Point a Config at it
+with BASE_HOST, STORIES_HOST and GOALS_HOST set to StubServer.url.
+"""
+
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+import click
+
+log = logging.getLogger(__name__)
+
+UNIT_LAYOUT = ["skill", "story", "skill", "practice", "chest", "skill", "unit_review"]
+CHALLENGE_TYPES = [
+    "assist",
+    "translate",
+    "listenTap",
+    "match",
+    "tapComplete",
+    "speak",
+    "listenSpeak",
+    "select",
+    "listenMatch",
+    "judge",
+    "form",
+]
+XP_SESSION = 10
+XP_STORY = 14
+GZIP_MIN_BYTES = 1024
+
+
+class StubAccount:
+    """Path progress of one user on the stub server"""
+
+    def __init__(self, user_id: str, units: int, layout: list[str] = UNIT_LAYOUT):
+        self.user_id = user_id
+        self.layout = layout
+        self.xp = 0
+        self.streak = 1
+        self.path = [self.create_unit(u) for u in range(units)]
+        self.path[0]["levels"][0]["state"] = "active"
+
+    def create_unit(self, unit: int) -> dict:
+        """Create unit of the path.
+
+        Args:
+            unit (int): unit index
+
+        Returns:
+            dict: unit
+        """
+        levels = []
+        for i, ltype in enumerate(self.layout):
+            level_id = f"{unit:03d}{i:02d}"
+            levels.append(
+                {
+                    "id": level_id,
+                    "type": ltype,
+                    "state": "locked",
+                    "finishedSessions": 0,
+                    "totalSessions": 4 if ltype == "skill" else 1,
+                    "debugName": f"Unit {unit + 1} {ltype} {i}",
+                    "hasLevelReview": ltype == "skill",
+                    "subtype": "default",
+                    "pathLevelMetadata": {
+                        "skillId": f"skill{level_id}",
+                        "storyId": f"story{level_id}",
+                        "anchorSkillId": f"skill{unit:03d}00",
+                        "treeId": "tree",
+                        "unitIndex": unit,
+                    },
+                    "pathLevelClientData": {"skillIds": [f"skill{unit:03d}00"]},
+                }
+            )
+        return {"unitIndex": unit, "levels": levels, "teachingObjective": "x" * 40}
+
+    def active_level(self) -> dict:
+        """Get active level.
+
+        Returns:
+            dict: level
+        """
+        for unit in self.path:
+            for level in unit["levels"]:
+                if level["state"] == "active":
+                    return level
+        raise RuntimeError("Path finished")
+
+    def advance(self, xp: int) -> None:
+        """Finish one session of the active level.
+
+        Args:
+            xp (int): xp earned
+        """
+        levels = [level for unit in self.path for level in unit["levels"]]
+        for i, level in enumerate(levels):
+            if level["state"] == "active":
+                level["finishedSessions"] += 1
+                if level["finishedSessions"] >= level["totalSessions"]:
+                    level["state"] = "passed"
+                    if i + 1 < len(levels):
+                        levels[i + 1]["state"] = "active"
+                break
+        self.xp += xp
+
+    def status(self) -> dict:
+        """Get user status.
+
+        Returns:
+            dict: status
+        """
+        return {
+            "totalXp": self.xp,
+            "currentCourseId": "DUOLINGO_DE_EN",
+            "streak": self.streak,
+            "timezone": "Europe/Berlin",
+        }
+
+    def rewards(self) -> dict:
+        """Get reward bundles.
+
+        Returns:
+            dict: rewards
+        """
+        bundles = [
+            {
+                "rewardBundleType": "DAILY_QUEST",
+                "rewards": [{"id": "quest", "consumed": False}],
+            }
+        ]
+        for level in self.chest_run():
+            bundles.append(
+                {
+                    "rewardBundleType": "PATH_CHEST",
+                    "rewards": [{"id": f"chest{level['id']}", "consumed": False}],
+                }
+            )
+        return {"rewardBundles": bundles}
+
+    def chest_run(self) -> list[dict]:
+        """Get the active level and the levels following it while they are chests.
+
+        Returns:
+            list[dict]: chest levels
+        """
+        chests: list[dict] = []
+        for unit in self.path:
+            for level in unit["levels"]:
+                if chests or level["state"] == "active":
+                    if level["type"] != "chest":
+                        return chests
+                    chests.append(level)
+        return chests
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler of the stub server"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: "StubServer"
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+    def reply(self, status: int, payload: dict | None = None) -> None:
+        """Send JSON response.
+
+        Args:
+            status (int): http status
+            payload (dict | None): body
+        """
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        accept = self.headers.get("Accept-Encoding", "")
+        if "gzip" in accept and len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        if status in (429, 503):
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self) -> dict | None:
+        """Read JSON request body, which may be gzip compressed.
+
+        Returns:
+            dict | None: body or None if its encoding is not accepted
+        """
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding", "identity") != "identity":
+            if not self.server.accept_gzip:
+                return None
+            data = gzip.decompress(data)
+        return json.loads(data) if data else {}
+
+    def handle_method(self, method: str) -> None:
+        """Dispatch request after injected latency and errors.
+
+        Args:
+            method (str): http method
+        """
+        server = self.server
+        body = self.read_body() if method != "GET" else {}
+        if body is None:
+            self.reply(415, {"error": "unsupported content encoding"})
+            return
+        server.delay()
+        if server.inject_error():
+            self.reply(503, {"error": "injected"})
+            return
+        path = urllib.parse.urlsplit(self.path).path
+        user_id = self.headers.get("X-Amzn-Trace-Id", "").removeprefix("User=")
+        try:
+            status, payload = server.route(user_id, method, path, self.path, body)
+        except KeyError:
+            status, payload = 404, {"error": "not found"}
+        self.reply(status, payload)
+
+    def do_GET(self):
+        self.handle_method("GET")
+
+    def do_POST(self):
+        self.handle_method("POST")
+
+    def do_PUT(self):
+        self.handle_method("PUT")
+
+    def do_PATCH(self):
+        self.handle_method("PATCH")
+
+
+class StubServer(ThreadingHTTPServer):
+    """Stub server class"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        units: int = 20,
+        layout: list[str] = UNIT_LAYOUT,
+        challenges: int = 15,
+        seed: int | None = None,
+        accept_gzip: bool = True,
+    ):
+        """Create stub server.
+
+        Args:
+            host (str): host to listen on
+            port (int): port to listen on, any free port if 0
+            latency (float): seconds added to every response
+            jitter (float): max seconds of random extra latency
+            error_rate (float): share of requests answered with 503
+            units (int): number of units on the path of every user
+            layout (list[str]): level types of every unit
+            challenges (int): number of challenges per session
+            seed (int | None): seed for synthetic payloads
+            accept_gzip (bool): accept gzip request bodies, else reply 415
+        """
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.units = units
+        self.layout = layout
+        self.challenges = challenges
+        self.accept_gzip = accept_gzip
+        self.random = random.Random(seed)
+        self.accounts: dict[str, StubAccount] = {}
+        self.lock = threading.Lock()
+        self.thread: threading.Thread | None = None
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def url(self) -> str:
+        """Base url of the server."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        """Serve in background thread.
+
+        Returns:
+            StubServer: server
+        """
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving."""
+        self.shutdown()
+        self.server_close()
+
+    def delay(self) -> None:
+        """Sleep for the configured latency."""
+        latency = self.latency
+        if self.jitter:
+            with self.lock:
+                latency += self.random.uniform(0, self.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def inject_error(self) -> bool:
+        """Decide if the current request fails.
+
+        Returns:
+            bool: fail request
+        """
+        with self.lock:
+            self.requests += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return True
+        return False
+
+    def account(self, user_id: str) -> StubAccount:
+        """Get account, created on first use.
+
+        Args:
+            user_id (str): user id
+
+        Returns:
+            StubAccount: account
+        """
+        if user_id not in self.accounts:
+            self.accounts[user_id] = StubAccount(user_id, self.units, self.layout)
+        return self.accounts[user_id]
+
+    def route(
+        self, user_id: str, method: str, path: str, raw: str, body: dict
+    ) -> tuple[int, dict]:
+        """Answer request.
+
+        Args:
+            user_id (str): user id from the trace header
+            method (str): http method
+            path (str): url path
+            raw (str): path with query
+            body (dict): request body
+
+        Returns:
+            tuple[int, dict]: status and payload
+        """
+        with self.lock:
+            if method == "GET" and (m := re.match(r"^/api2/stories/([^/]+)$", path)):
+                return 200, self.create_story(m.group(1))
+            if method == "POST" and path.endswith("/sessions"):
+                return 200, self.create_session(body)
+            if method == "POST" and path.endswith("/batch"):
+                if re.match(r"^/users/([^/]+)/progress/batch$", path):
+                    return 200, {"updated": len(body.get("metric_updates", []))}
+                return 200, self.answer_batch(self.account(user_id), body)
+            if method == "POST" and path.endswith("/batch-story-complete"):
+                return 200, self.answer_batch(self.account(user_id), body)
+            return self.answer_user(method, path, raw)
+
+    def answer_user(self, method: str, path: str, raw: str) -> tuple[int, dict]:
+        """Answer requests below /users/{id}.
+
+        Args:
+            method (str): http method
+            path (str): url path
+            raw (str): path with query
+
+        Returns:
+            tuple[int, dict]: status and payload
+        """
+        m = re.match(r"^/[^/]+/users/([^/]+)(/.*)?$", path)
+        if m is None:
+            raise KeyError(path)
+        account = self.account(m.group(1))
+        rest = m.group(2) or ""
+        if method == "GET" and rest.startswith("/courses/"):
+            return 200, {
+                "id": rest.split("/")[2],
+                "path": account.path,
+                "fromLanguage": "en",
+                "learningLanguage": "de",
+            }
+        if method == "PATCH" and rest.startswith("/rewards/"):
+            level = account.active_level()
+            if level["type"] != "chest" or rest.split("/")[2] != f"chest{level['id']}":
+                return 400, {"error": "no chest"}
+            account.advance(0)
+            return 200, {}
+        if method == "GET" and not rest:
+            if "rewardBundles" in raw:
+                return 200, account.rewards()
+            return 200, account.status()
+        raise KeyError(path)
+
+    def answer_batch(self, account: StubAccount, body: dict) -> dict:
+        """Answer all sub-requests of a batch.
+
+        Args:
+            account (StubAccount): account sending the batch
+            body (dict): batch payload
+
+        Returns:
+            dict: batch response
+        """
+        responses = []
+        for req in body["requests"]:
+            path = urllib.parse.urlsplit(req["url"]).path
+            if re.match(r"^/api2/stories/[^/]+/complete$", path):
+                account.advance(XP_STORY)
+                status, payload = 200, {"awardedXp": XP_STORY}
+            elif req["method"] == "PUT" and "/sessions/" in path:
+                account.advance(XP_SESSION)
+                status, payload = 200, {"trackingProperties": {}}
+            else:
+                status, payload = self.answer_user(req["method"], path, req["url"])
+            responses.append({"body": json.dumps(payload), "status": status})
+        return {"responses": responses}
+
+    def create_session(self, payload: dict) -> dict:
+        """Create synthetic session.
+
+        Args:
+            payload (dict): session request
+
+        Returns:
+            dict: session
+        """
+        rnd = self.random
+        challenges = []
+        for i in range(self.challenges):
+            ctype = CHALLENGE_TYPES[i % len(CHALLENGE_TYPES)]
+            challenge = {
+                "type": ctype,
+                "id": f"c{rnd.getrandbits(48):x}",
+                "prompt": "Ich trinke Wasser und esse Brot.",
+                "tts": f"https://d1vq87e9lcf771.cloudfront.net/{rnd.getrandbits(64):x}",
+                "compactTranslations": ["I drink water and eat bread."] * 3,
+                "correctSolutions": ["Ich trinke Wasser, und esse Brot!"],
+                "grader": {"vertices": [[{"to": 1, "lenient": "x"}] * 8] * 8},
+                "metadata": {"challenge_construction_insights": {}},
+                "progressUpdates": [],
+                "image": {"svg": "https://example.com/i.svg", "pdf": "x" * 200},
+                "newWords": ["Wasser"],
+                "weakWordPromptRanges": [],
+                "taggedKcIds": ["kc"] * 4,
+            }
+            if ctype in ("assist", "select", "judge", "form"):
+                challenge["choices"] = [
+                    {"text": w, "image": {"svg": "x"}} for w in ["Wasser", "Brot"]
+                ]
+                challenge["correctIndex"] = 0
+            if i % 3 == 0:
+                challenge["character"] = {
+                    "name": "Bea",
+                    "correctAnimation": "a",
+                    "idleAnimation": "b",
+                    "incorrectAnimation": "c",
+                    "url": "https://example.com/bea.riv",
+                }
+            challenges.append(challenge)
+        return {
+            "id": f"session{rnd.getrandbits(64):x}",
+            "type": payload.get("type", "LESSON"),
+            "fromLanguage": "en",
+            "learningLanguage": "de",
+            "challengeTimeTakenCutoff": 60000,
+            "challenges": challenges,
+            "adaptiveInterleavedChallenges": {"challenges": [], "indices": []},
+            "explanations": [{"title": "Tips", "body": "y" * 2000}],
+            "ttsAnnotations": {f"t{i}": {"x": "z" * 100} for i in range(20)},
+            "sessionStartExperiments": [],
+            "metadata": {"id": "meta"},
+            "trackingProperties": {
+                "num_adaptive_challenges_generated": 0,
+                "num_challenges_gt_listen_tap": 2,
+            },
+        }
+
+    def create_story(self, story_id: str) -> dict:
+        """Create synthetic story.
+
+        Args:
+            story_id (str): story id
+
+        Returns:
+            dict: story
+        """
+        elements = [{"type": "HEADER", "title": story_id}]
+        for i in range(30):
+            elements.append({"type": "LINE", "line": {"text": "Hallo! " * 5}})
+            if i % 4 == 0:
+                elements.append({"type": "MULTIPLE_CHOICE", "answers": ["a", "b"]})
+        return {
+            "elements": elements,
+            "fromLanguage": "en",
+            "learningLanguage": "de",
+            "baseXp": XP_STORY,
+            "startTime": int(time.time()),
+            "illustrations": {"active": "x" * 500},
+        }
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8080, show_default=True, type=click.INT)
+@click.option("--latency", default=0.0, show_default=True, type=click.FLOAT)
+@click.option("--jitter", default=0.0, show_default=True, type=click.FLOAT)
+@click.option("--error-rate", default=0.0, show_default=True, type=click.FLOAT)
+def serve(host: str, port: int, latency: float, jitter: float, error_rate: float):
+    """Run the stub server in the foreground."""
+    logging.basicConfig(level=logging.INFO)
+    server = StubServer(host, port, latency, jitter, error_rate)
+    log.info("Stub server listening on %s", server.url)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    serve()
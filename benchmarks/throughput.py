@@ -0,0 +1,205 @@
+"""Throughput benchmark.
+Runs duobot against the local stub server with virtual submission waits
+and reports lessons per hour including the waits, lessons per minute
+without them, latency percentiles per endpoint and CPU time per lesson.
+Usage: python benchmarks/throughput.py --help
+"""
+
+from collections import defaultdict
+import logging
+import statistics
+import time
+
+import click
+
+from duobot import main
+from duobot.api import Api
+from duobot.config import Config
+from duobot.sessions import Sessions
+from duobot.storycache import StoryCache
+
+from stub import UNIT_LAYOUT, StubServer
+
+ENDPOINTS = [
+    "fetch_user_status",
+    "fetch_current_course",
+    "fetch_rewards",
+    "fetch_session",
+    "send_batch_requests",
+    "fetch_story",
+    "fetch_chest",
+    "post_progress_update",
+]
+
+
+class TimedApi(Api):
+    """Api recording the latency of every endpoint call"""
+
+    def __init__(self, config: Config):
+        super().__init__(config)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        for name in ENDPOINTS:
+            setattr(self, name, self.timed(name, getattr(self, name)))
+
+    def timed(self, name, func):
+        """Wrap endpoint method with a timer."""
+
+        def wrapper(*args, **kwargs):
+            ts_start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.latencies[name].append(time.perf_counter() - ts_start)
+
+        return wrapper
+
+
+class VirtualSessions(Sessions):
+    """Sessions that count submission waits instead of sleeping.
+    Wall time plus the waits skipped so far is the virtual clock. A lesson
+    prepared before a wait was skipped runs down its time during that
+    wait, so only the rest of its own wait is counted.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.virtual_wait = 0.0
+        self.prepared_at: dict[int, float] = {}
+
+    def prepare_lesson(self, lesson, course):
+        prepared = super().prepare_lesson(lesson, course)
+        self.prepared_at[prepared.endtime] = self.virtual_wait
+        return prepared
+
+    def wait_until(self, endtime: int) -> None:
+        skipped = self.virtual_wait - self.prepared_at.pop(endtime, self.virtual_wait)
+        self.virtual_wait += max(0.0, endtime - time.time() - skipped)
+
+
+def percentiles(samples: list[float]) -> tuple[float, float, float]:
+    """Get p50, p95 and p99 of samples in ms."""
+    if len(samples) < 2:
+        value = samples[0] * 1000 if samples else 0.0
+        return value, value, value
+    q = statistics.quantiles(samples, n=100, method="inclusive")
+    return q[49] * 1000, q[94] * 1000, q[98] * 1000
+
+
+def create_session(server: StubServer, user_id: str) -> VirtualSessions:
+    """Create session of a stub user."""
+    config = Config(
+        USER_ID=user_id,
+        AUTH="Bearer benchmark",
+        BASE_HOST=server.url,
+        STORIES_HOST=server.url,
+        GOALS_HOST=server.url,
+    )
+    config.DELAY_BETWEEN_LESSONS = 0
+    return VirtualSessions(TimedApi(config), stories=StoryCache(":memory:"))
+
+
+def bench_start(server: StubServer, lessons: int, pipeline: bool) -> dict:
+    """Run main.start for a number of lessons."""
+    session = create_session(server, f"start{int(pipeline)}")
+    ts_start, cpu_start = time.perf_counter(), time.process_time()
+    main.start(lessons, pipeline, session)
+    wall = time.perf_counter() - ts_start
+    cpu = time.process_time() - cpu_start
+    return {
+        "name": "main.start" + (" --pipeline" if pipeline else ""),
+        "lessons": lessons,
+        "wall": wall,
+        "cpu": cpu,
+        "virtual_wait": session.virtual_wait,
+        "latencies": session.api.latencies,
+    }
+
+
+def bench_lesson_types(server: StubServer, rounds: int) -> dict[str, dict]:
+    """Run Sessions.solve_lesson for every lesson type of the path."""
+    results = {}
+    for ltype in sorted(set(UNIT_LAYOUT)):
+        cpu_times = []
+        session = create_session(server, f"type-{ltype}")
+        account = server.account(session.config.USER_ID)
+        for _ in range(rounds):
+            # move the path forward to the next level of this type
+            while account.active_level()["type"] != ltype:
+                account.advance(0)
+            status = session.api.fetch_user_status()
+            course = session.api.fetch_current_course(status["currentCourseId"])
+            lesson = session.get_next_lesson(course)
+            cpu_start = time.process_time()
+            session.solve_lesson(course, lesson)
+            cpu_times.append(time.process_time() - cpu_start)
+        results[ltype] = {
+            "cpu": statistics.mean(cpu_times),
+            "latencies": session.api.latencies,
+        }
+    return results
+
+
+def report(result: dict) -> None:
+    """Print result of a main.start run."""
+    # time the run would have taken had it waited
+    elapsed = result["wall"] + result["virtual_wait"]
+    per_hour = result["lessons"] / elapsed * 3600
+    per_min = result["lessons"] / result["wall"] * 60
+    print(f"\n{result['name']}: {result['lessons']} lessons")
+    print(f"  virtual {elapsed:.0f}s, {per_hour:.0f} lessons/hour with waits")
+    print(f"  wall {result['wall']:.2f}s, {per_min:.0f} lessons/min without waits")
+    print(f"  cpu {result['cpu'] / result['lessons'] * 1000:.1f} ms/lesson")
+    print(f"  virtual submission wait {result['virtual_wait']:.0f}s")
+    print_latencies(result["latencies"])
+
+
+def print_latencies(latencies: dict[str, list[float]]) -> None:
+    """Print latency percentiles per endpoint."""
+    print(f"  {'endpoint':<22}{'calls':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name in ENDPOINTS:
+        if samples := latencies.get(name):
+            p50, p95, p99 = percentiles(samples)
+            print(f"  {name:<22}{len(samples):>6}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}")
+
+
+@click.command()
+@click.option("-l", "--lessons", default=50, show_default=True, type=click.INT)
+@click.option("-r", "--rounds", default=5, show_default=True, type=click.INT)
+@click.option(
+    "--latency", default=0.0, show_default=True, help="Stub latency in seconds."
+)
+@click.option(
+    "--jitter", default=0.0, show_default=True, help="Stub jitter in seconds."
+)
+@click.option("--error-rate", default=0.0, show_default=True)
+@click.option("-c", "--challenges", default=15, show_default=True, type=click.INT)
+def cli(
+    lessons: int,
+    rounds: int,
+    latency: float,
+    jitter: float,
+    error_rate: float,
+    challenges: int,
+):
+    """Benchmark duobot against the local stub server."""
+    logging.getLogger("duobot").setLevel(logging.WARNING)
+    server = StubServer(
+        latency=latency,
+        jitter=jitter,
+        error_rate=error_rate,
+        challenges=challenges,
+        seed=0,
+    ).start()
+    try:
+        for pipeline in (False, True):
+            report(bench_start(server, lessons, pipeline))
+        print("\nSessions.solve_lesson per lesson type")
+        for ltype, result in bench_lesson_types(server, rounds).items():
+            print(f"\n{ltype}: cpu {result['cpu'] * 1000:.1f} ms/lesson")
+            print_latencies(result["latencies"])
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    cli()
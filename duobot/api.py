@@ -1,71 +1,392 @@
 """API"""
 
-import json
+import asyncio
+from collections.abc import Callable, Sequence
+import gzip
 import logging
+import time
+from typing import Any
+import urllib.parse
 
 import requests
+from requests.adapters import HTTPAdapter
 
+from duobot import jsonlib, metrics
+from duobot.cache import ResponseCache
+from duobot.challenges import session_pairs_hook
 from duobot.config import Config
+from duobot.resilience import CircuitBreaker, RetryPolicy
+from duobot.storycache import StorySummary, story_pairs_hook
 
 log = logging.getLogger(__name__)
 
-URL_COURSE = Config.URL_COURSE
-HEADERS = Config.HEADERS
 API_TIMEOUT = Config.API_TIMEOUT
-URL_REWARDS = Config.URL_REWARDS
 SESSION_PAYLOAD = Config.SESSION_PAYLOAD
-URL_SESSIONS = Config.URL_SESSIONS
-URL_STATUS = Config.URL_STATUS
-URL_BATCH = Config.URL_BATCH
-URL_BATCH_STORY = Config.URL_BATCH_STORY
-URL_STORY = Config.URL_STORY
-URL_PROGRESS = Config.URL_PROGRESS
+POOL_CONNECTIONS = Config.POOL_CONNECTIONS
+POOL_MAXSIZE = Config.POOL_MAXSIZE
+COMPRESS_MIN_BYTES = Config.COMPRESS_MIN_BYTES
+COMPRESS_LEVEL = Config.COMPRESS_LEVEL
+IDEMPOTENT_METHODS = ("get", "head", "put", "delete")
+# gzip and deflate, plus br and zstd if brotli and zstandard are installed
+ACCEPT_ENCODING = requests.utils.DEFAULT_ACCEPT_ENCODING
 
 
 class Api:
     """Api class."""
 
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        config: Config | None = None,
+        pool_connections: int = POOL_CONNECTIONS,
+        pool_maxsize: int = POOL_MAXSIZE,
+        retry: RetryPolicy | None = None,
+    ):
+        """Create a long-lived http session with a keep-alive connection pool per host.
 
-    def send_request(self, method: str, url: str, payload: dict | None = None) -> dict:
+        Args:
+            config (Config | None): account config, read from environment if None
+            pool_connections (int): number of hosts to keep a pool for
+            pool_maxsize (int): number of connections to keep per host
+            retry (RetryPolicy | None): retry policy, defaults from Config if None
+        """
+        self.config = config or Config()
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+        self.http = requests.Session()
+        self.http.mount("https://", self.adapter)
+        self.http.mount("http://", self.adapter)
+        self.http.headers.update(self.config.HEADERS)
+        self.cache = ResponseCache(self.config.CACHE_TTLS)
+        self.course_urls: dict[frozenset[str], str] = {}
+        self.retry = retry or RetryPolicy()
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.uncompressed_hosts: set[str] = set()
+
+    def close(self) -> None:
+        """Close all pooled connections."""
+        self.http.close()
+
+    def pool_stats(self) -> dict[str, dict[str, int]]:
+        """Get connection pool statistics per host.
+
+        Returns:
+            dict[str, dict[str, int]]: number of requests, new and reused connections
+        """
+        stats = {}
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            stats[pool.host] = {
+                "requests": pool.num_requests,
+                "new": pool.num_connections,
+                "reused": pool.num_requests - pool.num_connections,
+            }
+        return stats
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """Get circuit breaker of the host of a url.
+
+        Args:
+            url (str): url
+
+        Returns:
+            CircuitBreaker: circuit breaker
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        if (breaker := self.breakers.get(host)) is None:
+            breaker = self.breakers.setdefault(host, CircuitBreaker(host))
+        return breaker
+
+    def compression(self, url: str) -> tuple[bool, bool]:
+        """Get compression switches of the host of a url.
+
+        Args:
+            url (str): url
+
+        Returns:
+            tuple[bool, bool]: compress responses and request bodies
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        responses, reqs = self.config.COMPRESSION_HOSTS.get(
+            host, (self.config.COMPRESS_RESPONSES, self.config.COMPRESS_REQUESTS)
+        )
+        return responses, reqs and host not in self.uncompressed_hosts
+
+    def compress_body(self, data: bytes) -> bytes | None:
+        """Gzip request body if that makes it smaller.
+
+        Args:
+            data (bytes): body
+
+        Returns:
+            bytes | None: compressed body or None if not worth it
+        """
+        if len(data) < COMPRESS_MIN_BYTES:
+            return None
+        metrics.BODY_BYTES.inc(len(data), "sent")
+        ts_start = time.thread_time()
+        compressed = gzip.compress(data, COMPRESS_LEVEL)
+        metrics.CODEC_SECONDS.observe(time.thread_time() - ts_start, "sent", "gzip")
+        if len(compressed) >= len(data):
+            return None
+        metrics.COMPRESSION_RATIO.observe(len(data) / len(compressed), "sent")
+        return compressed
+
+    def read_body(self, response: requests.Response) -> bytes:
+        """Read and decompress response body, recording its size and cost.
+
+        Args:
+            response (requests.Response): streamed response
+
+        Returns:
+            bytes: body
+        """
+        encoding = response.headers.get("Content-Encoding", "identity")
+        ts_start = time.thread_time()
+        content = response.content
+        seconds = time.thread_time() - ts_start
+        metrics.CODEC_SECONDS.observe(seconds, "received", encoding)
+        wire = response.raw.tell() or len(content)
+        metrics.RECEIVED_BYTES.inc(wire)
+        metrics.BODY_BYTES.inc(len(content), "received")
+        if encoding != "identity" and wire:
+            metrics.COMPRESSION_RATIO.observe(len(content) / wire, "received")
+        return content
+
+    def cache_stats(self) -> dict[str, int]:
+        """Get response cache statistics.
+
+        Returns:
+            dict[str, int]: hits, misses, revalidations and entries
+        """
+        return self.cache.stats()
+
+    def send_request(
+        self,
+        method: str,
+        url: str,
+        payload: dict | None = None,
+        endpoint: str | None = None,
+        data: bytes | None = None,
+        idempotent: bool | None = None,
+        object_pairs_hook: Callable[[list], Any] | None = None,
+        compress: bool = False,
+        metric: str = "request",
+    ) -> Any:
         """Send request to api.
+        GET responses of endpoints with a cache ttl are served from the cache.
+        Compressed responses are accepted unless switched off for the host.
 
         Args:
             method (str): method
             url (str): url
             payload (dict | None): payload
+            endpoint (str | None): endpoint name used for caching
+            data (bytes | None): already serialized JSON payload
+            idempotent (bool | None): request can be repeated safely, by method if None
+            object_pairs_hook (Callable[[list], Any] | None): builds decoded objects
+            compress (bool): gzip body if switched on for the host
+            metric (str): endpoint name used for metrics
 
         Returns:
-            dict: response
+            Any: response
         """
+        cacheable = method == "get" and self.cache.is_cacheable(endpoint)
+        entry = self.cache.get(url) if cacheable else None
+        if entry is not None and entry.is_fresh():
+            log.debug("Cache hit for %s", url)
+            self.cache.hits += 1
+            metrics.REQUESTS.inc(1, metric, "cache")
+            return jsonlib.loads(entry.content)
+
+        headers = entry.validators() if entry is not None else {}
+        compress_responses, compress_requests = self.compression(url)
+        headers["Accept-Encoding"] = (
+            ACCEPT_ENCODING if compress_responses else "identity"
+        )
+        if payload is not None:
+            data = jsonlib.dumps_bytes(payload)
+        if data is not None:
+            headers["Content-Type"] = "application/json"
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
         log.debug("Sending request to %s", url)
-        log.debug("Payload: %s", payload)
-        try:
-            response = requests.request(
-                method, url, json=payload, headers=HEADERS, timeout=API_TIMEOUT
+        log.debug("Payload: %s", payload if data is None else data)
+        compressed = None
+        if compress and compress_requests and data is not None:
+            compressed = self.compress_body(data)
+        with metrics.instrument(metric):
+            if compressed is None:
+                response, content = self.send_with_retry(
+                    method, url, data, headers, idempotent
+                )
+            else:
+                try:
+                    response, content = self.send_with_retry(
+                        method,
+                        url,
+                        compressed,
+                        {**headers, "Content-Encoding": "gzip"},
+                        idempotent,
+                    )
+                except requests.exceptions.HTTPError as e:
+                    if e.response is None or e.response.status_code != 415:
+                        raise
+                    host = urllib.parse.urlsplit(url).netloc
+                    log.warning("%s does not accept compressed requests", host)
+                    self.uncompressed_hosts.add(host)
+                    response, content = self.send_with_retry(
+                        method, url, data, headers, idempotent
+                    )
+        if entry is not None and response.status_code == 304:
+            log.debug("Cache revalidated for %s", url)
+            self.cache.revalidations += 1
+            self.cache.refresh(entry)
+            return jsonlib.loads(entry.content)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Response: %s", response.text)
+        if cacheable:
+            self.cache.misses += 1
+            self.cache.store(url, endpoint, content, response.headers)
+        if object_pairs_hook is not None:
+            return jsonlib.loads_pairs(content, object_pairs_hook)
+        return jsonlib.loads(content)
+
+    def send_with_retry(
+        self,
+        method: str,
+        url: str,
+        data: bytes | None,
+        headers: dict[str, str],
+        idempotent: bool,
+    ) -> tuple[requests.Response, bytes]:
+        """Send request, retrying transient failures with backoff.
+        Requests to a host whose circuit is open fail fast. The body is read
+        within the retries, so a connection breaking off while it is
+        streamed is retried and counted by the circuit breaker like any
+        other failure.
+
+        Args:
+            method (str): method
+            url (str): url
+            data (bytes | None): body
+            headers (dict[str, str]): request specific headers
+            idempotent (bool): request can be repeated safely
+
+        Returns:
+            tuple[requests.Response, bytes]: successful response and its body
+
+        Raises:
+            CircuitOpenError: host is down
+            requests.exceptions.RequestException: request failed for good
+        """
+        breaker = self.breaker(url)
+        attempt = 0
+        while True:
+            probe = breaker.check()
+            if data is not None:
+                metrics.SENT_BYTES.inc(len(data))
+            try:
+                response = self.http.request(
+                    method,
+                    url,
+                    data=data,
+                    headers=headers,
+                    timeout=API_TIMEOUT,
+                    stream=True,
+                )
+                if response.status_code < 400:
+                    content = self.read_body(response)
+            except requests.exceptions.RequestException as e:
+                breaker.record_failure()
+                if not self.retry.should_retry_error(e, idempotent, attempt):
+                    log.error("Error sending request to %s: %s", url, e)
+                    raise
+                delay = self.retry.delay(attempt)
+                reason = type(e).__name__
+            else:
+                status = response.status_code
+                if status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                if status < 400:
+                    return response, content
+                if not self.retry.should_retry_status(status, idempotent, attempt):
+                    log.error("Error sending request. Response: %s", response.text)
+                    response.raise_for_status()
+                delay = self.retry.delay(attempt, response.headers.get("Retry-After"))
+                reason = str(status)
+                response.close()
+            finally:
+                if probe:
+                    # a probe failing with anything else must not block the host
+                    breaker.end_probe()
+            attempt += 1
+            log.warning(
+                "Request to %s failed (%s), retry %s in %.1f seconds",
+                url,
+                reason,
+                attempt,
+                delay,
             )
-            response.raise_for_status()
-        except (requests.exceptions.HTTPError, json.JSONDecodeError):
-            log.exception("Error sending request. Response: %s", response.text)
-            raise
-        log.debug("Response: %s", response.text)
-        return response.json()
-
-    def fetch_current_course(self, course_id: str) -> dict:
+            metrics.RETRIES.inc(1, breaker.host)
+            time.sleep(delay)
+
+    def course_url(self, fields: Sequence[str] | None) -> str:
+        """Get course url template requesting only the given fields.
+
+        Args:
+            fields (Sequence[str] | None): course fields, all fields if None
+
+        Returns:
+            str: url with course_id placeholder
+        """
+        if fields is None:
+            return self.config.URL_COURSE
+        key = frozenset(fields)
+        if (url := self.course_urls.get(key)) is None:
+            query = urllib.parse.quote(",".join(sorted(key)), safe="")
+            url = self.course_urls[key] = self.config.URL_COURSE_BASE + query
+        return url
+
+    def fetch_current_course(
+        self, course_id: str, fields: Sequence[str] | None = None, full: bool = False
+    ) -> dict:
         """Fetch current course.
+        Only the fields duobot needs are requested unless full is set.
 
         Args:
             course_id (str): course_id
+            fields (Sequence[str] | None): course fields, Config.COURSE_FIELDS if None
+            full (bool): request all course fields
 
         Returns:
             dict: courses
         """
         log.info("Getting current courses")
+        if not full and fields is None:
+            fields = self.config.COURSE_FIELDS
+        url = self.course_url(None if full else fields)
         return self.send_request(
-            method="get", url=URL_COURSE.format(course_id=course_id)
+            method="get",
+            url=url.format(course_id=course_id),
+            endpoint="course",
+            metric="fetch_current_course",
         )
 
+    def store_course(self, course: dict) -> None:
+        """Cache a course changed locally, e.g. after opening chests.
+        Only courses with the default fields are cached.
+
+        Args:
+            course (dict): course with its id
+        """
+        url = self.course_url(self.config.COURSE_FIELDS)
+        content = jsonlib.dumps_bytes(course)
+        self.cache.store(url.format(course_id=course["id"]), "course", content, {})
+
     def fetch_rewards(self) -> dict:
         """Fetch rewards.
 
@@ -73,10 +394,17 @@ class Api:
             dict: rewards
         """
         log.info("Getting rewards")
-        return self.send_request(method="get", url=URL_REWARDS)
+        return self.send_request(
+            method="get",
+            url=self.config.URL_REWARDS,
+            endpoint="rewards",
+            metric="fetch_rewards",
+        )
 
     def fetch_session(self, payload: dict) -> dict:
         """Fetch session.
+        With LEAN_RESPONSES, keys that are never sent back are dropped while
+        decoding.
 
         Args:
             payload (dict): payload
@@ -84,7 +412,15 @@ class Api:
         Returns:
             dict: session
         """
-        return self.send_request(method="post", url=URL_SESSIONS, payload=payload)
+        return self.send_request(
+            method="post",
+            url=self.config.URL_SESSIONS,
+            payload=payload,
+            object_pairs_hook=(
+                session_pairs_hook if self.config.LEAN_RESPONSES else None
+            ),
+            metric="fetch_session",
+        )
 
     def fetch_user_status(self) -> dict:
         """Fetch user status."
@@ -93,36 +429,94 @@ class Api:
             dict: user status
         """
         log.info("Getting user status")
-        return self.send_request(method="get", url=URL_STATUS)
+        return self.send_request(
+            method="get",
+            url=self.config.URL_STATUS,
+            endpoint="status",
+            metric="fetch_user_status",
+        )
 
-    def send_batch_requests(self, reqs: list[dict], url: str) -> dict:
+    def send_batch_requests(
+        self, reqs: list[dict], url: str, idempotent: bool = False
+    ) -> dict:
         """Send requests as batch.
 
         Args:
             reqs (list[dict]): requests
             url (str): url
+            idempotent (bool): all requests can be repeated safely
 
         Returns:
             dict: response
         """
-        payload = {
-            "requests": reqs,
-            "includeHeaders": False,
-        }
-        return self.send_request(method="post", url=url, payload=payload)
+        data = jsonlib.build_batch_body(reqs, include_headers=False)
+        response = self.send_request(
+            method="post",
+            url=url,
+            data=data,
+            idempotent=idempotent,
+            compress=True,
+            metric="send_batch_requests",
+        )
+        self.cache.invalidate("status", "course", "rewards")
+        self.store_batch_status(reqs, response)
+        return response
+
+    def store_batch_status(self, reqs: list[dict], response: dict) -> None:
+        """Cache user status returned by a status request within a batch.
 
-    def fetch_story(self, story_id: str) -> dict:
+        Args:
+            reqs (list[dict]): batch requests
+            response (dict): batch response
+        """
+        for req, resp in zip(reqs, response.get("responses", [])):
+            if (
+                req["method"] == "GET"
+                and req["url"] == self.config.BATCH_URL_USER_STATUS
+                and resp.get("status") == 200
+                and resp.get("body")
+            ):
+                log.debug("Caching user status from batch response")
+                body = resp["body"]
+                if not isinstance(body, str):
+                    body = jsonlib.dumps(body)
+                self.cache.store(self.config.URL_STATUS, "status", body.encode(), {})
+
+    def fetch_story(
+        self, story_id: str, object_pairs_hook: Callable[[list], Any] | None = None
+    ) -> Any:
         """Fetch story.
 
         Args:
             story_id (str): story_id
+            object_pairs_hook (Callable[[list], Any] | None): builds decoded objects
 
         Returns:
-            dict: story
+            Any: story
         """
         log.info("Fetching story")
-        url = URL_STORY.format(story_id=story_id)
-        return self.send_request(method="get", url=url)
+        url = self.config.URL_STORY.format(story_id=story_id)
+        return self.send_request(
+            method="get",
+            url=url,
+            object_pairs_hook=object_pairs_hook,
+            metric="fetch_story",
+        )
+
+    def fetch_story_summary(self, story_id: str) -> StorySummary:
+        """Fetch story and summarize it.
+        With LEAN_RESPONSES, the summary is built while decoding and the
+        story itself is never allocated.
+
+        Args:
+            story_id (str): story_id
+
+        Returns:
+            StorySummary: story summary
+        """
+        if self.config.LEAN_RESPONSES:
+            return self.fetch_story(story_id, story_pairs_hook)
+        return StorySummary.from_story(self.fetch_story(story_id))
 
     def fetch_chest(self, url: str, payload: dict) -> dict:
         """Fetch chest.
@@ -135,7 +529,15 @@ class Api:
             dict: response
         """
         log.info("Fetching chest")
-        return self.send_request(method="patch", url=url, payload=payload)
+        response = self.send_request(
+            method="patch",
+            url=url,
+            payload=payload,
+            idempotent=True,
+            metric="fetch_chest",
+        )
+        self.cache.invalidate("status", "course", "rewards")
+        return response
 
     def post_progress_update(self, payload: dict) -> dict:
         """Post progress update.
@@ -146,4 +548,172 @@ class Api:
         Returns:
             dict: response
         """
-        return self.send_request(method="post", url=URL_PROGRESS, payload=payload)
+        return self.send_request(
+            method="post",
+            url=self.config.URL_PROGRESS,
+            payload=payload,
+            metric="post_progress_update",
+        )
+
+
+class AsyncApi:
+    """Asyncio api class.
+    Awaitable counterpart of Api. Requests run on the pooled transport of a
+    wrapped Api in the default executor, so one event loop can drive many
+    lessons at once.
+    """
+
+    def __init__(self, api: Api | None = None):
+        self.api = api or Api()
+
+    async def send_request(
+        self,
+        method: str,
+        url: str,
+        payload: dict | None = None,
+        endpoint: str | None = None,
+        data: bytes | None = None,
+        idempotent: bool | None = None,
+        object_pairs_hook: Callable[[list], Any] | None = None,
+        compress: bool = False,
+        metric: str = "request",
+    ) -> Any:
+        """Send request to api.
+
+        Args:
+            method (str): method
+            url (str): url
+            payload (dict | None): payload
+            endpoint (str | None): endpoint name used for caching
+            data (bytes | None): already serialized JSON payload
+            idempotent (bool | None): request can be repeated safely, by method if None
+            object_pairs_hook (Callable[[list], Any] | None): builds decoded objects
+            compress (bool): gzip body if switched on for the host
+            metric (str): endpoint name used for metrics
+
+        Returns:
+            Any: response
+        """
+        return await asyncio.to_thread(
+            self.api.send_request,
+            method,
+            url,
+            payload,
+            endpoint,
+            data,
+            idempotent,
+            object_pairs_hook,
+            compress,
+            metric,
+        )
+
+    async def fetch_current_course(
+        self, course_id: str, fields: Sequence[str] | None = None, full: bool = False
+    ) -> dict:
+        """Fetch current course.
+
+        Args:
+            course_id (str): course_id
+            fields (Sequence[str] | None): course fields, Config.COURSE_FIELDS if None
+            full (bool): request all course fields
+
+        Returns:
+            dict: courses
+        """
+        return await asyncio.to_thread(
+            self.api.fetch_current_course, course_id, fields, full
+        )
+
+    async def fetch_rewards(self) -> dict:
+        """Fetch rewards.
+
+        Returns:
+            dict: rewards
+        """
+        return await asyncio.to_thread(self.api.fetch_rewards)
+
+    async def fetch_session(self, payload: dict) -> dict:
+        """Fetch session.
+
+        Args:
+            payload (dict): payload
+
+        Returns:
+            dict: session
+        """
+        return await asyncio.to_thread(self.api.fetch_session, payload)
+
+    async def fetch_user_status(self) -> dict:
+        """Fetch user status.
+
+        Returns:
+            dict: user status
+        """
+        return await asyncio.to_thread(self.api.fetch_user_status)
+
+    async def send_batch_requests(
+        self, reqs: list[dict], url: str, idempotent: bool = False
+    ) -> dict:
+        """Send requests as batch.
+
+        Args:
+            reqs (list[dict]): requests
+            url (str): url
+            idempotent (bool): all requests can be repeated safely
+
+        Returns:
+            dict: response
+        """
+        return await asyncio.to_thread(
+            self.api.send_batch_requests, reqs, url, idempotent
+        )
+
+    async def fetch_story(
+        self, story_id: str, object_pairs_hook: Callable[[list], Any] | None = None
+    ) -> Any:
+        """Fetch story.
+
+        Args:
+            story_id (str): story_id
+            object_pairs_hook (Callable[[list], Any] | None): builds decoded objects
+
+        Returns:
+            Any: story
+        """
+        return await asyncio.to_thread(
+            self.api.fetch_story, story_id, object_pairs_hook
+        )
+
+    async def fetch_story_summary(self, story_id: str) -> StorySummary:
+        """Fetch story and summarize it.
+
+        Args:
+            story_id (str): story_id
+
+        Returns:
+            StorySummary: story summary
+        """
+        return await asyncio.to_thread(self.api.fetch_story_summary, story_id)
+
+    async def fetch_chest(self, url: str, payload: dict) -> dict:
+        """Fetch chest.
+
+        Args:
+            url (str): url
+            payload (dict): payload
+
+        Returns:
+            dict: response
+        """
+        return await asyncio.to_thread(self.api.fetch_chest, url, payload)
+
+    async def post_progress_update(self, payload: dict) -> dict:
+        """Post progress update.
+
+        Args:
+            payload (dict): payload
+
+        Returns:
+            dict: response
+        """
+        return await asyncio.to_thread(self.api.post_progress_update, payload)
@@ -0,0 +1,163 @@
+"""Batch coalescer"""
+
+from concurrent.futures import Future
+import logging
+import threading
+
+from duobot.api import Api
+from duobot.config import Config
+
+log = logging.getLogger(__name__)
+
+BATCH_WINDOW = Config.BATCH_WINDOW
+BATCH_MAX_SIZE = Config.BATCH_MAX_SIZE
+
+
+class BatchCoalescer:
+    """Batch coalescer class.
+    Collects sub-requests of one account for a short flush window and sends
+    them as a single batch call. A caller alone with no other sub-requests
+    pending or in flight is sent at once, so sequential lessons never wait
+    for the window. Every caller gets back the entry of the batch
+    "responses" array belonging to its own sub-request.
+    Can be used in place of Api for send_batch_requests.
+    """
+
+    def __init__(
+        self,
+        api: Api,
+        window: float = BATCH_WINDOW,
+        max_size: int = BATCH_MAX_SIZE,
+    ):
+        """Create coalescer.
+
+        Args:
+            api (Api): api of the account
+            window (float): seconds to wait for more sub-requests
+            max_size (int): sub-requests after which a batch is sent at once
+        """
+        self.api = api
+        self.window = window
+        self.max_size = max_size
+        self.pending: list[tuple[dict, Future]] = []
+        self.callers = 0
+        self.lock = threading.Lock()
+        self.timer: threading.Timer | None = None
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, request: dict) -> Future:
+        """Add sub-request to the next batch.
+        Batches are retried on transient failures, so only sub-requests that
+        can be repeated safely may be added.
+
+        Args:
+            request (dict): sub-request with method, url and body
+
+        Returns:
+            Future: resolves to the response of the sub-request
+        """
+        return self.submit_all([request])[0]
+
+    def submit_all(self, reqs: list[dict]) -> list[Future]:
+        """Add sub-requests of one caller to the next batch.
+
+        Args:
+            reqs (list[dict]): sub-requests with method, url and body
+
+        Returns:
+            list[Future]: resolve to the responses of the sub-requests
+        """
+        futures: list[Future] = [Future() for _ in reqs]
+        if not futures:
+            return futures
+        futures[-1].add_done_callback(self.release)
+        with self.lock:
+            alone = self.callers == 0
+            self.callers += 1
+            self.pending.extend(zip(reqs, futures))
+            if alone or len(self.pending) >= self.max_size:
+                flush = True
+            else:
+                flush = False
+                if self.timer is None:
+                    self.timer = threading.Timer(self.window, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+        if flush:
+            self.flush()
+        return futures
+
+    def release(self, future: Future) -> None:
+        """Forget a caller once its last sub-request is answered.
+
+        Args:
+            future (Future): future of the last sub-request of the caller
+        """
+        with self.lock:
+            self.callers -= 1
+
+    def flush(self) -> None:
+        """Send all pending sub-requests as one batch."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not pending:
+                return
+            self.batches += 1
+            self.requests += len(pending)
+        reqs = [request for request, _ in pending]
+        log.info("Sending %s coalesced requests in one batch", len(reqs))
+        try:
+            response = self.api.send_batch_requests(
+                reqs, url=self.api.config.URL_BATCH, idempotent=True
+            )
+        except Exception as e:
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        responses = response.get("responses", [])
+        for i, (request, future) in enumerate(pending):
+            if i >= len(responses):
+                future.set_exception(
+                    RuntimeError(f"No batch response for {request['url']}")
+                )
+                continue
+            if responses[i].get("status", 200) >= 400:
+                log.warning(
+                    "Batch request to %s failed with status %s",
+                    request["url"],
+                    responses[i]["status"],
+                )
+            future.set_result(responses[i])
+
+    def send_batch_requests(
+        self, reqs: list[dict], url: str, idempotent: bool = False
+    ) -> dict:
+        """Send requests as batch, coalesced with other callers if possible.
+        Batches for other urls than the batch route and batches that cannot
+        be repeated are sent unchanged.
+
+        Args:
+            reqs (list[dict]): requests
+            url (str): url
+            idempotent (bool): all requests can be repeated safely
+
+        Returns:
+            dict: response with the responses of the given requests
+        """
+        if url != self.api.config.URL_BATCH or not idempotent:
+            return self.api.send_batch_requests(reqs, url=url, idempotent=idempotent)
+        futures = self.submit_all(reqs)
+        return {"responses": [future.result() for future in futures]}
+
+    def stats(self) -> dict[str, int]:
+        """Get coalescer statistics.
+
+        Returns:
+            dict[str, int]: number of batches and sub-requests sent
+        """
+        with self.lock:
+            return {"batches": self.batches, "requests": self.requests}
@@ -0,0 +1,135 @@
+"""Response cache"""
+
+from dataclasses import dataclass
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    """Cached response body with its validators"""
+
+    endpoint: str
+    content: bytes
+    expires: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def is_fresh(self) -> bool:
+        """Check if entry can be used without asking the server.
+
+        Returns:
+            bool: is fresh
+        """
+        return time.monotonic() < self.expires
+
+    def validators(self) -> dict[str, str]:
+        """Get headers for a conditional request.
+
+        Returns:
+            dict[str, str]: headers
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ResponseCache:
+    """Response cache class.
+    Caches GET response bodies keyed by url with a time to live per endpoint.
+    Expired entries with an ETag or Last-Modified header are revalidated
+    instead of fetched again.
+    """
+
+    def __init__(self, ttls: dict[str, float]):
+        """Create cache.
+
+        Args:
+            ttls (dict[str, float]): time to live in seconds per endpoint
+        """
+        self.ttls = ttls
+        self.entries: dict[str, CacheEntry] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def is_cacheable(self, endpoint: str | None) -> bool:
+        """Check if responses of endpoint are cached.
+
+        Args:
+            endpoint (str | None): endpoint
+
+        Returns:
+            bool: is cacheable
+        """
+        return endpoint is not None and endpoint in self.ttls
+
+    def get(self, url: str) -> CacheEntry | None:
+        """Get entry for url, fresh or not.
+
+        Args:
+            url (str): url
+
+        Returns:
+            CacheEntry | None: entry
+        """
+        with self.lock:
+            return self.entries.get(url)
+
+    def store(self, url: str, endpoint: str, content: bytes, headers: dict) -> None:
+        """Store response for url.
+
+        Args:
+            url (str): url
+            endpoint (str): endpoint
+            content (bytes): response body
+            headers (dict): response headers
+        """
+        entry = CacheEntry(
+            endpoint=endpoint,
+            content=content,
+            expires=time.monotonic() + self.ttls[endpoint],
+            etag=headers.get("ETag"),
+            last_modified=headers.get("Last-Modified"),
+        )
+        with self.lock:
+            self.entries[url] = entry
+
+    def refresh(self, entry: CacheEntry) -> None:
+        """Extend lifetime of a revalidated entry.
+
+        Args:
+            entry (CacheEntry): entry
+        """
+        entry.expires = time.monotonic() + self.ttls[entry.endpoint]
+
+    def invalidate(self, *endpoints: str) -> None:
+        """Drop all entries of the given endpoints.
+
+        Args:
+            endpoints (str): endpoints
+        """
+        with self.lock:
+            for url in [u for u, e in self.entries.items() if e.endpoint in endpoints]:
+                del self.entries[url]
+        log.debug("Invalidated cache for %s", endpoints)
+
+    def stats(self) -> dict[str, int]:
+        """Get cache statistics.
+
+        Returns:
+            dict[str, int]: hits, misses, revalidations and entries
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "entries": len(self.entries),
+        }
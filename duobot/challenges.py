@@ -1,19 +1,151 @@
 """Challenges"""
 
-from datetime import datetime, timezone
+from collections.abc import Callable
+from dataclasses import dataclass, field
 import logging
-import random
 import re
+import sys
+import time
 from typing import Any
 
+from duobot import metrics
+from duobot.models import PathLevel
+from duobot.timing import Timing, span
+
 log = logging.getLogger(__name__)
 
+RE_NON_WORD = re.compile(r"[^\w|\s]+")
+CHARACTER_KEEP_KEYS = ("correctAnimation", "idleAnimation", "incorrectAnimation")
+REMOVE_ROOT_KEYS = (
+    "compactTranslations",
+    "correctTokens",
+    "grader",
+    "isSpeakerUniversal",
+    "taggedKcIds",
+    "tts",
+    "weakWordPromptRanges",
+    "wrongTokens",
+)
+REMOVE_SESSION_KEYS = (
+    "adaptiveInterleavedChallenges",
+    "experiments_with_treatment_contexts",
+    "explanations",
+    "lessonIndex",
+    "mistakesReplacementChallenges",
+    "progressUpdates",
+    "sessionExperimentRecord",
+    "sessionStartExperiments",
+    "showBestTranslationInGradingRibbon",
+    "ttsAnnotations",
+)
+
+
+def solution_guess(challenges: "Challenges", challenge: dict) -> Any:
+    """Guess taken from the solution fields of the challenge."""
+    return challenges.get_challenge_guess(challenge)
+
+
+def no_guess(challenges: "Challenges", challenge: dict) -> None:
+    """No guess for challenges answered without one."""
+    return None
+
+
+def remove_blob_keys(challenge: dict) -> None:
+    """Remove keys of a challenge that are never sent back.
+
+    Args:
+        challenge (dict): challenge
+    """
+    for key in REMOVE_ROOT_KEYS:
+        if key in challenge:
+            del challenge[key]
+    if "pdf" in challenge.get("image", {}):
+        del challenge["image"]["pdf"]
+    if "choices" in challenge and isinstance(challenge["choices"], list):
+        for choice in challenge["choices"]:
+            if "image" in choice:
+                del choice["image"]
+
+
+def session_pairs_hook(pairs: list[tuple[str, Any]]) -> dict:
+    """Build session objects while decoding, dropping keys never sent back.
+    Every challenge has progressUpdates, the session root has challenges.
+    Dropped values are released right after their object is decoded
+    instead of living as long as the whole session.
+
+    Args:
+        pairs (list[tuple[str, Any]]): key value pairs of an object
+
+    Returns:
+        dict: object
+    """
+    obj = dict(pairs)
+    if "challenges" in obj:
+        for key in REMOVE_SESSION_KEYS:
+            obj.pop(key, None)
+    elif "progressUpdates" in obj and "type" in obj:
+        obj["type"] = sys.intern(obj["type"])
+        remove_blob_keys(obj)
+    return obj
+
+
+@dataclass(frozen=True)
+class ChallengeHandler:
+    """Type specific treatment of a challenge"""
+
+    # keys deleted from the challenge, they must be present
+    remove_keys: tuple[str, ...] = ()
+    # returns the guess sent as answer
+    guess: Callable[["Challenges", dict], Any] = solution_guess
+
+
+DEFAULT_HANDLER = ChallengeHandler()
+CHALLENGE_HANDLERS: dict[str, ChallengeHandler] = {}
+
+
+def register_challenge_handler(ctype: str, handler: ChallengeHandler) -> None:
+    """Register handler for a challenge type.
+
+    Args:
+        ctype (str): challenge type
+        handler (ChallengeHandler): handler
+    """
+    CHALLENGE_HANDLERS[ctype] = handler
+
+
+register_challenge_handler("assist", ChallengeHandler(("choices", "newWords")))
+register_challenge_handler("listenTap", ChallengeHandler(("newWords",)))
+register_challenge_handler("match", ChallengeHandler(("newWords",)))
+register_challenge_handler("tapComplete", ChallengeHandler(guess=no_guess))
+
+
+@dataclass
+class ChallengeCounts:
+    """Counters collected while walking the challenges of a session"""
+
+    types: dict[str, int] = field(default_factory=dict)
+    characters_shown: int = 0
+    characters: set[str] = field(default_factory=set)
+
+    def add(self, challenge: dict) -> None:
+        """Count challenge.
+
+        Args:
+            challenge (dict): challenge
+        """
+        ctype = challenge["type"]
+        self.types[ctype] = self.types.get(ctype, 0) + 1
+        if character := challenge.get("character"):
+            self.characters_shown += 1
+            if name := character.get("name"):
+                self.characters.add(name.upper())
+
 
 class Challenges:
     """Challenges class"""
 
-    def __init__(self):
-        pass
+    def __init__(self, timing: Timing | None = None):
+        self.timing = timing or Timing()
 
     def extract_answers_from_challenge(self, challenge: dict) -> tuple:
         """Extract correct and wrong answer from challenge.
@@ -76,12 +208,19 @@ class Challenges:
             session (dict): session
         """
         log.debug("Cleaning character")
-        keep = ["correctAnimation", "idleAnimation", "incorrectAnimation"]
         for challenge in session["challenges"]:
-            if challenge.get("character"):
-                for key in list(challenge["character"].keys()):
-                    if key not in keep:
-                        del challenge["character"][key]
+            self.clean_challenge_character(challenge)
+
+    def clean_challenge_character(self, challenge: dict) -> None:
+        """Clean character from challenge.
+
+        Args:
+            challenge (dict): challenge
+        """
+        if character := challenge.get("character"):
+            for key in list(character.keys()):
+                if key not in CHARACTER_KEEP_KEYS:
+                    del character[key]
 
     def get_correct_guess(self, session: dict) -> None:
         """Get correct guess.
@@ -93,24 +232,30 @@ class Challenges:
             session (dict): session
         """
         log.debug("Getting correct guess")
-        no_guess_types = ["tapComplete"]
         for challenge in session["challenges"]:
-            if challenge.get("type") in no_guess_types:
-                challenge["guess"] = None
-            elif (guess := challenge.get("correctIndex")) is not None:
-                challenge["guess"] = guess
-            elif (solution := challenge.get("correctSolutions")) is not None:
-                solution = self.parse_solution(solution[0])
-                challenge["guess"] = solution
-            elif (
-                solution := challenge.get("metadata")
-                .get("challenge_construction_insights", {})
-                .get("best_solution")
-            ) is not None:
-                solution = self.parse_solution(solution)
-                challenge["guess"] = solution
-            else:
-                challenge["guess"] = None
+            handler = CHALLENGE_HANDLERS.get(challenge.get("type"), DEFAULT_HANDLER)
+            challenge["guess"] = handler.guess(self, challenge)
+
+    def get_challenge_guess(self, challenge: dict) -> Any:
+        """Get correct guess of a challenge from its solution fields.
+
+        Args:
+            challenge (dict): challenge
+
+        Returns:
+            Any: guess
+        """
+        if (guess := challenge.get("correctIndex")) is not None:
+            return guess
+        if (solution := challenge.get("correctSolutions")) is not None:
+            return self.parse_solution(solution[0])
+        if (
+            solution := challenge.get("metadata")
+            .get("challenge_construction_insights", {})
+            .get("best_solution")
+        ) is not None:
+            return self.parse_solution(solution)
+        return None
 
     def parse_solution(self, solution: str) -> str:
         """Parse solution. Remove every non letter and non whitespace char
@@ -122,7 +267,7 @@ class Challenges:
         Returns:
             str: parsed solution
         """
-        return re.sub(r"[^\w|\s]+", "", solution) + " "
+        return RE_NON_WORD.sub("", solution) + " "
 
     def remove_unneeded_challenge_keys(self, session: dict) -> None:
         """Remove unneeded keys from session challenges.
@@ -131,31 +276,20 @@ class Challenges:
             session (dict): session
         """
         log.debug("Removing unneeded keys")
-        remove_root_key = [
-            "compactTranslations",
-            "correctTokens",
-            "grader",
-            "isSpeakerUniversal",
-            "taggedKcIds",
-            "tts",
-            "weakWordPromptRanges",
-            "wrongTokens",
-        ]
-        no_new_words = ["listenTap", "assist", "match"]
         for challenge in session["challenges"]:
-            for key in remove_root_key:
-                if key in challenge:
-                    del challenge[key]
-            if "pdf" in challenge.get("image", {}):
-                del challenge["image"]["pdf"]
-            if "choices" in challenge and isinstance(challenge["choices"], list):
-                for choice in challenge["choices"]:
-                    if "image" in choice:
-                        del choice["image"]
-            if challenge.get("type") == "assist":
-                del challenge["choices"]
-            if challenge.get("type") in no_new_words:
-                del challenge["newWords"]
+            handler = CHALLENGE_HANDLERS.get(challenge.get("type"), DEFAULT_HANDLER)
+            self.remove_unneeded_keys(challenge, handler)
+
+    def remove_unneeded_keys(self, challenge: dict, handler: ChallengeHandler) -> None:
+        """Remove unneeded keys from challenge.
+
+        Args:
+            challenge (dict): challenge
+            handler (ChallengeHandler): handler of the challenge type
+        """
+        remove_blob_keys(challenge)
+        for key in handler.remove_keys:
+            del challenge[key]
 
     def has_challenge_type(self, session: dict, ctype: str) -> bool:
         """Check if session has challenge type.
@@ -203,15 +337,34 @@ class Challenges:
                 num += 1
         return num
 
-    def create_tracking_properties(self, session: dict) -> dict:
+    def count_challenges(self, session: dict) -> ChallengeCounts:
+        """Count challenge types and shown characters of session.
+
+        Args:
+            session (dict): session
+
+        Returns:
+            ChallengeCounts: counts
+        """
+        counts = ChallengeCounts()
+        for challenge in session["challenges"]:
+            counts.add(challenge)
+        return counts
+
+    def create_tracking_properties(
+        self, session: dict, counts: ChallengeCounts | None = None
+    ) -> dict:
         """Create tracking properties for session.
 
         Args:
             session (dict): session
+            counts (ChallengeCounts | None): counts, computed from session if None
 
         Returns:
             dict: tracking properties
         """
+        if counts is None:
+            counts = self.count_challenges(session)
         # it seems that the variables are missing if no such challenge was posed
         properties: dict[str, Any] = {}
         properties["contained_adaptive_challenge"] = False
@@ -226,9 +379,9 @@ class Challenges:
             properties["contained_adaptive_challenge"] = True
         if session["trackingProperties"].get("num_challenges_gt_listen_tap", 0) > 0:
             properties["contained_listen_challenge"] = True
-        if self.has_challenge_type(session, "listenSpeak"):
+        if counts.types.get("listenSpeak"):
             properties["contained_listen_speak_challenge"] = True
-        if self.has_challenge_type(session, "speak"):
+        if counts.types.get("speak"):
             properties["contained_speak_challenge"] = True
 
         properties["disabled_listen_challenges"] = False
@@ -236,45 +389,49 @@ class Challenges:
         properties["disabled_speak_challenges"] = False
         properties["is_zombie_mode"] = False
         properties["num_adaptive_challenges"] = 0
-        properties["num_characters_shown"] = self.get_num_characters_shown(session)
+        properties["num_characters_shown"] = counts.characters_shown
         properties["num_explanation_opens"] = 0
         properties["num_mistakes_completed"] = 0
         properties["num_mistakes_generated"] = 0
         properties["num_times_transliteration_toggled"] = 0
         properties["offlined_session"] = False
-        properties["speak_count"] = self.count_challenge_type(session, "speak")
+        properties["speak_count"] = counts.types.get("speak", 0)
         properties["speak_ineligible"] = False
         properties["sum_hints_used"] = 0
         properties["transliteration_setting"] = "null"
         return properties
 
-    def create_session_solution_response(self, session: dict, skill: dict) -> dict:
+    @metrics.SOLUTION_SECONDS.time()
+    def create_session_solution_response(self, session: dict, skill: PathLevel) -> dict:
         """Create session solution response.
 
         Args:
             session (dict): session
-            skill (dict): skill infos
+            skill (PathLevel): level of the session
 
         Returns:
             dict: response
         """
-        ts_start = int(datetime.now(tz=timezone.utc).timestamp())
-        total_time = 0
+        start_ms = time.time_ns() // 1_000_000
+        cutoff = session.get("challengeTimeTakenCutoff")
+        total_ms = 0
+        counts = ChallengeCounts()
         log.info("Creating final responses.")
 
         for challenge in session["challenges"]:
+            handler = CHALLENGE_HANDLERS.get(challenge.get("type"), DEFAULT_HANDLER)
             challenge.pop("progressUpdates")
             challenge["correct"] = True
             challenge["numHintsTapped"] = 0
             challenge["wasIndicatorShown"] = False
-            challenge["timeTaken"] = (time_taken := random.randint(800, 1500))
+            challenge["timeTaken"] = self.timing.challenge_ms(challenge, cutoff)
             challenge["highlights"] = []
-            total_time += int(time_taken / 1000)
-        ts_end = ts_start + total_time
-
-        self.clean_character(session)
-        self.remove_unneeded_challenge_keys(session)
-        self.get_correct_guess(session)
+            total_ms += challenge["timeTaken"]
+            self.clean_challenge_character(challenge)
+            self.remove_unneeded_keys(challenge, handler)
+            challenge["guess"] = handler.guess(self, challenge)
+            counts.add(challenge)
+        ts_start, ts_end = span(total_ms, start_ms)
 
         missing_keys = {
             "askPriorProficiency": False,
@@ -292,27 +449,15 @@ class Challenges:
             "learnerSpeechStoreSessionInfo": [],
             "maxInLessonStreak": 15,
             "offline": False,
-            "pathLevelId": skill["id"],
-            "pathLevelSpecifics": skill["pathLevelMetadata"],
+            "pathLevelId": skill.id,
+            "pathLevelSpecifics": skill.metadata,
             "shouldLearnThings": True,
             "startTime": ts_start,
         }
-        obsolete = [
-            "adaptiveInterleavedChallenges",
-            "experiments_with_treatment_contexts",
-            "explanations",
-            "lessonIndex",
-            "mistakesReplacementChallenges",
-            "progressUpdates",
-            "sessionExperimentRecord",
-            "sessionStartExperiments",
-            "showBestTranslationInGradingRibbon",
-            "ttsAnnotations",
-        ]
-        for key in obsolete:
+        for key in REMOVE_SESSION_KEYS:
             if key in session:
                 session.pop(key)
         session.update(missing_keys)
-        missing_tracking_properties = self.create_tracking_properties(session)
+        missing_tracking_properties = self.create_tracking_properties(session, counts)
         session["trackingProperties"].update(missing_tracking_properties)
         return session
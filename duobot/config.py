@@ -1,60 +1,164 @@
 """Configuration"""
 
+import functools
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
-import dotenv
 
-dotenv.load_dotenv()
+@functools.cache
+def load_env() -> None:
+    """Load .env file into the environment, once and only when needed."""
+    import dotenv
+
+    dotenv.load_dotenv()
+
+
+def getenv(name: str) -> str | None:
+    """Get environment variable, considering the .env file.
+
+    Args:
+        name (str): variable name
+
+    Returns:
+        str | None: value
+    """
+    load_env()
+    return os.environ.get(name)
 
 
 @dataclass
 class Config:
-    """Config class"""
-
-    USER_ID = os.environ.get("DUO_USERID")
-    AUTH = os.environ.get("DUO_AUTH")  # 'Bearer eyJ123xyz'
+    """Config class.
+    Account specific headers and urls are derived from USER_ID and AUTH
+    on instantiation, so every account gets its own Config instance.
+    """
 
-    if USER_ID is None or AUTH is None:
-        raise RuntimeError("Please set DUO_USERID and DUO_AUTH environment variables")
+    USER_ID: str | None = field(default_factory=lambda: getenv("DUO_USERID"))
+    AUTH: str | None = field(  # 'Bearer eyJ123xyz'
+        default_factory=lambda: getenv("DUO_AUTH"), repr=False
+    )
+    BASE_HOST: str = "https://android-api-cf.duolingo.com"
+    STORIES_HOST: str = "https://stories.duolingo.com"
+    GOALS_HOST: str = "https://goals-api.duolingo.com"
 
     USER_AGENT = (
         "Duodroid/5.84.3 Dalvik/2.1.0 (Linux; U; Android 13;"
         "sdk_gphone_x86_64 Build/TE1A.220922.034)"
     )
-    HEADERS = {
-        "User-Agent": USER_AGENT,
-        "X-Amzn-Trace-Id": f"User={USER_ID}",
-        "Authorization": AUTH,
-    }
 
     API_TIMEOUT = 10
-    BASE_HOST = "https://android-api-cf.duolingo.com"
+    RETRY_ATTEMPTS = 4  # attempts per request including the first one
+    RETRY_BACKOFF = 0.5  # seconds, doubled with every attempt
+    RETRY_BACKOFF_MAX = 30  # seconds, also caps Retry-After
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    BREAKER_THRESHOLD = 5  # consecutive failures of a host opening its circuit
+    BREAKER_RESET = 30  # seconds to fail fast before probing the host again
+    BREAKER_MAX_OUTAGE = 900  # seconds of pauses for open circuits before giving up
+    POOL_CONNECTIONS = 4  # number of hosts to keep a connection pool for
+    POOL_MAXSIZE = 10  # number of keep-alive connections per host
+    BATCH_WINDOW = 0.05  # seconds to collect sub-requests before sending a batch
+    BATCH_MAX_SIZE = 20  # max number of sub-requests per batch
+    STORY_CACHE_PATH = os.path.join(  # story summaries shared by all accounts
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+        "duobot",
+        "stories.sqlite3",
+    )
+    STORY_CACHE_SIZE = 5000  # number of stories to keep
+    JOURNAL_DIR = os.path.join(  # progress journal per account
+        os.environ.get("XDG_STATE_HOME", os.path.expanduser("~/.local/state")),
+        "duobot",
+    )
+    JOURNAL_FSYNC_INTERVAL = 1.0  # max seconds between fsyncs of journal records
+    JOURNAL_COMPACT_RECORDS = 500  # journal records before finished lessons are dropped
+    JOURNAL_REUSE_TTL = 1800  # seconds a journaled solution can still be sent
+    CHEST_BULK = True  # open consecutive path chests with one batch request
+    PROGRESS_FLUSH_LESSONS = 5  # lessons summed into one goals progress update
+    PROGRESS_FLUSH_INTERVAL = 300  # max seconds goals progress is held back
+    PROGRESS_CHARACTERS = (  # characters with goals progress metrics
+        "BEA",
+        "OSCAR",
+        "FALSTAFF",
+        "EDDY",
+        "LUCY",
+        "LILY",
+        "JUNIOR",
+        "LIN",
+    )
+    LEAN_RESPONSES = True  # drop unused keys of sessions and stories while decoding
+    COMPRESS_RESPONSES = True  # accept gzip and deflate, br and zstd if installed
+    COMPRESS_REQUESTS = False  # gzip batch request bodies
+    COMPRESSION_HOSTS = {}  # per host (responses, requests) switches, e.g.
+    # {"www.duolingo.com": (True, True)}, other hosts use the defaults above
+    COMPRESS_MIN_BYTES = 1024  # smaller request bodies are sent as is
+    COMPRESS_LEVEL = 6
+    CACHE_TTLS = {  # seconds to reuse GET responses per endpoint
+        "status": 300,
+        "course": 300,
+        "rewards": 300,
+    }
+    PLANNER_PRIORS = {  # expected xp and seconds per lesson type until observed
+        "skill": (10, 25.0),
+        "practice": (10, 25.0),
+        "unit_review": (10, 25.0),
+        "story": (14, 10.0),
+        "chest": (0, 3.0),
+    }
+    DAEMON_HOST = "127.0.0.1"  # interface of the daemon control api
+    DAEMON_PORT = 8765
+    DAEMON_JOB_HISTORY = 200  # finished jobs to keep for the status endpoint
+    METRICS_HOST = "127.0.0.1"  # interface of the metrics http exporter
+    METRICS_INTERVAL = 15  # seconds between metrics textfile writes
+    PROFILE_INTERVAL = 0.005  # seconds between stack samples of --profile
+    PROFILE_TOP = 10  # allocations listed per lesson by --profile
     BASE_VERSION = "/2017-06-30/"
-    BASE_URL = f"{BASE_HOST}{BASE_VERSION}"
 
     DELAY_BETWEEN_ANSWERS = 6000  # in ms
+    DELAY_BETWEEN_LESSONS = 0  # in s, lesson timings already keep lessons apart
+    CHALLENGE_MIN_MS = {  # shortest plausible time taken per challenge type
+        "assist": 450,
+        "select": 450,
+        "judge": 450,
+        "form": 450,
+        "characterSelect": 450,
+        "tapComplete": 550,
+        "translate": 750,
+        "listenTap": 750,
+        "name": 750,
+        "completeReverseTranslation": 750,
+        "partialReverseTranslate": 750,
+        "listen": 800,
+        "speak": 800,
+        "listenSpeak": 900,
+        "match": 900,
+        "listenMatch": 1000,
+    }
+    CHALLENGE_MIN_MS_DEFAULT = 600  # for challenge types not listed above
+    CHALLENGE_MS_PER_WORD = 10  # reading time added per word of the prompt
+    STORY_MIN_MS = 3000  # shortest plausible time for a story
+    STORY_MS_PER_CHALLENGE = 100  # added per question of a story
+    TIMING_DISTRIBUTION = "exponential"  # fixed, uniform or exponential
+    TIMING_SPREAD = 0.05  # mean share added to the shortest times
 
     # POST
-    URL_LOGIN = f"{BASE_URL}login?fields=id"
-    URL_SESSIONS = (
-        f"{BASE_URL}sessions?fields=askPriorProficiency%2Cbeginner%2CchallengeTimeTakenCutoff"
+    SESSIONS_FIELDS = (
+        "askPriorProficiency%2Cbeginner%2CchallengeTimeTakenCutoff"
         "%2CcheckpointIndex%2Cexplanation%7Btitle%2Curl%2Cintro%7D%2CfromLanguage%2ChardModeLevelIndex"
         "%2Cid%2CisV2%2ClearningLanguage%2ClevelIndex%2ClevelSessionIndex%2Cmetadata%2CskillId%2C"
         "trackingProperties%2Ctype%2Cchallenges%2CadaptiveChallenges%2CadaptiveInterleavedChallenges"
         "%7Bchallenges%2CspeakOrListenReplacementIndices%7D%2CsessionStartExperiments%2CspeechConfig"
         "%7BauthorizationToken%2Cregion%2CvalidDuration%7D%2CttsAnnotations"
     )
-    URL_BATCH = f"{BASE_URL}batch?fields=responses%7Bbody%2Cstatus%2Cheaders%7D"
-    URL_BATCH_STORY = (
-        f"{BASE_URL}batch-story-complete?fields=responses%7Bbody%2Cstatus%2Cheaders%7D"
-    )
-    URL_PROGRESS = f"https://goals-api.duolingo.com/users/{USER_ID}/progress/batch"
+    BATCH_FIELDS = "responses%7Bbody%2Cstatus%2Cheaders%7D"
     # GET
-    BASE_USER_URL = f"{BASE_URL}users/{USER_ID}"
-    URL_COURSE = (
-        f"{BASE_USER_URL}/courses/"
-        "{course_id}?fields=authorId%2CfromLanguage"
+    STATUS_FIELDS = "totalXp%2CcurrentCourseId%2Cstreak%2Ctimezone"
+    COURSE_FIELDS = [
+        "id",
+        "path",
+        "fromLanguage",
+        "learningLanguage",
+    ]  # fields duobot reads
+    URL_COURSE_FIELDS = (
+        "authorId%2CfromLanguage"
         "%2Cid%2ChealthEnabled%2ClearningLanguage%2Cxp%2Ccrowns%2CcheckpointTests%2ClessonsDone"
         "%2CplacementTestAvailable%2CpracticesDone%2CprogressQuizHistory%7BstartTime%2CendTime"
         "%2Cscore%7D%2CtrackingProperties%2Csections%7Bname%2CnumRows%2CcheckpointAccessible"
@@ -65,24 +169,18 @@ class Config:
         "%7D%2CsmartTips%7BsmartTipId%2Curl%7D%2CfinalCheckpointSession%2Cstatus%2Cpath"
         "%2CwordsLearned%2CpathDetails%7Bnotifications%7Bid%7D%7D"
     )
-    URL_STATUS = f"{BASE_USER_URL}?fields=totalXp%2CcurrentCourseId%2Cstreak%2Ctimezone"
-    URL_REWARDS = f"{BASE_USER_URL}?fields=rewardBundles"
-    URL_STORY = (
-        "https://stories.duolingo.com/api2/stories/{story_id}?illustrationFormat=svg&"
+    STORY_QUERY = (
+        "illustrationFormat=svg&"
         "supportedElements=HEADER%2CLINE%2CCHALLENGE_PROMPT%2CSELECT_PHRASE%2CMULTIPLE_CHOICE%2C"
         "POINT_TO_PHRASE%2CARRANGE%2CMATCH%2CHINT_ONBOARDING%2CFREEFORM_WRITING%2C"
         "FREEFORM_WRITING_EXAMPLE_RESPONSE%2CFREEFORM_WRITING_PROMPT&masterVersion=false&"
         "debugSkipFinalMatchChallenge=false"
     )
-    # PATCH
-    URL_CHEST = f"{BASE_USER_URL}" + "/rewards/{chest_id}?fields="
-
     # Batch urls
     BATCH_URL_STORY_COMPLETE = "/api2/stories/{story_id}/complete"
     BATCH_URL_SESSION_COMPLETE = (
         BASE_VERSION + "sessions/{session_id}?fields=trackingProperties"
     )
-    BATCH_URL_STATUS = f"{BASE_VERSION}users/{USER_ID}"
 
     STORY_PAYLOAD = {
         "awardXp": True,
@@ -169,3 +267,53 @@ class Config:
         "zhTw": False,
         "isResurrectedShorterLesson": False,
     }
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        """Create config of the account given by DUO_USERID and DUO_AUTH.
+
+        Returns:
+            Config: config
+        """
+        return cls(USER_ID=getenv("DUO_USERID"), AUTH=getenv("DUO_AUTH"))
+
+    def __post_init__(self):
+        if self.USER_ID is None or self.AUTH is None:
+            raise RuntimeError(
+                "Please set DUO_USERID and DUO_AUTH environment variables"
+            )
+
+        self.HEADERS = {
+            "User-Agent": self.USER_AGENT,
+            "X-Amzn-Trace-Id": f"User={self.USER_ID}",
+            "Authorization": self.AUTH,
+        }
+
+        self.BASE_URL = f"{self.BASE_HOST}{self.BASE_VERSION}"
+        # POST
+        self.URL_LOGIN = f"{self.BASE_URL}login?fields=id"
+        self.URL_SESSIONS = f"{self.BASE_URL}sessions?fields={self.SESSIONS_FIELDS}"
+        self.URL_BATCH = f"{self.BASE_URL}batch?fields={self.BATCH_FIELDS}"
+        self.URL_BATCH_STORY = (
+            f"{self.BASE_URL}batch-story-complete?fields={self.BATCH_FIELDS}"
+        )
+        self.URL_PROGRESS = f"{self.GOALS_HOST}/users/{self.USER_ID}/progress/batch"
+        # GET
+        self.URL_STORY = (
+            f"{self.STORIES_HOST}/api2/stories/" + "{story_id}?" + self.STORY_QUERY
+        )
+        self.BASE_USER_URL = f"{self.BASE_URL}users/{self.USER_ID}"
+        self.URL_COURSE_BASE = f"{self.BASE_USER_URL}/courses/" + "{course_id}?fields="
+        self.URL_COURSE = self.URL_COURSE_BASE + self.URL_COURSE_FIELDS
+        self.URL_STATUS = f"{self.BASE_USER_URL}?fields={self.STATUS_FIELDS}"
+        self.URL_REWARDS = f"{self.BASE_USER_URL}?fields=rewardBundles"
+        # PATCH
+        self.URL_CHEST = f"{self.BASE_USER_URL}" + "/rewards/{chest_id}?fields="
+        # Batch urls
+        self.BATCH_URL_STATUS = f"{self.BASE_VERSION}users/{self.USER_ID}"
+        self.BATCH_URL_USER_STATUS = (
+            f"{self.BATCH_URL_STATUS}?fields={self.STATUS_FIELDS}"
+        )
+        self.BATCH_URL_CHEST = (
+            f"{self.BATCH_URL_STATUS}" + "/rewards/{chest_id}?fields="
+        )
@@ -0,0 +1,377 @@
+"""Daemon"""
+
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import itertools
+import logging
+import re
+import threading
+import time
+from typing import Any
+
+from duobot import jsonlib, metrics
+from duobot.api import Api
+from duobot.batching import BatchCoalescer
+from duobot.config import Config
+from duobot.fleet import Account
+from duobot.journal import open_journal
+from duobot.pipeline import Pipeline
+from duobot.progress import open_progress
+from duobot.resilience import CircuitOpenError, Outage
+from duobot.sessions import Sessions
+from duobot.storycache import StoryCache
+
+log = logging.getLogger(__name__)
+
+DAEMON_HOST = Config.DAEMON_HOST
+DAEMON_JOB_HISTORY = Config.DAEMON_JOB_HISTORY
+STREAK_LESSONS = 1
+
+
+@dataclass
+class Job:
+    """Lessons to solve for one account"""
+
+    id: int
+    account: str
+    lessons: int
+    priority: int = 0
+    state: str = "queued"  # queued, running, done or failed
+    lessons_done: int = 0
+    error: str | None = None
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+
+
+class Daemon:
+    """Daemon class.
+    Keeps the api, caches and connection pools of every account warm and
+    runs jobs from a priority queue on a bounded number of workers. Jobs
+    of the same account never run at the same time. Cached status, course
+    and rewards are dropped when a job starts.
+    """
+
+    def __init__(self, accounts: list[Account], workers: int, pipeline: bool = False):
+        """Create daemon and start its workers.
+
+        Args:
+            accounts (list[Account]): accounts jobs can be submitted for
+            workers (int): number of jobs to run concurrently
+            pipeline (bool): prefetch the next lesson while waiting
+        """
+        self.accounts = {account.name: account for account in accounts}
+        self.pipeline = pipeline
+        self.sessions: dict[str, Sessions] = {}
+        self.stories = StoryCache()
+        self.jobs: dict[int, Job] = {}
+        self.queue: list[Job] = []
+        self.busy: set[str] = set()
+        self.ids = itertools.count(1)
+        self.cond = threading.Condition()
+        self.draining = False
+        self.started = time.time()
+        self.workers = [
+            threading.Thread(target=self.work, name=f"worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def session(self, name: str) -> Sessions:
+        """Get warm session of an account, created on first use.
+
+        Args:
+            name (str): account name
+
+        Returns:
+            Sessions: session
+        """
+        if (session := self.sessions.get(name)) is None:
+            account = self.accounts[name]
+            api = Api(Config(USER_ID=account.user_id, AUTH=account.auth))
+            session = Sessions(
+                api,
+                BatchCoalescer(api),
+                self.stories,
+                journal=open_journal(account.user_id),
+                progress=open_progress(api),
+            )
+            self.sessions[name] = session
+        return session
+
+    def submit(self, account: str, lessons: int, priority: int = 0) -> Job:
+        """Queue job.
+
+        Args:
+            account (str): account name
+            lessons (int): number of lessons
+            priority (int): jobs with higher priority run first
+
+        Returns:
+            Job: queued job
+        """
+        if account not in self.accounts:
+            raise KeyError(f"Unknown account {account}")
+        if lessons < 1:
+            raise ValueError("Number of lessons must be positive")
+        with self.cond:
+            if self.draining:
+                raise RuntimeError("Daemon is draining")
+            job = Job(next(self.ids), account, lessons, priority)
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            self.queue.sort(key=lambda j: (-j.priority, j.id))
+            self.cond.notify_all()
+        log.info("Queued job %s: %s lessons for %s", job.id, lessons, account)
+        return job
+
+    def submit_streak(self, priority: int = 0) -> list[Job]:
+        """Queue a lesson for every account to keep their streaks.
+
+        Args:
+            priority (int): jobs with higher priority run first
+
+        Returns:
+            list[Job]: queued jobs
+        """
+        return [self.submit(name, STREAK_LESSONS, priority) for name in self.accounts]
+
+    def next_job(self) -> Job | None:
+        """Wait for the first queued job of an idle account.
+
+        Returns:
+            Job | None: job or None once drained
+        """
+        with self.cond:
+            while True:
+                for job in self.queue:
+                    if job.account not in self.busy:
+                        self.queue.remove(job)
+                        self.busy.add(job.account)
+                        job.state = "running"
+                        job.started = time.time()
+                        return job
+                if self.draining and not self.queue:
+                    return None
+                self.cond.wait()
+
+    def work(self) -> None:
+        """Worker loop."""
+        while (job := self.next_job()) is not None:
+            try:
+                self.run_job(job)
+                job.state = "done"
+            except Exception as e:
+                log.exception("Job %s failed", job.id)
+                job.state = "failed"
+                job.error = f"{type(e).__name__}: {e}"
+            job.finished = time.time()
+            with self.cond:
+                self.busy.discard(job.account)
+                self.prune()
+                self.cond.notify_all()
+
+    def run_job(self, job: Job) -> None:
+        """Solve the lessons of a job.
+
+        Args:
+            job (Job): job
+        """
+        session = self.session(job.account)
+        runner = Pipeline(session) if self.pipeline else session
+        outage = Outage()
+        # the account may have been used elsewhere since its last job
+        session.api.cache.invalidate("status", "course", "rewards")
+        try:
+            session.resume()
+            while job.lessons_done < job.lessons:
+                log.info(
+                    "Job %s: lesson %s of %s", job.id, job.lessons_done + 1, job.lessons
+                )
+                try:
+                    runner.solve_next_lesson()
+                except CircuitOpenError as e:
+                    outage.pause(e)
+                    continue
+                outage.reset()
+                job.lessons_done += 1
+                time.sleep(session.config.DELAY_BETWEEN_LESSONS)
+        finally:
+            if isinstance(runner, Pipeline):
+                runner.close()
+
+    def prune(self) -> None:
+        """Forget the oldest finished jobs beyond the history size."""
+        finished = [j for j in self.jobs.values() if j.finished is not None]
+        for job in finished[: max(0, len(finished) - DAEMON_JOB_HISTORY)]:
+            del self.jobs[job.id]
+
+    def drain(self) -> None:
+        """Stop accepting jobs and let the workers finish the queued ones."""
+        with self.cond:
+            self.draining = True
+            self.cond.notify_all()
+        log.info("Draining, %s jobs queued", len(self.queue))
+
+    def wait(self) -> None:
+        """Wait until drained and release all resources."""
+        for worker in self.workers:
+            worker.join()
+        self.stories.close()
+        for session in self.sessions.values():
+            session.progress.close()
+            if session.journal is not None:
+                session.journal.close()
+            session.api.close()
+        log.info("Drained")
+
+    def status(self) -> dict[str, Any]:
+        """Get queue and job status.
+
+        Returns:
+            dict[str, Any]: status
+        """
+        with self.cond:
+            jobs = [asdict(job) for job in self.jobs.values()]
+            queued = len(self.queue)
+            running = len(self.busy)
+        return {
+            "draining": self.draining,
+            "queued": queued,
+            "running": running,
+            "workers": len(self.workers),
+            "jobs": jobs,
+            "stories": self.stories.stats(),
+        }
+
+    def health(self) -> dict[str, Any]:
+        """Get health of the daemon and the circuits of all warm accounts.
+
+        Returns:
+            dict[str, Any]: health
+        """
+        circuits = {}
+        for session in list(self.sessions.values()):
+            for host, breaker in session.api.breakers.items():
+                if circuits.get(host, "closed") == "closed":
+                    circuits[host] = breaker.state
+        workers = sum(worker.is_alive() for worker in self.workers)
+        return {
+            "status": "draining" if self.draining else "ok",
+            "uptime": round(time.time() - self.started),
+            "workers_alive": workers,
+            "circuits": circuits,
+        }
+
+
+class DaemonHandler(BaseHTTPRequestHandler):
+    """Handler of the daemon control api"""
+
+    server: "DaemonServer"
+
+    def reply(self, status: int, payload: Any) -> None:
+        """Send JSON response.
+
+        Args:
+            status (int): http status
+            payload (Any): body
+        """
+        body = jsonlib.dumps_bytes(payload)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self) -> dict:
+        """Read JSON request body.
+
+        Returns:
+            dict: body, empty if missing
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        return jsonlib.loads(self.rfile.read(length)) if length else {}
+
+    def do_GET(self) -> None:
+        daemon = self.server.daemon
+        if self.path == "/health":
+            self.reply(200, daemon.health())
+        elif self.path == "/status":
+            self.reply(200, daemon.status())
+        elif m := re.fullmatch(r"/jobs/(\d+)", self.path):
+            if (job := daemon.jobs.get(int(m.group(1)))) is None:
+                self.reply(404, {"error": "Unknown job"})
+            else:
+                self.reply(200, asdict(job))
+        elif self.path == "/metrics":
+            body = metrics.REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", metrics.CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.reply(404, {"error": "Not found"})
+
+    def do_POST(self) -> None:
+        daemon = self.server.daemon
+        try:
+            body = self.read_body()
+            if self.path == "/jobs":
+                job = daemon.submit(
+                    body["account"], int(body["lessons"]), int(body.get("priority", 0))
+                )
+                self.reply(202, asdict(job))
+            elif self.path == "/streak":
+                jobs = daemon.submit_streak(int(body.get("priority", 0)))
+                self.reply(202, [asdict(job) for job in jobs])
+            elif self.path == "/drain":
+                daemon.drain()
+                self.reply(202, daemon.status())
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else:
+                self.reply(404, {"error": "Not found"})
+        except RuntimeError as e:
+            self.reply(503, {"error": str(e)})
+        except (KeyError, ValueError, TypeError) as e:
+            self.reply(400, {"error": f"Invalid job: {e}"})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.debug(format, *args)
+
+
+class DaemonServer(ThreadingHTTPServer):
+    """Localhost http server of the daemon control api"""
+
+    daemon_threads = True
+
+    def __init__(self, daemon: Daemon, port: int, host: str = DAEMON_HOST):
+        """Bind control api.
+
+        Args:
+            daemon (Daemon): daemon
+            port (int): port, 0 for any free port
+            host (str): interface to listen on
+        """
+        super().__init__((host, port), DaemonHandler)
+        self.daemon = daemon
+
+
+def serve(daemon: Daemon, port: int) -> None:
+    """Serve control api until drained.
+
+    Args:
+        daemon (Daemon): daemon
+        port (int): port
+    """
+    server = DaemonServer(daemon, port)
+    log.info("Serving on http://%s:%s", *server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.info("Interrupted, draining")
+        daemon.drain()
+    finally:
+        server.server_close()
+        daemon.wait()
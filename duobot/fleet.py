@@ -0,0 +1,182 @@
+"""Fleet"""
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+import logging
+import sys
+import threading
+import time
+
+from duobot.api import Api
+from duobot.batching import BatchCoalescer
+from duobot.config import Config
+from duobot.journal import open_journal
+from duobot.pipeline import Pipeline
+from duobot.progress import open_progress
+from duobot.resilience import CircuitOpenError, Outage
+from duobot.sessions import Sessions
+from duobot.storycache import StoryCache
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Account:
+    """Account of a fleet"""
+
+    name: str
+    user_id: str
+    auth: str = field(repr=False)
+    lessons: int = 1
+
+
+@dataclass
+class FleetResult:
+    """Result of running one account"""
+
+    account: str
+    lessons: int
+    lessons_done: int = 0
+    duration: float = 0.0
+    error: str | None = None
+
+
+def load_accounts(path: str, lessons: int | None = None) -> list[Account]:
+    """Load accounts from toml file.
+    Every account is an [[accounts]] table with name, user_id, auth and
+    optionally lessons.
+
+    Args:
+        path (str): path of toml file
+        lessons (int | None): lessons for accounts without own setting
+
+    Returns:
+        list[Account]: accounts
+    """
+    with open(path, "rb") as f:
+        data = tomllib.load(f)
+    accounts = []
+    for i, entry in enumerate(data.get("accounts", [])):
+        if "user_id" not in entry or "auth" not in entry:
+            raise RuntimeError(f"Account {i} in {path} needs user_id and auth")
+        num = entry.get("lessons", lessons)
+        if num is None:
+            raise RuntimeError(f"Account {i} in {path} has no number of lessons")
+        accounts.append(
+            Account(
+                name=entry.get("name", str(entry["user_id"])),
+                user_id=str(entry["user_id"]),
+                auth=entry["auth"],
+                lessons=num,
+            )
+        )
+    if not accounts:
+        raise RuntimeError(f"No accounts found in {path}")
+    return accounts
+
+
+def run_account(
+    account: Account,
+    pipeline: bool = False,
+    stories: StoryCache | None = None,
+) -> FleetResult:
+    """Solve all lessons of one account. Failures are kept in the result.
+
+    Args:
+        account (Account): account
+        pipeline (bool): prefetch the next lesson while waiting
+        stories (StoryCache | None): story cache shared by accounts
+
+    Returns:
+        FleetResult: result
+    """
+    threading.current_thread().name = account.name
+    result = FleetResult(account=account.name, lessons=account.lessons)
+    ts_start = time.monotonic()
+    api = Api(Config(USER_ID=account.user_id, AUTH=account.auth))
+    session = Sessions(
+        api,
+        BatchCoalescer(api),
+        stories,
+        journal=open_journal(account.user_id),
+        progress=open_progress(api),
+    )
+    runner = Pipeline(session) if pipeline else session
+    outage = Outage()
+    try:
+        session.resume()
+        while result.lessons_done < account.lessons:
+            log.info("Lesson %s of %s", result.lessons_done + 1, account.lessons)
+            try:
+                runner.solve_next_lesson()
+            except CircuitOpenError as e:
+                outage.pause(e)
+                continue
+            outage.reset()
+            result.lessons_done += 1
+            time.sleep(session.config.DELAY_BETWEEN_LESSONS)
+    except Exception as e:
+        log.exception("Account %s failed", account.name)
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        if isinstance(runner, Pipeline):
+            runner.close()
+        session.progress.close()
+        session.journal.close()
+        api.close()
+    result.duration = time.monotonic() - ts_start
+    return result
+
+
+def run_fleet(
+    accounts: list[Account], workers: int, pipeline: bool = False
+) -> list[FleetResult]:
+    """Run accounts in a bounded worker pool.
+
+    Args:
+        accounts (list[Account]): accounts
+        workers (int): number of accounts to run concurrently
+        pipeline (bool): prefetch the next lesson while waiting
+
+    Returns:
+        list[FleetResult]: results in order of accounts
+    """
+    log.info("Running %s accounts with %s workers", len(accounts), workers)
+    stories = StoryCache()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            run = partial(run_account, pipeline=pipeline, stories=stories)
+            return list(pool.map(run, accounts))
+    finally:
+        stories.close()
+        log.info("Story cache stats: %s", stories.stats())
+
+
+def log_summary(results: list[FleetResult]) -> None:
+    """Log summary of fleet results.
+
+    Args:
+        results (list[FleetResult]): results
+    """
+    failed = [r for r in results if r.error]
+    log.info(
+        "Fleet finished: %s of %s accounts succeeded, %s lessons solved",
+        len(results) - len(failed),
+        len(results),
+        sum(r.lessons_done for r in results),
+    )
+    for r in results:
+        log.info(
+            "%s: %s/%s lessons in %.0fs%s",
+            r.account,
+            r.lessons_done,
+            r.lessons,
+            r.duration,
+            f" - failed: {r.error}" if r.error else "",
+        )
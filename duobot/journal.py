@@ -0,0 +1,215 @@
+"""Progress journal"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any, BinaryIO
+
+from duobot import jsonlib
+from duobot.config import Config
+
+log = logging.getLogger(__name__)
+
+JOURNAL_DIR = Config.JOURNAL_DIR
+JOURNAL_FSYNC_INTERVAL = Config.JOURNAL_FSYNC_INTERVAL
+JOURNAL_COMPACT_RECORDS = Config.JOURNAL_COMPACT_RECORDS
+JOURNAL_REUSE_TTL = Config.JOURNAL_REUSE_TTL
+
+# phases of a lesson in the order they are reached
+PLANNED = "planned"
+FETCHED = "fetched"
+SOLVED = "solved"
+SENT = "sent"
+ACKED = "acked"
+PROGRESS = "progress"
+DONE = "done"
+
+
+class Journal:
+    """Journal class.
+    Append-only log of the phases every lesson went through, so a run that
+    died can be resumed. Each record is written through to the file right
+    away, which survives the process being killed. Records are fsynced in
+    batches at most JOURNAL_FSYNC_INTERVAL apart, records passed with sync
+    immediately. A torn last line is skipped when the journal is read.
+    Finished lessons are dropped when the journal is compacted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fsync_interval: float = JOURNAL_FSYNC_INTERVAL,
+        compact_records: int = JOURNAL_COMPACT_RECORDS,
+    ):
+        """Open journal, replay it and compact it.
+
+        Args:
+            path (str): journal file
+            fsync_interval (float): max seconds between fsyncs
+            compact_records (int): records appended before compacting again
+        """
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.compact_records = compact_records
+        self.lock = threading.Lock()
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.records = 0
+        self.ts_fsync = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.replay()
+        self.file = self.compact()
+
+    def replay(self) -> None:
+        """Read journal and restore the latest state of every lesson."""
+        try:
+            with open(self.path, "rb") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        for number, line in enumerate(lines, 1):
+            try:
+                record = jsonlib.loads(line)
+            except ValueError:
+                log.warning("Skipping torn record %s of %s", number, self.path)
+                continue
+            self.apply(record)
+        if self.entries:
+            log.info("Journal has %s unfinished lessons", len(self.entries))
+
+    def apply(self, record: dict[str, Any]) -> None:
+        """Merge record into the state of its lesson.
+
+        Args:
+            record (dict[str, Any]): record
+        """
+        key = record["key"]
+        if record["phase"] == DONE:
+            self.entries.pop(key, None)
+        else:
+            self.entries[key] = {**self.entries.get(key, {}), **record}
+
+    def compact(self) -> BinaryIO:
+        """Rewrite journal with one record per unfinished lesson.
+
+        Returns:
+            BinaryIO: journal opened for appending
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for entry in self.entries.values():
+                    f.write(jsonlib.dumps_bytes(entry) + b"\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        fsync_directory(directory)
+        self.records = len(self.entries)
+        return open(self.path, "ab")
+
+    def record(self, key: str, phase: str, sync: bool = False, **fields: Any) -> None:
+        """Append record of a lesson reaching a phase.
+
+        Args:
+            key (str): lesson key
+            phase (str): phase
+            sync (bool): fsync before returning
+            **fields (Any): data of the phase
+        """
+        record = {"key": key, "phase": phase, "ts": time.time(), **fields}
+        with self.lock:
+            self.apply(record)
+            self.file.write(jsonlib.dumps_bytes(record) + b"\n")
+            self.file.flush()
+            self.records += 1
+            if sync or time.monotonic() - self.ts_fsync >= self.fsync_interval:
+                os.fsync(self.file.fileno())
+                self.ts_fsync = time.monotonic()
+            if self.records >= self.compact_records:
+                self.file.close()
+                self.file = self.compact()
+
+    def finish(self, key: str) -> None:
+        """Mark lesson as finished.
+
+        Args:
+            key (str): lesson key
+        """
+        self.record(key, DONE)
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """Get state of an unfinished lesson.
+
+        Args:
+            key (str): lesson key
+
+        Returns:
+            dict[str, Any] | None: latest record merged with earlier ones
+        """
+        with self.lock:
+            return self.entries.get(key)
+
+    def unfinished(self) -> list[dict[str, Any]]:
+        """Get states of all unfinished lessons.
+
+        Returns:
+            list[dict[str, Any]]: states, oldest first
+        """
+        with self.lock:
+            return list(self.entries.values())
+
+    def is_reusable(self, entry: dict[str, Any]) -> bool:
+        """Check if the solution of an unfinished lesson can still be sent.
+
+        Args:
+            entry (dict[str, Any]): state of the lesson
+
+        Returns:
+            bool: solution exists and is recent enough
+        """
+        if "reqs" not in entry:
+            return False
+        return time.time() - entry["endtime"] < JOURNAL_REUSE_TTL
+
+    def close(self) -> None:
+        """Fsync and close journal."""
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+
+
+def fsync_directory(path: str) -> None:
+    """Persist renames within a directory.
+
+    Args:
+        path (str): directory
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def open_journal(user_id: str) -> Journal:
+    """Open journal of an account.
+
+    Args:
+        user_id (str): user id
+
+    Returns:
+        Journal: journal
+    """
+    return Journal(os.path.join(JOURNAL_DIR, f"{user_id}.jsonl"))
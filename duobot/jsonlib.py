@@ -0,0 +1,166 @@
+"""JSON backend"""
+
+from collections.abc import Callable
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import ujson
+except ImportError:
+    ujson = None  # type: ignore[assignment]
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize object to JSON bytes.
+
+        Args:
+            obj (Any): object
+
+        Returns:
+            bytes: JSON
+        """
+        return orjson.dumps(obj)
+
+    def dumps(obj: Any) -> str:
+        """Serialize object to JSON string.
+
+        Args:
+            obj (Any): object
+
+        Returns:
+            str: JSON
+        """
+        return orjson.dumps(obj).decode()
+
+    def loads(data: bytes | str) -> Any:
+        """Deserialize JSON.
+
+        Args:
+            data (bytes | str): JSON
+
+        Returns:
+            Any: object
+        """
+        return orjson.loads(data)
+
+elif ujson is not None:
+    BACKEND = "ujson"
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize object to JSON bytes.
+
+        Args:
+            obj (Any): object
+
+        Returns:
+            bytes: JSON
+        """
+        return ujson.dumps(obj, ensure_ascii=False).encode()
+
+    def dumps(obj: Any) -> str:
+        """Serialize object to JSON string.
+
+        Args:
+            obj (Any): object
+
+        Returns:
+            str: JSON
+        """
+        return ujson.dumps(obj, ensure_ascii=False)
+
+    def loads(data: bytes | str) -> Any:
+        """Deserialize JSON.
+
+        Args:
+            data (bytes | str): JSON
+
+        Returns:
+            Any: object
+        """
+        return ujson.loads(data)
+
+else:
+    BACKEND = "json"
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize object to JSON bytes.
+
+        Args:
+            obj (Any): object
+
+        Returns:
+            bytes: JSON
+        """
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def dumps(obj: Any) -> str:
+        """Serialize object to JSON string.
+
+        Args:
+            obj (Any): object
+
+        Returns:
+            str: JSON
+        """
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    def loads(data: bytes | str) -> Any:
+        """Deserialize JSON.
+
+        Args:
+            data (bytes | str): JSON
+
+        Returns:
+            Any: object
+        """
+        return json.loads(data)
+
+
+def loads_pairs(data: bytes | str, object_pairs_hook: Callable[[list], Any]) -> Any:
+    """Deserialize JSON, building every object with a hook.
+    Always uses the json module, as the fast backends have no hooks.
+
+    Args:
+        data (bytes | str): JSON
+        object_pairs_hook (Callable[[list], Any]): builds object from key value pairs
+
+    Returns:
+        Any: object
+    """
+    return json.loads(data, object_pairs_hook=object_pairs_hook)
+
+
+def build_batch_body(reqs: list[dict], include_headers: bool = False) -> bytes:
+    """Write batch envelope into a single buffer.
+    The already serialized body of every sub-request is escaped once as a
+    string, the envelope itself is never encoded as a whole.
+
+    Args:
+        reqs (list[dict]): requests with body, method and url
+        include_headers (bool): ask for headers of sub-responses
+
+    Returns:
+        bytes: request body
+    """
+    buf = bytearray(b'{"requests":[')
+    for i, req in enumerate(reqs):
+        if i:
+            buf += b","
+        buf += b'{"body":'
+        buf += dumps_bytes(req["body"])
+        buf += b',"method":'
+        buf += dumps_bytes(req["method"])
+        buf += b',"url":'
+        buf += dumps_bytes(req["url"])
+        buf += b"}"
+    buf += b'],"includeHeaders":'
+    buf += b"true}" if include_headers else b"false}"
+    return bytes(buf)
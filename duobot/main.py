@@ -3,12 +3,16 @@
 import logging
 import sys
 import time
+from typing import TYPE_CHECKING
 
 import click
 
-from duobot.api import Api
-from duobot.sessions import Sessions
+from duobot.config import Config
 
+# the cli is started often, so the api stack is only imported once needed
+if TYPE_CHECKING:
+    from duobot.planner import Planner
+    from duobot.sessions import AsyncSessions, Sessions
 
 log = logging.getLogger("duobot")
 logging.basicConfig(
@@ -18,16 +22,73 @@ logging.basicConfig(
 )
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option(
     "-l",
     "--lessons",
-    required=True,
     help="Number of lessons to solve.",
     type=click.INT,
 )
+@click.option(
+    "-p",
+    "--pipeline",
+    is_flag=True,
+    help="Prefetch the next lesson while waiting to send the current one.",
+)
+@click.option(
+    "--xp-target",
+    help="Solve lessons until this much XP is earned.",
+    type=click.INT,
+)
+@click.option(
+    "--time-budget",
+    help="Solve lessons for this long, e.g. 900, 15m or 1h.",
+    type=click.STRING,
+)
 @click.option("-d", "--debug", is_flag=True, help="Show debug messages.")
-def cli(lessons: int, debug: bool):
+@click.option(
+    "--metrics-file",
+    help="Write Prometheus metrics to this file periodically and on exit.",
+    type=click.Path(dir_okay=False, path_type=str),
+)
+@click.option(
+    "--metrics-port",
+    help="Serve Prometheus metrics on this localhost port.",
+    type=click.INT,
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Profile the run and write the phase timings and sampled stacks on exit.",
+)
+@click.option(
+    "--profile-out",
+    help="Path prefix of the profile files, implies --profile.",
+    default="duobot-profile",
+    show_default=True,
+    metavar="PREFIX",
+    type=click.Path(dir_okay=False, path_type=str),
+)
+@click.option(
+    "--profile-memory",
+    is_flag=True,
+    help="Also trace the allocations of every lesson, implies --profile. "
+    "Slows down the run.",
+)
+@click.pass_context
+def cli(
+    ctx: click.Context,
+    lessons: int | None,
+    pipeline: bool,
+    xp_target: int | None,
+    time_budget: str | None,
+    debug: bool,
+    metrics_file: str | None,
+    metrics_port: int | None,
+    profile: bool,
+    profile_out: str,
+    profile_memory: bool,
+):
     """Duobot is a complete command line automation for the Duolingo app.
     It travels the learning path of your active language course for you field by field.
     While doing so it solves lessons and stories, and opens chests.
@@ -35,35 +96,275 @@ def cli(lessons: int, debug: bool):
     """
     if debug:
         log.setLevel(logging.DEBUG)
-    start(lessons)
+    if metrics_file is not None or metrics_port is not None:
+        from duobot import metrics
+    if metrics_file is not None:
+        stop = metrics.REGISTRY.start_textfile_writer(
+            metrics_file, Config.METRICS_INTERVAL
+        )
+        ctx.call_on_close(lambda: metrics.REGISTRY.write_textfile(metrics_file))
+        ctx.call_on_close(stop.set)
+    if metrics_port is not None:
+        server = metrics.REGISTRY.start_http_server(Config.METRICS_HOST, metrics_port)
+        ctx.call_on_close(server.shutdown)
+    source = ctx.get_parameter_source("profile_out")
+    if profile or profile_memory or source != click.core.ParameterSource.DEFAULT:
+        from duobot import profiling
+
+        profiling.start(profile_out, profile_memory)
+        ctx.call_on_close(profiling.stop)
+    if ctx.invoked_subcommand is not None:
+        return
+    if xp_target is not None or time_budget is not None:
+        from duobot.planner import Planner, parse_duration
+
+        try:
+            budget = parse_duration(time_budget) if time_budget else None
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="'--time-budget'")
+        start_planned(Planner(xp_target, budget), lessons, pipeline)
+        return
+    if lessons is None:
+        raise click.UsageError(
+            "Missing option '-l' / '--lessons', '--xp-target' or '--time-budget'."
+        )
+    start(lessons, pipeline)
+
+
+@cli.command()
+@click.argument(
+    "accounts_file", type=click.Path(exists=True, dir_okay=False, path_type=str)
+)
+@click.option(
+    "-w",
+    "--workers",
+    default=4,
+    show_default=True,
+    help="Number of accounts to run concurrently.",
+    type=click.INT,
+)
+@click.option(
+    "-l",
+    "--lessons",
+    help="Number of lessons per account without own setting.",
+    type=click.INT,
+)
+@click.pass_context
+def fleet(ctx: click.Context, accounts_file: str, workers: int, lessons: int | None):
+    """Solve lessons for all accounts in ACCOUNTS_FILE (toml)."""
+    from duobot.fleet import load_accounts, log_summary, run_fleet
+
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(
+            logging.Formatter(
+                "%(asctime)s %(threadName)s %(name)s [%(levelname)s] %(message)s",
+                datefmt="%Y-%m-%d %H:%M:%S",
+            )
+        )
+    accounts = load_accounts(accounts_file, lessons)
+    results = run_fleet(accounts, workers, ctx.parent.params["pipeline"])
+    log_summary(results)
+    if any(result.error for result in results):
+        sys.exit(1)
+
+
+@cli.command()
+@click.argument(
+    "accounts_file",
+    required=False,
+    type=click.Path(exists=True, dir_okay=False, path_type=str),
+)
+@click.option(
+    "-w",
+    "--workers",
+    default=4,
+    show_default=True,
+    help="Number of jobs to run concurrently.",
+    type=click.INT,
+)
+@click.option(
+    "--port",
+    default=Config.DAEMON_PORT,
+    show_default=True,
+    help="Localhost port of the control api.",
+    type=click.INT,
+)
+@click.pass_context
+def serve(ctx: click.Context, accounts_file: str | None, workers: int, port: int):
+    """Keep running and solve lessons for jobs posted to the control api.
+    Accounts are read from ACCOUNTS_FILE (toml), or DUO_USERID and DUO_AUTH
+    as account "default".
+
+    \b
+    POST /jobs {"account": "default", "lessons": 3, "priority": 0}
+    POST /streak {"priority": 0}   one lesson for every account
+    POST /drain                    finish queued jobs and exit
+    GET  /status, /health, /jobs/<id>, /metrics
+    """
+    from duobot.config import getenv
+    from duobot.daemon import Daemon, serve as serve_daemon
+    from duobot.fleet import Account, load_accounts
+
+    if accounts_file is not None:
+        accounts = load_accounts(accounts_file, lessons=1)
+    else:
+        user_id, auth = getenv("DUO_USERID"), getenv("DUO_AUTH")
+        if user_id is None or auth is None:
+            raise click.UsageError(
+                "Pass an ACCOUNTS_FILE or set DUO_USERID and DUO_AUTH."
+            )
+        accounts = [Account("default", user_id, auth)]
+    daemon = Daemon(accounts, workers, ctx.parent.params["pipeline"])
+    serve_daemon(daemon, port)
+
+
+def create_session() -> "Sessions":
+    """Create session of the account in the environment with its journal and
+    persistent progress sink.
+
+    Returns:
+        Sessions: session
+    """
+    from duobot.api import Api
+    from duobot.journal import open_journal
+    from duobot.progress import open_progress
+    from duobot.sessions import Sessions
+
+    config = Config.from_env()
+    api = Api(config)
+    return Sessions(
+        api, journal=open_journal(config.USER_ID), progress=open_progress(api)
+    )
 
 
-def start(lessons: int):
+def start(lessons: int, pipeline: bool = False, session: "Sessions | None" = None):
     """Start the bot.
 
     Args:
         lessons (int): number of lessons to solve
+        pipeline (bool): prefetch the next lesson while waiting
+        session (Sessions | None): session of the account to use
     """
-    api = Api()
-    session = Sessions()
+    from duobot import profiling
+    from duobot.pipeline import Pipeline
+    from duobot.resilience import CircuitOpenError, Outage
+
+    session = session or create_session()
+    api = session.api
+    runner = Pipeline(session) if pipeline else session
+    outage = Outage()
     i = 0
     try:
+        session.resume()
         while i < lessons:
             i += 1
             log.info("Lesson %s of %s", i, lessons)
-            status = api.fetch_user_status()
-            log.info(
-                "Doing course %s. Streak: %s. XP: %s",
-                status["currentCourseId"],
-                status["streak"],
-                status["totalXp"],
-            )
-            course = api.fetch_current_course(course_id=status["currentCourseId"])
-            lesson = session.get_next_lesson(course)
-            session.solve_lesson(course, lesson)
+            try:
+                runner.solve_next_lesson()
+            except CircuitOpenError as e:
+                outage.pause(e)
+                i -= 1
+                continue
+            outage.reset()
             log.info("Finished lesson\n")
-            time.sleep(2)
+            profiling.lesson_done(i)
+            with profiling.phase("sleep"):
+                time.sleep(session.config.DELAY_BETWEEN_LESSONS)
     except KeyboardInterrupt:
         log.error("\nAborted by user!\n")
         sys.exit(0)
+    finally:
+        if isinstance(runner, Pipeline):
+            runner.close()
+        session.progress.close()
+        if session.journal is not None:
+            session.journal.close()
+    log.info("Finished all %s lessons.", lessons)
+    log.debug("Connection pool stats: %s", api.pool_stats())
+    log.debug("Response cache stats: %s", api.cache_stats())
+    log.debug("Story cache stats: %s", session.stories.stats())
+
+
+def start_planned(
+    planner: "Planner",
+    lessons: int | None = None,
+    pipeline: bool = False,
+    session: "Sessions | None" = None,
+):
+    """Start the bot and solve lessons until the planner reaches its goal.
+
+    Args:
+        planner (Planner): planner with xp target or time budget
+        lessons (int | None): max number of lessons to solve
+        pipeline (bool): prefetch the next lesson while waiting
+        session (Sessions | None): session of the account to use
+    """
+    from duobot import profiling
+    from duobot.pipeline import Pipeline
+    from duobot.resilience import CircuitOpenError, Outage
+
+    session = session or create_session()
+    runner = Pipeline(session) if pipeline else session
+    outage = Outage()
+    i = 0
+    try:
+        session.resume()
+        while lessons is None or i < lessons:
+            try:
+                planner.observe(session.api.fetch_user_status()["totalXp"])
+                if planner.is_done():
+                    break
+                if (eta := planner.time_to_goal()) is not None:
+                    log.info(
+                        "Lesson %s, %s, %.0fs to goal", i + 1, planner.summary(), eta
+                    )
+                else:
+                    log.info("Lesson %s, %s", i + 1, planner.summary())
+                ts_start = time.monotonic()
+                lesson = runner.solve_next_lesson(choose=planner.choose)
+            except CircuitOpenError as e:
+                outage.pause(e)
+                continue
+            outage.reset()
+            i += 1
+            profiling.lesson_done(i)
+            with profiling.phase("sleep"):
+                time.sleep(session.config.DELAY_BETWEEN_LESSONS)
+            planner.solved(lesson, time.monotonic() - ts_start)
+            log.info("Finished lesson\n")
+    except KeyboardInterrupt:
+        log.error("\nAborted by user!\n")
+        sys.exit(0)
+    finally:
+        if isinstance(runner, Pipeline):
+            runner.close()
+        session.progress.close()
+        if session.journal is not None:
+            session.journal.close()
+    log.info("Finished %s lessons: %s", i, planner.summary())
+
+
+async def start_async(lessons: int, session: "AsyncSessions | None" = None) -> None:
+    """Start the bot on the running event loop.
+    Several calls can be gathered to solve lessons concurrently.
+
+    Args:
+        lessons (int): number of lessons to solve
+        session (AsyncSessions | None): session of the account to use
+    """
+    import asyncio
+
+    from duobot.api import Api
+    from duobot.sessions import AsyncSessions
+
+    session = session or AsyncSessions(Api(Config.from_env()))
+    try:
+        await session.resume()
+        for i in range(1, lessons + 1):
+            log.info("Lesson %s of %s", i, lessons)
+            await session.solve_next_lesson()
+            log.info("Finished lesson\n")
+            await asyncio.sleep(session.config.DELAY_BETWEEN_LESSONS)
+    finally:
+        await session.close()
     log.info("Finished all %s lessons.", lessons)
@@ -0,0 +1,388 @@
+"""Metrics"""
+
+from bisect import bisect_left
+from collections.abc import Iterator
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+WAIT_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+RATIO_BUCKETS = (1.0, 1.5, 2.0, 3.0, 4.0, 6.0, 8.0, 12.0, 16.0)
+CODEC_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(labelnames: tuple[str, ...], labels: tuple[str, ...]) -> str:
+    """Format label set for the text exposition format.
+
+    Args:
+        labelnames (tuple[str, ...]): label names
+        labels (tuple[str, ...]): label values
+
+    Returns:
+        str: labels in curly braces or empty string
+    """
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, labels):
+        value = value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    """Format sample value.
+
+    Args:
+        value (float): value
+
+    Returns:
+        str: value without trailing .0 for integers
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if value == int(value) else repr(value)
+
+
+class Counter:
+    """Counter class.
+    Monotonic value per label set.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self.values: dict[tuple[str, ...], float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        """Increase counter.
+
+        Args:
+            amount (float): amount
+            *labels (str): label values in order of labelnames
+        """
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        """Get current value.
+
+        Args:
+            *labels (str): label values in order of labelnames
+
+        Returns:
+            float: value
+        """
+        return self.values.get(labels, 0)
+
+    def samples(self) -> Iterator[str]:
+        """Yield sample lines.
+
+        Yields:
+            str: sample line
+        """
+        with self.lock:
+            values = list(self.values.items())
+        for labels, value in values:
+            label_str = format_labels(self.labelnames, labels)
+            yield f"{self.name}{label_str} {format_value(value)}"
+
+
+class Histogram:
+    """Histogram class.
+    Cumulative bucket counts, sum and count per label set.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.doc = doc
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.values: dict[tuple[str, ...], list[float]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record a value.
+
+        Args:
+            value (float): value
+            *labels (str): label values in order of labelnames
+        """
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            if (counts := self.values.get(labels)) is None:
+                # one count per bucket, +Inf, then sum
+                counts = self.values[labels] = [0.0] * (len(self.buckets) + 2)
+            counts[i] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        """Record duration of the block in seconds.
+
+        Args:
+            *labels (str): label values in order of labelnames
+        """
+        ts_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - ts_start, *labels)
+
+    def count(self, *labels: str) -> int:
+        """Get number of recorded values.
+
+        Args:
+            *labels (str): label values in order of labelnames
+
+        Returns:
+            int: count
+        """
+        counts = self.values.get(labels)
+        return int(sum(counts[:-1])) if counts else 0
+
+    def samples(self) -> Iterator[str]:
+        """Yield sample lines.
+
+        Yields:
+            str: sample line
+        """
+        with self.lock:
+            values = [(labels, list(counts)) for labels, counts in self.values.items()]
+        labelnames = self.labelnames + ("le",)
+        for labels, counts in values:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                label_str = format_labels(labelnames, labels + (format_value(bound),))
+                yield f"{self.name}_bucket{label_str} {format_value(cumulative)}"
+            label_str = format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{label_str} {format_value(counts[-1])}"
+            yield f"{self.name}_count{label_str} {format_value(cumulative)}"
+
+
+class Registry:
+    """Metrics registry class.
+    Keeps all metrics of the process and renders them in the Prometheus
+    text exposition format, either for a textfile collector or over http.
+    """
+
+    def __init__(self):
+        self.metrics: list[Counter | Histogram] = []
+
+    def counter(self, name: str, doc: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        """Create and register counter.
+
+        Args:
+            name (str): metric name
+            doc (str): help text
+            labelnames (tuple[str, ...]): label names
+
+        Returns:
+            Counter: counter
+        """
+        metric = Counter(name, doc, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        doc: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        """Create and register histogram.
+
+        Args:
+            name (str): metric name
+            doc (str): help text
+            labelnames (tuple[str, ...]): label names
+            buckets (tuple[float, ...]): upper bounds of the buckets
+
+        Returns:
+            Histogram: histogram
+        """
+        metric = Histogram(name, doc, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Render all metrics.
+
+        Returns:
+            str: metrics in Prometheus text format
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.doc}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Write metrics atomically for the node exporter textfile collector.
+
+        Args:
+            path (str): path of the .prom file
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def start_textfile_writer(self, path: str, interval: float) -> threading.Event:
+        """Write metrics file periodically in a background thread.
+
+        Args:
+            path (str): path of the .prom file
+            interval (float): seconds between writes
+
+        Returns:
+            threading.Event: set it to stop the writer
+        """
+        stop = threading.Event()
+
+        def run() -> None:
+            while not stop.wait(interval):
+                self.write_textfile(path)
+
+        threading.Thread(target=run, name="metrics-file", daemon=True).start()
+        return stop
+
+    def start_http_server(self, host: str, port: int) -> ThreadingHTTPServer:
+        """Serve metrics on /metrics in a background thread.
+
+        Args:
+            host (str): interface to listen on
+            port (int): port, 0 for any free port
+
+        Returns:
+            ThreadingHTTPServer: server, call shutdown() to stop it
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            """Handler answering /metrics"""
+
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                log.debug(format, *args)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(
+            target=server.serve_forever, name="metrics-http", daemon=True
+        ).start()
+        log.info("Serving metrics on http://%s:%s/metrics", *server.server_address)
+        return server
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter(
+    "duobot_requests_total",
+    "Api calls by endpoint and outcome: ok, error or cache.",
+    ("endpoint", "outcome"),
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "duobot_request_duration_seconds",
+    "Latency of api requests sent over the network by endpoint.",
+    ("endpoint",),
+)
+RETRIES = REGISTRY.counter(
+    "duobot_request_retries_total", "Retried api requests by host.", ("host",)
+)
+SENT_BYTES = REGISTRY.counter(
+    "duobot_sent_bytes_total", "Request body bytes sent on the wire."
+)
+RECEIVED_BYTES = REGISTRY.counter(
+    "duobot_received_bytes_total", "Response body bytes received on the wire."
+)
+BODY_BYTES = REGISTRY.counter(
+    "duobot_body_bytes_total",
+    "Request and response body bytes before compression by direction.",
+    ("direction",),
+)
+COMPRESSION_RATIO = REGISTRY.histogram(
+    "duobot_compression_ratio",
+    "Body size divided by its compressed size by direction.",
+    ("direction",),
+    buckets=RATIO_BUCKETS,
+)
+CODEC_SECONDS = REGISTRY.histogram(
+    "duobot_codec_cpu_seconds",
+    "CPU time spent encoding request and reading response bodies by direction "
+    "and content encoding.",
+    ("direction", "encoding"),
+    buckets=CODEC_BUCKETS,
+)
+SOLUTION_SECONDS = REGISTRY.histogram(
+    "duobot_solution_duration_seconds",
+    "Time spent creating session solution responses.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+WAIT_SECONDS = REGISTRY.histogram(
+    "duobot_submission_wait_seconds",
+    "Time blocked waiting for submission end times.",
+    buckets=WAIT_BUCKETS,
+)
+LESSONS = REGISTRY.counter(
+    "duobot_lessons_total", "Lessons completed by lesson type.", ("type",)
+)
+
+
+@contextmanager
+def instrument(endpoint: str) -> Iterator[None]:
+    """Count a request sent over the network and record its latency.
+    Responses served from the cache are counted with the outcome cache by
+    the caller and are not part of the latency.
+
+    Args:
+        endpoint (str): endpoint name
+    """
+    ts_start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - ts_start, endpoint)
+        REQUESTS.inc(1, endpoint, outcome)
@@ -0,0 +1,94 @@
+"""Models"""
+
+from dataclasses import dataclass, replace
+from enum import Enum
+import sys
+from typing import Any
+
+
+class LessonType(str, Enum):
+    """Type of a level on the learning path"""
+
+    SKILL = "skill"
+    PRACTICE = "practice"
+    UNIT_REVIEW = "unit_review"
+    STORY = "story"
+    CHEST = "chest"
+
+
+# lesson types solved with a fetched session
+SKILL_TYPES = (LessonType.SKILL, LessonType.PRACTICE, LessonType.UNIT_REVIEW)
+
+
+@dataclass(frozen=True, slots=True)
+class PathLevel:
+    """Level of the learning path.
+    Holds the fields duobot reads, the path level metadata is kept as is
+    because it is sent back to the server.
+    """
+
+    id: str
+    type: LessonType
+    debug_name: str
+    level_index: int
+    level_session_index: int
+    finished_sessions: int
+    total_sessions: int
+    has_level_review: bool
+    skill_ids: tuple[str, ...]
+    metadata: dict[str, Any]
+
+    @classmethod
+    def from_level(cls, level: dict, index: int) -> "PathLevel":
+        """Create level from the path of a course.
+
+        Args:
+            level (dict): level
+            index (int): index of the level within its unit
+
+        Returns:
+            PathLevel: level
+
+        Raises:
+            RuntimeError: level type is not supported
+        """
+        try:
+            ltype = LessonType(level["type"])
+        except ValueError:
+            raise RuntimeError(f"Unknown lesson type {level['type']}") from None
+        finished = level.get("finishedSessions", 0)
+        client_data = level.get("pathLevelClientData") or {}
+        return cls(
+            id=level["id"],
+            type=ltype,
+            debug_name=sys.intern(level.get("debugName", "")),
+            level_index=index,
+            level_session_index=finished,
+            finished_sessions=finished,
+            total_sessions=level.get("totalSessions", 1),
+            has_level_review=level.get("hasLevelReview", False),
+            skill_ids=tuple(client_data.get("skillIds", ())),
+            metadata=level["pathLevelMetadata"],
+        )
+
+    @property
+    def key(self) -> str:
+        """Key of the level session, e.g. in the journal."""
+        return f"{self.id}:{self.level_session_index}"
+
+    def next_session(self) -> "PathLevel":
+        """Get the level once its current session is finished.
+
+        Returns:
+            PathLevel: level
+        """
+        finished = self.finished_sessions + 1
+        return replace(self, finished_sessions=finished, level_session_index=finished)
+
+    def replay(self) -> "PathLevel":
+        """Get the level to replay its first session.
+
+        Returns:
+            PathLevel: level
+        """
+        return replace(self, level_session_index=0)
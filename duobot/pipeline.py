@@ -0,0 +1,125 @@
+"""Pipeline"""
+
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import logging
+
+from duobot import profiling
+from duobot.models import SKILL_TYPES, LessonType, PathLevel
+from duobot.sessions import PreparedLesson, Sessions
+
+log = logging.getLogger(__name__)
+
+PREFETCH_TYPES = SKILL_TYPES + (LessonType.STORY,)
+
+
+class Pipeline:
+    """Pipeline class.
+    While a lesson waits for its end time, the predicted next lesson is
+    fetched and solved in the background. It is used if the path confirms
+    the prediction once the current lesson was sent, otherwise it is
+    discarded and the next lesson is prepared as usual.
+    """
+
+    def __init__(self, session: Sessions):
+        self.session = session
+        self.api = session.api
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self.prefetch: tuple[PathLevel, Future[PreparedLesson]] | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        """Drop pending prefetch and stop background worker.
+        A prefetch already running is waited for, so it does not write to
+        the journal once that is closed.
+        """
+        if self.prefetch is not None:
+            self.prefetch[1].cancel()
+            self.prefetch = None
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def start_prefetch(self, course: dict, lesson: PathLevel) -> None:
+        """Prepare the lesson predicted to follow the given one in background.
+
+        Args:
+            course (dict): course
+            lesson (PathLevel): current lesson
+        """
+        predicted = self.session.predict_next_lesson(course, lesson)
+        if predicted is None or predicted.type not in PREFETCH_TYPES:
+            log.debug("Nothing to prefetch after %s", lesson.debug_name)
+            return
+        log.info("Prefetching next lesson: %s", predicted.debug_name)
+        future = self.executor.submit(self.session.prepare_lesson, predicted, course)
+        self.prefetch = (predicted, future)
+
+    def take_prefetched(self, lesson: PathLevel) -> PreparedLesson | None:
+        """Get prefetched lesson if it matches the actual next lesson.
+
+        Args:
+            lesson (PathLevel): actual next lesson
+
+        Returns:
+            PreparedLesson | None: prefetched lesson or None if stale or failed
+        """
+        if self.prefetch is None:
+            return None
+        predicted, future = self.prefetch
+        self.prefetch = None
+        if predicted.key != lesson.key:
+            log.info("Prefetched lesson is stale, discarding it")
+            self.misses += 1
+            if not future.cancel():
+                # let a running prefetch record its last phase before finishing it
+                wait([future])
+            if self.session.journal is not None:
+                self.session.journal.finish(predicted.key)
+            return None
+        try:
+            prepared = future.result()
+        except Exception:  # the lesson is prepared again in the foreground
+            log.warning("Prefetching lesson failed", exc_info=True)
+            self.misses += 1
+            return None
+        prepared.lesson = lesson
+        self.hits += 1
+        return prepared
+
+    def solve_next_lesson(
+        self, choose: Callable[[dict, PathLevel], PathLevel] | None = None
+    ) -> PathLevel:
+        """Solve the next lesson on the path, prefetching the one after.
+
+        Args:
+            choose (Callable[[dict, PathLevel], PathLevel] | None): picks the
+                lesson to solve given the course and the next lesson on the path
+
+        Returns:
+            PathLevel: solved lesson
+        """
+        with profiling.phase("status"):
+            status = self.api.fetch_user_status()
+        log.info(
+            "Doing course %s. Streak: %s. XP: %s",
+            status["currentCourseId"],
+            status["streak"],
+            status["totalXp"],
+        )
+        with profiling.phase("course"):
+            course = self.api.fetch_current_course(course_id=status["currentCourseId"])
+        with profiling.phase("next_lesson"):
+            lesson = self.session.get_next_lesson(course)
+        if choose is not None:
+            lesson = choose(course, lesson)
+        prepared = self.take_prefetched(lesson)
+        if prepared is None and lesson.type not in PREFETCH_TYPES:
+            self.session.solve_lesson(course, lesson)
+            return lesson
+        if prepared is None:
+            prepared = self.session.prepare_lesson(lesson, course)
+        else:
+            log.info("Using prefetched lesson")
+        self.start_prefetch(course, lesson)
+        self.session.submit_lesson(prepared)
+        return lesson
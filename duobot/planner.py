@@ -0,0 +1,210 @@
+"""Planner"""
+
+from dataclasses import dataclass
+import logging
+import re
+import time
+
+from duobot.config import Config
+from duobot.models import LessonType, PathLevel
+
+log = logging.getLogger(__name__)
+
+PLANNER_PRIORS = Config.PLANNER_PRIORS
+RE_DURATION = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*$")
+DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> float:
+    """Parse duration like 90, 90s, 15m or 1.5h.
+
+    Args:
+        value (str): duration
+
+    Returns:
+        float: seconds
+    """
+    m = RE_DURATION.match(value.lower())
+    if m is None:
+        raise ValueError(f"Invalid duration {value!r}, use e.g. 900, 15m or 1h")
+    return float(m.group(1)) * DURATION_UNITS[m.group(2)]
+
+
+@dataclass
+class LessonStats:
+    """Observed xp and duration of one lesson type"""
+
+    lessons: int = 0
+    xp: int = 0
+    seconds: float = 0.0
+
+
+class Planner:
+    """Planner class.
+    Solves lessons until an xp target is reached or a time budget is used
+    up. Observed xp and duration per lesson type replace the configured
+    priors as lessons are solved. If replaying a passed practice level
+    earns xp faster than the active level, the replay is chosen instead.
+    """
+
+    def __init__(
+        self,
+        xp_target: int | None = None,
+        time_budget: float | None = None,
+        priors: dict[str, tuple[int, float]] = PLANNER_PRIORS,
+    ):
+        """Create planner.
+
+        Args:
+            xp_target (int | None): xp to earn
+            time_budget (float | None): seconds to run
+            priors (dict[str, tuple[int, float]]): expected xp and seconds per type
+        """
+        if xp_target is None and time_budget is None:
+            raise ValueError("Planner needs an xp target or a time budget")
+        self.xp_target = xp_target
+        self.time_budget = time_budget
+        self.priors = priors
+        self.stats: dict[str, LessonStats] = {}
+        self.ts_start = time.monotonic()
+        self.xp_start: int | None = None
+        self.xp_last: int | None = None
+        self.pending: tuple[str, float] | None = None
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the planner was created."""
+        return time.monotonic() - self.ts_start
+
+    @property
+    def xp_gained(self) -> int:
+        """Xp earned since the planner was created."""
+        if self.xp_start is None or self.xp_last is None:
+            return 0
+        return self.xp_last - self.xp_start
+
+    def expected(self, ltype: str) -> tuple[float, float]:
+        """Get expected xp and seconds of a lesson type.
+
+        Args:
+            ltype (str): lesson type
+
+        Returns:
+            tuple[float, float]: xp and seconds
+        """
+        stats = self.stats.get(ltype)
+        if stats is None or not stats.lessons:
+            xp, seconds = self.priors.get(ltype, (0, 1.0))
+            return xp, seconds
+        return stats.xp / stats.lessons, stats.seconds / stats.lessons
+
+    def rate(self, ltype: str) -> float:
+        """Get expected xp per second of a lesson type.
+
+        Args:
+            ltype (str): lesson type
+
+        Returns:
+            float: xp per second
+        """
+        xp, seconds = self.expected(ltype)
+        return xp / max(seconds, 1e-3)
+
+    def observe(self, total_xp: int) -> None:
+        """Record the total xp of the user, before the first and after every lesson.
+        The xp gained since the last call is credited to the lesson solved since.
+
+        Args:
+            total_xp (int): total xp from the user status
+        """
+        if self.xp_start is None:
+            self.xp_start = total_xp
+        if self.pending is not None and self.xp_last is not None:
+            ltype, seconds = self.pending
+            stats = self.stats.setdefault(ltype, LessonStats())
+            stats.lessons += 1
+            stats.xp += total_xp - self.xp_last
+            stats.seconds += seconds
+            self.pending = None
+        self.xp_last = total_xp
+
+    def solved(self, lesson: PathLevel, seconds: float) -> None:
+        """Record that a lesson was solved.
+
+        Args:
+            lesson (PathLevel): lesson
+            seconds (float): duration
+        """
+        self.pending = (lesson.type.value, seconds)
+
+    def lesson_seconds(self) -> float:
+        """Get expected duration of the next lesson.
+
+        Returns:
+            float: seconds
+        """
+        lessons = sum(s.lessons for s in self.stats.values())
+        if lessons:
+            return sum(s.seconds for s in self.stats.values()) / lessons
+        return max(seconds for _, seconds in self.priors.values())
+
+    def is_done(self) -> bool:
+        """Check if the goal is reached or the next lesson does not fit the budget.
+
+        Returns:
+            bool: stop solving lessons
+        """
+        if self.xp_target is not None and self.xp_gained >= self.xp_target:
+            log.info("Reached xp target of %s", self.xp_target)
+            return True
+        if self.time_budget is not None:
+            if self.elapsed + self.lesson_seconds() > self.time_budget:
+                log.info("Next lesson does not fit the time budget")
+                return True
+        return False
+
+    def time_to_goal(self) -> float | None:
+        """Estimate seconds until the xp target is reached.
+
+        Returns:
+            float | None: seconds or None without xp target or observed xp
+        """
+        if self.xp_target is None or self.xp_gained <= 0:
+            return None
+        rate = self.xp_gained / self.elapsed
+        return max(0, self.xp_target - self.xp_gained) / rate
+
+    def choose(self, course: dict, lesson: PathLevel) -> PathLevel:
+        """Choose the lesson to solve next.
+
+        Args:
+            course (dict): course
+            lesson (PathLevel): active lesson on the path
+
+        Returns:
+            PathLevel: active lesson or a passed practice level to replay
+        """
+        # chests are quick and unlock the rest of the path
+        if lesson.type == LessonType.CHEST:
+            return lesson
+        if self.rate(LessonType.PRACTICE.value) <= self.rate(lesson.type.value):
+            return lesson
+        for unit in reversed(course["path"]):
+            for i, level in enumerate(unit["levels"]):
+                if level["type"] == "practice" and level["state"] == "passed":
+                    log.info("Replaying practice level: %s", level["debugName"])
+                    return PathLevel.from_level(level, i).replay()
+        return lesson
+
+    def summary(self) -> str:
+        """Summarize progress and observed rates.
+
+        Returns:
+            str: summary
+        """
+        rates = ", ".join(
+            f"{ltype} {s.xp / max(s.seconds, 1e-3):.2f} xp/s"
+            for ltype, s in sorted(self.stats.items())
+        )
+        summary = f"{self.xp_gained} xp in {self.elapsed:.0f}s"
+        return f"{summary} ({rates})" if rates else summary
@@ -0,0 +1,266 @@
+"""Profiling"""
+
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from duobot.config import Config
+
+log = logging.getLogger(__name__)
+
+PROFILE_INTERVAL = Config.PROFILE_INTERVAL
+PROFILE_TOP = Config.PROFILE_TOP
+
+# profiler of the running process, phases are not timed while None
+PROFILER: "Profiler | None" = None
+
+
+@dataclass
+class PhaseStats:
+    """Calls and time spent in one phase"""
+
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    wall_max: float = 0.0
+
+
+class Profiler:
+    """Profiler class.
+    Times the phases of a run in wall clock and thread CPU time. A sampling
+    thread records the stacks of all threads inside a phase, prefixed with
+    the phase, as collapsed stacks for flamegraph tools. With memory,
+    tracemalloc snapshots taken after every lesson show which lines the
+    memory that was allocated during the lesson and is still alive comes
+    from. Tracing allocations slows down everything else, so it is off by
+    default.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        memory: bool = False,
+        interval: float = PROFILE_INTERVAL,
+        top: int = PROFILE_TOP,
+    ):
+        """Create profiler.
+
+        Args:
+            prefix (str): path prefix of the report files
+            memory (bool): trace allocations per lesson
+            interval (float): seconds between stack samples
+            top (int): allocations listed per lesson
+        """
+        self.prefix = prefix
+        self.memory = memory
+        self.interval = interval
+        self.top = top
+        self.lock = threading.Lock()
+        self.phases: dict[str, PhaseStats] = {}
+        self.active: dict[int, list[str]] = {}
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.lessons: list[tuple[int, int, list[str]]] = []
+        self.snapshot: tracemalloc.Snapshot | None = None
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(
+            target=self.sample_loop, name="profiler", daemon=True
+        )
+        self.ts_start = time.perf_counter()
+
+    def start(self) -> None:
+        """Start sampling stacks and, with memory, tracing allocations."""
+        if self.memory:
+            tracemalloc.start()
+            self.snapshot = self.take_snapshot()
+        self.sampler.start()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the block as phase.
+
+        Args:
+            name (str): phase name
+        """
+        active = self.active.setdefault(threading.get_ident(), [])
+        active.append(name)
+        ts_wall = time.perf_counter()
+        ts_cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - ts_wall
+            cpu = time.thread_time() - ts_cpu
+            active.pop()
+            with self.lock:
+                stats = self.phases.setdefault(name, PhaseStats())
+                stats.calls += 1
+                stats.wall += wall
+                stats.cpu += cpu
+                stats.wall_max = max(stats.wall_max, wall)
+
+    def sample_loop(self) -> None:
+        """Sample stacks until stopped."""
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                try:
+                    name = self.active[ident][-1]
+                except (KeyError, IndexError):
+                    continue
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    filename = os.path.basename(code.co_filename)
+                    stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(name)
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def take_snapshot(self) -> tracemalloc.Snapshot:
+        """Take tracemalloc snapshot without the profiler's own allocations.
+
+        Returns:
+            tracemalloc.Snapshot: snapshot
+        """
+        return tracemalloc.take_snapshot().filter_traces(
+            (
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            )
+        )
+
+    def lesson_done(self, lesson: int) -> None:
+        """Record the allocations that grew during a lesson.
+
+        Args:
+            lesson (int): lesson number
+        """
+        if not self.memory:
+            return
+        snapshot = self.take_snapshot()
+        diffs = snapshot.compare_to(self.snapshot, "lineno")
+        top = [str(diff) for diff in diffs if diff.size_diff > 0][: self.top]
+        traced, peak = tracemalloc.get_traced_memory()
+        self.lessons.append((lesson, traced, top))
+        self.snapshot = snapshot
+        tracemalloc.reset_peak()
+        log.debug(
+            "Lesson %s: %.1f KiB traced, peak %.1f KiB",
+            lesson,
+            traced / 1024,
+            peak / 1024,
+        )
+
+    def stop(self) -> None:
+        """Stop sampling and tracing and write the report files."""
+        self.stopped.set()
+        self.sampler.join()
+        table = self.render_phases()
+        log.info("Profile of %.1fs:\n%s", time.perf_counter() - self.ts_start, table)
+        with open(f"{self.prefix}.phases.txt", "w") as f:
+            f.write(table)
+        with open(f"{self.prefix}.folded", "w") as f:
+            f.writelines(f"{stack} {n}\n" for stack, n in self.stacks.items())
+        log.info(
+            "Wrote %s.phases.txt and %s.folded (%s samples)",
+            self.prefix,
+            self.prefix,
+            self.samples,
+        )
+        if self.memory:
+            tracemalloc.stop()
+            with open(f"{self.prefix}.memory.txt", "w") as f:
+                f.write(self.render_memory())
+            log.info("Wrote %s.memory.txt", self.prefix)
+
+    def render_phases(self) -> str:
+        """Render wall and CPU time per phase as table.
+
+        Returns:
+            str: table
+        """
+        total = time.perf_counter() - self.ts_start
+        lines = [
+            f"{'phase':<14}{'calls':>7}{'wall s':>10}{'wall %':>8}"
+            f"{'cpu s':>10}{'mean ms':>10}{'max ms':>10}"
+        ]
+        with self.lock:
+            phases = sorted(self.phases.items(), key=lambda p: -p[1].wall)
+        for name, s in phases:
+            lines.append(
+                f"{name:<14}{s.calls:>7}{s.wall:>10.3f}{100 * s.wall / total:>8.1f}"
+                f"{s.cpu:>10.3f}{1000 * s.wall / s.calls:>10.1f}"
+                f"{1000 * s.wall_max:>10.1f}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def render_memory(self) -> str:
+        """Render allocations that grew per lesson.
+
+        Returns:
+            str: report
+        """
+        lines = []
+        for lesson, traced, top in self.lessons:
+            lines.append(f"Lesson {lesson}: {traced / 1024:.1f} KiB traced")
+            lines.extend(f"  {line}" for line in top)
+        return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time the block as phase if profiling.
+
+    Args:
+        name (str): phase name
+    """
+    if PROFILER is None:
+        yield
+        return
+    with PROFILER.phase(name):
+        yield
+
+
+def lesson_done(lesson: int) -> None:
+    """Record allocations of a finished lesson if profiling.
+
+    Args:
+        lesson (int): lesson number
+    """
+    if PROFILER is not None:
+        PROFILER.lesson_done(lesson)
+
+
+def start(prefix: str, memory: bool = False) -> Profiler:
+    """Start profiling the process.
+
+    Args:
+        prefix (str): path prefix of the report files
+        memory (bool): trace allocations per lesson
+
+    Returns:
+        Profiler: profiler
+    """
+    global PROFILER
+    PROFILER = Profiler(prefix, memory)
+    PROFILER.start()
+    return PROFILER
+
+
+def stop() -> None:
+    """Stop profiling the process and write the report files."""
+    global PROFILER
+    if PROFILER is not None:
+        PROFILER.stop()
+        PROFILER = None
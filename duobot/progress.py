@@ -0,0 +1,302 @@
+"""Goals progress"""
+
+from datetime import date, datetime, timezone
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Any
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import requests
+
+from duobot import jsonlib
+from duobot.api import Api
+from duobot.challenges import ChallengeCounts
+from duobot.config import Config
+from duobot.journal import fsync_directory
+from duobot.resilience import CircuitOpenError
+
+log = logging.getLogger(__name__)
+
+JOURNAL_DIR = Config.JOURNAL_DIR
+PROGRESS_FLUSH_LESSONS = Config.PROGRESS_FLUSH_LESSONS
+PROGRESS_FLUSH_INTERVAL = Config.PROGRESS_FLUSH_INTERVAL
+PROGRESS_CHARACTERS = Config.PROGRESS_CHARACTERS
+SPEAK_TYPES = ("speak", "listenSpeak")
+LISTEN_TYPES = (
+    "listen",
+    "listenTap",
+    "listenMatch",
+    "listenComplete",
+    "listenIsolation",
+)
+
+
+def count_progress(counts: ChallengeCounts | None = None) -> dict[str, int]:
+    """Get goals progress of a solved skill session.
+
+    Args:
+        counts (ChallengeCounts | None): counts of the session, None if unknown
+
+    Returns:
+        dict[str, int]: quantity per metric
+    """
+    # every challenge is answered correctly
+    quantities = {"LESSONS": 1, "PERFECT_LESSONS": 1, "NINETY_ACCURACY_LESSONS": 1}
+    if counts is None:
+        return quantities
+    speak = sum(n for ctype, n in counts.types.items() if ctype in SPEAK_TYPES)
+    listen = sum(n for ctype, n in counts.types.items() if ctype in LISTEN_TYPES)
+    if speak:
+        quantities["SPEAK_CHALLENGES"] = speak
+    if listen:
+        quantities["LISTEN_CHALLENGES"] = listen
+    for name in counts.characters:
+        if name in PROGRESS_CHARACTERS:
+            quantities[name] = 1
+    return quantities
+
+
+def create_progress_payload(
+    quantities: dict[str, int], tz: str, ts: float | None = None
+) -> dict:
+    """Create payload for goals progress update.
+
+    Args:
+        quantities (dict[str, int]): quantity per metric
+        tz (str): timezone of the user
+        ts (float | None): unix timestamp the progress was made at, now if None
+
+    Returns:
+        dict: payload
+    """
+    # format: "2024-10-12T10:11:54.829Z"
+    when = datetime.fromtimestamp(time.time() if ts is None else ts, tz=timezone.utc)
+    return {
+        "metric_updates": [
+            {"metric": metric, "quantity": quantity}
+            for metric, quantity in quantities.items()
+        ],
+        "timestamp": when.strftime(r"%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+        "timezone": tz,
+    }
+
+
+def local_day(ts: float, tz: str) -> date:
+    """Get day of a timestamp in the timezone of the user.
+
+    Args:
+        ts (float): unix timestamp
+        tz (str): timezone of the user, UTC if unknown
+
+    Returns:
+        date: day
+    """
+    try:
+        zone = ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        zone = timezone.utc
+    return datetime.fromtimestamp(ts, tz=zone).date()
+
+
+def group_by_day(lessons: list[dict[str, Any]], tz: str) -> list[list[dict[str, Any]]]:
+    """Group pending lessons by the day of the user they were finished on.
+
+    Args:
+        lessons (list[dict[str, Any]]): pending lessons
+        tz (str): timezone of the user
+
+    Returns:
+        list[list[dict[str, Any]]]: lessons per day, oldest day first
+    """
+    days: dict[date, list[dict[str, Any]]] = {}
+    for lesson in lessons:
+        days.setdefault(local_day(lesson["ts"], tz), []).append(lesson)
+    return [days[day] for day in sorted(days)]
+
+
+def sum_progress(lessons: list[dict[str, Any]]) -> dict[str, int]:
+    """Sum goals progress of lessons.
+
+    Args:
+        lessons (list[dict[str, Any]]): pending lessons
+
+    Returns:
+        dict[str, int]: quantity per metric
+    """
+    quantities: dict[str, int] = {}
+    for lesson in lessons:
+        for metric, quantity in lesson["metrics"].items():
+            quantities[metric] = quantities.get(metric, 0) + quantity
+    return quantities
+
+
+class ProgressSink:
+    """Progress sink class.
+    Sums the goals progress of lessons and posts it once flush_lessons
+    lessons are pending, flush_interval seconds after the first pending
+    lesson, or when closed. Lessons are summed per day of the user and
+    posted with the time they were finished at, so progress held back
+    over midnight still counts for the right day. The timezone of the
+    user is fetched once. With a path, the pending lessons are written
+    there after every lesson, so they are posted by the next run if this
+    one dies.
+    """
+
+    def __init__(
+        self,
+        api: Api,
+        path: str | None = None,
+        flush_lessons: int = PROGRESS_FLUSH_LESSONS,
+        flush_interval: float = PROGRESS_FLUSH_INTERVAL,
+    ):
+        """Create sink and load progress left pending by a previous run.
+
+        Args:
+            api (Api): api of the account
+            path (str | None): file keeping the pending progress
+            flush_lessons (int): pending lessons after which progress is posted
+            flush_interval (float): max seconds progress is held back
+        """
+        self.api = api
+        self.path = path
+        self.flush_lessons = flush_lessons
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.timer: threading.Timer | None = None
+        self.tz: str | None = None
+        self.lessons: list[dict[str, Any]] = []
+        self.updates = 0
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.load()
+
+    def load(self) -> None:
+        """Load pending progress."""
+        try:
+            with open(self.path, "rb") as f:
+                state = jsonlib.loads(f.read())
+        except FileNotFoundError:
+            return
+        except ValueError:
+            log.warning("Ignoring unreadable progress file %s", self.path)
+            return
+        self.lessons = state["lessons"]
+        if self.lessons:
+            log.info("Progress of %s lessons is still pending", len(self.lessons))
+
+    def save(self) -> None:
+        """Write pending progress, replacing the file atomically."""
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        state = {"lessons": self.lessons}
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(jsonlib.dumps_bytes(state))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        fsync_directory(directory)
+
+    def add(self, attempt: str, quantities: dict[str, int]) -> None:
+        """Add progress of a lesson. Progress of an attempt already pending is ignored.
+
+        Args:
+            attempt (str): id of the attempt, e.g. the session id
+            quantities (dict[str, int]): quantity per metric
+        """
+        with self.lock:
+            if any(lesson["id"] == attempt for lesson in self.lessons):
+                return
+            self.lessons.append(
+                {"id": attempt, "ts": time.time(), "metrics": quantities}
+            )
+            self.save()
+            flush = len(self.lessons) >= self.flush_lessons
+            if not flush:
+                self.start_timer()
+        if flush:
+            self.flush()
+
+    def start_timer(self) -> None:
+        """Schedule flush of the pending progress, if not scheduled yet."""
+        if self.timer is None:
+            self.timer = threading.Timer(self.flush_interval, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def timezone(self) -> str:
+        """Get timezone of the user, fetched on first use.
+
+        Returns:
+            str: timezone
+        """
+        if self.tz is None:
+            self.tz = self.api.fetch_user_status()["timezone"]
+        return self.tz
+
+    def flush(self) -> bool:
+        """Post pending progress as one update per day of the user.
+        A failed update is logged and kept pending for the next flush.
+
+        Returns:
+            bool: progress was posted or nothing was pending
+        """
+        with self.flush_lock:
+            with self.lock:
+                if self.timer is not None:
+                    self.timer.cancel()
+                    self.timer = None
+                lessons = list(self.lessons)
+            if not lessons:
+                return True
+            log.info("Updating progress of %s lessons", len(lessons))
+            posted: set[str] = set()
+            try:
+                tz = self.timezone()
+                for day in group_by_day(lessons, tz):
+                    ts = max(lesson["ts"] for lesson in day)
+                    payload = create_progress_payload(sum_progress(day), tz, ts)
+                    self.api.post_progress_update(payload=payload)
+                    self.updates += 1
+                    posted.update(lesson["id"] for lesson in day)
+            except (requests.exceptions.RequestException, CircuitOpenError) as e:
+                log.warning("Progress update failed: %s", e)
+            with self.lock:
+                if posted:
+                    self.lessons = [
+                        lesson for lesson in self.lessons if lesson["id"] not in posted
+                    ]
+                    self.save()
+                if self.lessons:
+                    self.start_timer()
+            return len(posted) == len(lessons)
+
+    def close(self) -> None:
+        """Post pending progress and stop the flush timer."""
+        self.flush()
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+
+def open_progress(api: Api) -> ProgressSink:
+    """Open progress sink of an account, keeping its pending progress next to its journal.
+
+    Args:
+        api (Api): api of the account
+
+    Returns:
+        ProgressSink: progress sink
+    """
+    path = os.path.join(JOURNAL_DIR, f"{api.config.USER_ID}.progress.json")
+    return ProgressSink(api, path)
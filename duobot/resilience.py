@@ -0,0 +1,272 @@
+"""Retries and circuit breaker"""
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import logging
+import random
+import threading
+import time
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from duobot.config import Config
+
+log = logging.getLogger(__name__)
+
+RETRY_ATTEMPTS = Config.RETRY_ATTEMPTS
+RETRY_BACKOFF = Config.RETRY_BACKOFF
+RETRY_BACKOFF_MAX = Config.RETRY_BACKOFF_MAX
+RETRY_STATUSES = Config.RETRY_STATUSES
+BREAKER_THRESHOLD = Config.BREAKER_THRESHOLD
+BREAKER_RESET = Config.BREAKER_RESET
+BREAKER_MAX_OUTAGE = Config.BREAKER_MAX_OUTAGE
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of sending a request to a host that is down"""
+
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Circuit for {host} is open, retry in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+@dataclass
+class RetryPolicy:
+    """Retry policy.
+    Idempotent requests are retried on connection errors, timeouts, bodies
+    cut off while streamed and the retry statuses. Other requests are only retried if the server
+    cannot have processed them: the connection was never established or
+    the server explicitly declined with 429 or 503.
+    """
+
+    attempts: int = RETRY_ATTEMPTS
+    backoff: float = RETRY_BACKOFF
+    backoff_max: float = RETRY_BACKOFF_MAX
+    statuses: tuple[int, ...] = RETRY_STATUSES
+
+    def should_retry_error(
+        self,
+        error: requests.exceptions.RequestException,
+        idempotent: bool,
+        attempt: int,
+    ) -> bool:
+        """Check if a request failing with an exception should be sent again.
+
+        Args:
+            error (requests.exceptions.RequestException): error
+            idempotent (bool): request can be repeated safely
+            attempt (int): number of the failed attempt, starting at 0
+
+        Returns:
+            bool: retry
+        """
+        if attempt + 1 >= self.attempts:
+            return False
+        if is_not_connected(error):
+            return True
+        if idempotent:
+            return isinstance(
+                error,
+                (
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError,
+                ),
+            )
+        return False
+
+    def should_retry_status(self, status: int, idempotent: bool, attempt: int) -> bool:
+        """Check if a request failing with a status should be sent again.
+
+        Args:
+            status (int): http status
+            idempotent (bool): request can be repeated safely
+            attempt (int): number of the failed attempt, starting at 0
+
+        Returns:
+            bool: retry
+        """
+        if attempt + 1 >= self.attempts or status not in self.statuses:
+            return False
+        return idempotent or status in (429, 503)
+
+    def delay(self, attempt: int, retry_after: str | None = None) -> float:
+        """Get seconds to wait before the next attempt.
+        Full jitter exponential backoff, unless the server asked for a
+        longer pause with Retry-After.
+
+        Args:
+            attempt (int): number of the failed attempt, starting at 0
+            retry_after (str | None): Retry-After header
+
+        Returns:
+            float: seconds
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, min(self.backoff_max, parse_retry_after(retry_after)))
+        return delay
+
+
+def is_not_connected(error: requests.exceptions.RequestException) -> bool:
+    """Check if a request failed before a connection was established.
+
+    Args:
+        error (requests.exceptions.RequestException): error
+
+    Returns:
+        bool: request never reached the server
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def parse_retry_after(value: str) -> float:
+    """Parse Retry-After header given in seconds or as http date.
+
+    Args:
+        value (str): header value
+
+    Returns:
+        float: seconds to wait, 0 if unparsable
+    """
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return max(0.0, (date - datetime.now(tz=timezone.utc)).total_seconds())
+
+
+class CircuitBreaker:
+    """Circuit breaker class.
+    Opens after a number of consecutive failures of a host and then fails
+    fast until the reset timeout has passed. A single probe request is let
+    through afterwards, which closes the circuit again if it succeeds.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        threshold: int = BREAKER_THRESHOLD,
+        reset: float = BREAKER_RESET,
+    ):
+        """Create closed circuit.
+
+        Args:
+            host (str): host
+            threshold (int): consecutive failures opening the circuit
+            reset (float): seconds to fail fast before probing the host
+        """
+        self.host = host
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Get state of the circuit.
+
+        Returns:
+            str: closed, open or half-open
+        """
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at >= self.reset:
+            return "half-open"
+        return "open"
+
+    def check(self) -> bool:
+        """Let a request pass or fail fast.
+
+        Returns:
+            bool: the request is the probe of a half-open circuit
+
+        Raises:
+            CircuitOpenError: circuit is open
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.reset - time.monotonic()
+            if remaining <= 0 and not self.probing:
+                log.info("Probing %s after circuit was open", self.host)
+                self.probing = True
+                return True
+        # a probe is in flight if the reset timeout already passed
+        raise CircuitOpenError(self.host, max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        """Close circuit after a successful request."""
+        with self.lock:
+            if self.opened_at is not None:
+                log.info("Closing circuit for %s", self.host)
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def end_probe(self) -> None:
+        """Let another probe through if the last one ended without a result."""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self) -> None:
+        """Count failure and open circuit if the threshold is reached."""
+        with self.lock:
+            self.failures += 1
+            if self.probing or (
+                self.opened_at is None and self.failures >= self.threshold
+            ):
+                log.warning(
+                    "Opening circuit for %s after %s failures", self.host, self.failures
+                )
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+
+class Outage:
+    """Outage class.
+    Pauses a lesson loop while a circuit is open and gives up once the
+    pauses since the last solved lesson add up to the max outage time.
+    """
+
+    def __init__(self, max_outage: float = BREAKER_MAX_OUTAGE):
+        """Create outage tracker.
+
+        Args:
+            max_outage (float): seconds of pauses before giving up
+        """
+        self.max_outage = max_outage
+        self.paused = 0.0
+
+    def pause(self, error: CircuitOpenError) -> None:
+        """Sleep until the open circuit can be probed again.
+
+        Args:
+            error (CircuitOpenError): error of the open circuit
+
+        Raises:
+            RuntimeError: host is down for longer than the max outage time
+        """
+        if self.paused + error.retry_in > self.max_outage:
+            raise RuntimeError(
+                f"{error.host} is down for more than {self.max_outage:.0f}s, giving up"
+            ) from error
+        log.warning("%s, pausing before trying again", error)
+        time.sleep(error.retry_in)
+        self.paused += error.retry_in
+
+    def reset(self) -> None:
+        """End the outage after a lesson was solved."""
+        self.paused = 0.0
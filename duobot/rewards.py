@@ -0,0 +1,67 @@
+"""Reward bundles"""
+
+PATH_CHEST = "PATH_CHEST"
+
+
+class RewardIndex:
+    """Reward index class.
+    Indexes the unconsumed reward bundles of a user by bundle type and
+    reward id. Bundles opened by duobot are removed locally, so the index
+    only has to be fetched again once it runs out of path chests.
+    """
+
+    def __init__(self, rewards: dict):
+        """Index rewards.
+
+        Args:
+            rewards (dict): rewards
+        """
+        self.by_type: dict[str, list[dict]] = {}
+        self.by_id: dict[str, dict] = {}
+        for bundle in rewards.get("rewardBundles", []):
+            if not bundle.get("rewards") or bundle["rewards"][-1].get("consumed"):
+                continue
+            self.by_type.setdefault(bundle["rewardBundleType"], []).append(bundle)
+            for reward in bundle["rewards"]:
+                self.by_id[reward["id"]] = bundle
+
+    def bundles(self, bundle_type: str) -> list[dict]:
+        """Get unconsumed bundles of a type.
+
+        Args:
+            bundle_type (str): bundle type
+
+        Returns:
+            list[dict]: bundles in the order of the rewards response
+        """
+        return self.by_type.get(bundle_type, [])
+
+    def path_chests(self) -> list[str]:
+        """Get reward ids of all unconsumed path chests.
+
+        Returns:
+            list[str]: reward ids
+        """
+        return [bundle["rewards"][-1]["id"] for bundle in self.bundles(PATH_CHEST)]
+
+    def next_path_chest(self) -> str | None:
+        """Get reward id of the next path chest.
+
+        Returns:
+            str | None: reward id or None if there is none
+        """
+        if bundles := self.bundles(PATH_CHEST):
+            return bundles[0]["rewards"][-1]["id"]
+        return None
+
+    def consume(self, reward_id: str) -> None:
+        """Remove the bundle of an opened reward.
+
+        Args:
+            reward_id (str): reward id
+        """
+        if (bundle := self.by_id.get(reward_id)) is None:
+            return
+        self.by_type[bundle["rewardBundleType"]].remove(bundle)
+        for reward in bundle["rewards"]:
+            self.by_id.pop(reward["id"], None)
@@ -1,38 +1,74 @@
 """Sessions"""
 
-import json
+import asyncio
+from collections.abc import Callable
+from dataclasses import dataclass
 import logging
-import random
-from datetime import datetime, timezone
 import time
-from typing import Any, cast
+from typing import Any
 
-from duobot.api import Api
+import requests
+
+from duobot import jsonlib, metrics, profiling
+from duobot.api import Api, AsyncApi
+from duobot.batching import BatchCoalescer
 from duobot.challenges import Challenges
 from duobot.config import Config
+from duobot.journal import ACKED, FETCHED, PLANNED, PROGRESS, SENT, SOLVED, Journal
+from duobot.models import SKILL_TYPES, LessonType, PathLevel
+from duobot.progress import ProgressSink, count_progress
+from duobot.rewards import RewardIndex
+from duobot.storycache import StoryCache, StorySummary
+from duobot.timing import Timing, span
 
 log = logging.getLogger(__name__)
 
 
 BATCH_URL_SESSION_COMPLETE = Config.BATCH_URL_SESSION_COMPLETE
-URL_CHEST = Config.URL_CHEST
-HEADERS = Config.HEADERS
-API_TIMEOUT = Config.API_TIMEOUT
 STORY_PAYLOAD = Config.STORY_PAYLOAD
 BATCH_URL_STORY_COMPLETE = Config.BATCH_URL_STORY_COMPLETE
-BATCH_URL_STATUS = Config.BATCH_URL_STATUS
-URL_BATCH = Config.URL_BATCH
-URL_BATCH_STORY = Config.URL_BATCH_STORY
+CHEST_BULK = Config.CHEST_BULK
+
+
+@dataclass
+class PreparedLesson:
+    """Solved lesson ready to be sent"""
+
+    lesson: PathLevel
+    reqs: list[dict]
+    url: str
+    endtime: int
+    progress: dict[str, int] | None = None
+    # id of the session, tells replays of the same level apart
+    attempt: str | None = None
+
+    @property
+    def idempotent(self) -> bool:
+        """Sending the lesson again is safe, a session is completed with a PUT."""
+        return self.lesson.type in SKILL_TYPES
 
 
 class Sessions:
     """Sessions class"""
 
-    api = Api()
-    challenges = Challenges()
-
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        api: Api | None = None,
+        batcher: BatchCoalescer | None = None,
+        stories: StoryCache | None = None,
+        journal: Journal | None = None,
+        progress: ProgressSink | None = None,
+    ):
+        self.api = api or Api()
+        self.config = self.api.config
+        self.batcher = batcher
+        self.sender = batcher or self.api
+        self.stories = stories or StoryCache()
+        self.journal = journal
+        self.progress = progress or ProgressSink(self.api)
+        self.rewards: RewardIndex | None = None
+        self.timing = Timing()
+        self.challenges = Challenges(self.timing)
 
     def create_batch_session_response(
         self, response: dict, session_id: str
@@ -48,219 +84,695 @@ class Sessions:
         """
         log.info("Creating batch session response")
         url = BATCH_URL_SESSION_COMPLETE.format(session_id=session_id)
-        request = {"body": json.dumps(response), "method": "PUT", "url": url}
+        request = {"body": jsonlib.dumps(response), "method": "PUT", "url": url}
         return request
 
-    def get_next_lesson(self, course: dict) -> dict:
+    def get_next_lesson(self, course: dict) -> PathLevel:
         """Get next lesson for current course.
 
         Args:
             course (dict): current courses
 
         Returns:
-            dict: next level
+            PathLevel: next level
         """
         log.info("Getting next lesson")
         for unit in course["path"]:
             for i, level in enumerate(unit["levels"]):
                 if level["state"] == "active":
-                    level["levelIndex"] = i
-                    level["levelSessionIndex"] = level["finishedSessions"]
                     log.info("Lesson name: %s", level["debugName"])
                     log.debug("Lesson: %s", level)
-                    return level
+                    return PathLevel.from_level(level, i)
         raise RuntimeError("No active levels found")
 
-    def open_chest(self, course: dict, lesson: dict) -> None:
+    def predict_next_lesson(self, course: dict, lesson: PathLevel) -> PathLevel | None:
+        """Predict the lesson following the given one once it is finished.
+
+        Args:
+            course (dict): course the lesson was taken from
+            lesson (PathLevel): current lesson
+
+        Returns:
+            PathLevel | None: predicted next level or None if unknown
+        """
+        if (
+            lesson.type in SKILL_TYPES
+            and lesson.finished_sessions + 1 < lesson.total_sessions
+        ):
+            return lesson.next_session()
+        found = False
+        for unit in course["path"]:
+            for i, level in enumerate(unit["levels"]):
+                if found:
+                    try:
+                        return PathLevel.from_level(level, i)
+                    except RuntimeError:
+                        return None
+                found = level["id"] == lesson.id
+        return None
+
+    def reward_index(self) -> RewardIndex:
+        """Get reward index.
+        Rewards are only fetched again once the index has no path chest left.
+
+        Returns:
+            RewardIndex: reward index
+        """
+        if self.rewards is None or self.rewards.next_path_chest() is None:
+            self.rewards = RewardIndex(self.api.fetch_rewards())
+        return self.rewards
+
+    def next_path_chest_id(self) -> str:
+        """Get reward id of the next path chest from the reward index.
+
+        Returns:
+            str: reward id
+        """
+        if (chest_id := self.reward_index().next_path_chest()) is None:
+            raise RuntimeError("No path chest found")
+        return chest_id
+
+    def open_chest(self, course: dict, lesson: PathLevel) -> None:
         """Open chest on path.
 
         Args:
             course (dict): lesson
-            lesson (dict): lesson
+            lesson (PathLevel): lesson
         """
         log.info("Opening chest")
-        rewards = self.api.fetch_rewards()
-        chest_id = self.get_next_path_chest_id(rewards)
+        chest_id = self.next_path_chest_id()
+        try:
+            if self.batcher is not None:
+                request = self.create_batch_chest_request(course, lesson, chest_id)
+                response = self.batcher.submit(request).result()
+                if (status := response.get("status", 200)) >= 400:
+                    raise requests.exceptions.HTTPError(
+                        f"Opening chest {chest_id} failed with status {status}"
+                    )
+            else:
+                url, payload = self.create_chest_request(course, lesson, chest_id)
+                self.api.fetch_chest(url, payload)
+        except requests.exceptions.HTTPError:
+            # rewards changed elsewhere, fetch them again next time
+            self.rewards = None
+            self.api.cache.invalidate("rewards")
+            raise
+        self.rewards.consume(chest_id)
+        self.advance_path(course, lesson)
+        self.api.store_course(course)
+
+    def open_chests(self, course: dict, lesson: PathLevel) -> list[PathLevel]:
+        """Open all reachable path chests, starting with the given one.
+        Consecutive chests are opened with one batch request, the chests
+        opened are marked as passed in the course, which replaces the cached
+        course instead of fetching it again.
+
+        Args:
+            course (dict): course
+            lesson (PathLevel): active chest
+
+        Returns:
+            list[PathLevel]: opened chests
+        """
+        chests = self.get_chest_run(course, lesson) if CHEST_BULK else [lesson]
+        chest_ids = self.reward_index().path_chests()[: len(chests)]
+        if len(chest_ids) < 2:
+            self.open_chest(course, lesson)
+            return [lesson]
+        chests = chests[: len(chest_ids)]
+        log.info("Opening %s chests", len(chests))
+        reqs = [
+            self.create_batch_chest_request(course, chest, chest_id)
+            for chest, chest_id in zip(chests, chest_ids)
+        ]
+        reqs.append(self.create_batch_status_request())
+        response = self.sender.send_batch_requests(
+            reqs, url=self.config.URL_BATCH, idempotent=True
+        )
+        opened = []
+        for chest, chest_id, resp in zip(chests, chest_ids, response["responses"]):
+            # a chest is only reachable once the previous one is open
+            if resp.get("status", 200) >= 400:
+                log.warning("Opening chest %s failed: %s", chest_id, resp)
+                self.rewards = None
+                break
+            self.rewards.consume(chest_id)
+            self.advance_path(course, chest)
+            opened.append(chest)
+        if not opened:
+            raise RuntimeError("Opening chests failed")
+        self.api.store_course(course)
+        return opened
+
+    def get_chest_run(self, course: dict, lesson: PathLevel) -> list[PathLevel]:
+        """Get the given chest and the chests directly following it on the path.
+
+        Args:
+            course (dict): course
+            lesson (PathLevel): chest
+
+        Returns:
+            list[PathLevel]: consecutive chests
+        """
+        chests: list[PathLevel] = []
+        for unit in course["path"]:
+            for i, level in enumerate(unit["levels"]):
+                if chests or level["id"] == lesson.id:
+                    if level["type"] != LessonType.CHEST.value:
+                        return chests
+                    chests.append(PathLevel.from_level(level, i))
+        return chests
+
+    def advance_path(self, course: dict, lesson: PathLevel) -> None:
+        """Mark a finished level as passed in the course and activate the next one.
+
+        Args:
+            course (dict): course
+            lesson (PathLevel): finished level
+        """
+        found = False
+        for unit in course["path"]:
+            for level in unit["levels"]:
+                if found:
+                    level["state"] = "active"
+                    return
+                if level["id"] == lesson.id:
+                    level["state"] = "passed"
+                    level["finishedSessions"] = lesson.finished_sessions + 1
+                    found = True
+
+    def create_chest_request(
+        self, course: dict, lesson: PathLevel, chest_id: str
+    ) -> tuple[str, dict]:
+        """Create url and payload for opening a path chest.
+
+        Args:
+            course (dict): course
+            lesson (PathLevel): lesson
+            chest_id (str): reward id of the chest
+
+        Returns:
+            tuple[str, dict]: url and payload
+        """
+        url = self.config.URL_CHEST.format(chest_id=chest_id)
+        return url, self.create_chest_payload(course, lesson)
+
+    def create_batch_chest_request(
+        self, course: dict, lesson: PathLevel, chest_id: str
+    ) -> dict[str, Any]:
+        """Create batch request for opening a path chest.
+
+        Args:
+            course (dict): course
+            lesson (PathLevel): lesson
+            chest_id (str): reward id of the chest
+
+        Returns:
+            dict[str, Any]: request
+        """
+        url = self.config.BATCH_URL_CHEST.format(chest_id=chest_id)
+        payload = self.create_chest_payload(course, lesson)
+        return {"body": jsonlib.dumps(payload), "method": "PATCH", "url": url}
+
+    def create_chest_payload(self, course: dict, lesson: PathLevel) -> dict:
+        """Create payload for opening a path chest.
+
+        Args:
+            course (dict): course
+            lesson (PathLevel): lesson
+
+        Returns:
+            dict: payload
+        """
         payload = {}
         payload["consumed"] = True
-        payload["pathLevelSpecifics"] = lesson["pathLevelMetadata"]
+        payload["pathLevelSpecifics"] = lesson.metadata
         payload["fromLanguage"] = course["fromLanguage"]
         payload["learningLanguage"] = course["learningLanguage"]
-        url = URL_CHEST.format(chest_id=chest_id)
-        self.api.fetch_chest(url, payload)
-
-    def get_next_path_chest_id(self, rewards: dict) -> dict:
-        """Get path chest from rewards.
+        return payload
 
-        Args:
-            rewards (dict): rewards
+    def create_batch_status_request(self) -> dict[str, Any]:
+        """Create batch request for the user status.
+        Its response is cached by the api, which saves a separate status request.
 
         Returns:
-            dict: path chest
+            dict[str, Any]: request
         """
-        for reward in rewards["rewardBundles"]:
-            if reward["rewardBundleType"] == "PATH_CHEST":
-                return reward["rewards"][-1]["id"]
-        raise RuntimeError("No path chest found")
+        return {"body": "", "method": "GET", "url": self.config.BATCH_URL_USER_STATUS}
 
-    def create_fetch_session_payload(self, lesson: dict) -> dict:
+    def create_fetch_session_payload(self, lesson: PathLevel) -> dict:
         """Create session payload for given lesson.
 
         Args:
-            lesson (dict): lesson
+            lesson (PathLevel): lesson
 
         Returns:
             dict: session
         """
         payload = Config.SESSION_PAYLOAD.copy()
-        if lesson["type"] == "skill":
-            payload["skillId"] = lesson["pathLevelMetadata"]["skillId"]
-            payload["levelIndex"] = lesson["levelIndex"]
-            if lesson["hasLevelReview"] and (
-                lesson["totalSessions"] - lesson["finishedSessions"] == 1
+        if lesson.type == LessonType.SKILL:
+            payload["skillId"] = lesson.metadata["skillId"]
+            payload["levelIndex"] = lesson.level_index
+            if lesson.has_level_review and (
+                lesson.total_sessions - lesson.finished_sessions == 1
             ):
                 log.info("Doing level review lesson")
                 payload["generatorIdentifiersOfRecentMistakes"] = []
                 payload["type"] = "LEVEL_REVIEW"
             else:
                 log.info("Doing normal lesson")
-                payload["levelSessionIndex"] = lesson["levelSessionIndex"]
+                payload["levelSessionIndex"] = lesson.level_session_index
                 payload["type"] = "LESSON"
-        elif lesson["type"] == "practice":
+        elif lesson.type == LessonType.PRACTICE:
             log.info("Doing practice session")
-            payload["skillIds"] = lesson["pathLevelClientData"]["skillIds"]
-            payload["levelSessionIndex"] = lesson["levelSessionIndex"]
+            payload["skillIds"] = list(lesson.skill_ids)
+            payload["levelSessionIndex"] = lesson.level_session_index
             payload["lexemePracticeType"] = "practice_level"
             payload["type"] = "LEXEME_PRACTICE"
-        elif lesson["type"] == "unit_review":
+        elif lesson.type == LessonType.UNIT_REVIEW:
             log.info("Doing unit review lesson")
-            payload["skillIds"] = [lesson["pathLevelMetadata"]["anchorSkillId"]]
-            payload["type"] = lesson["type"].upper()
+            payload["skillIds"] = [lesson.metadata["anchorSkillId"]]
+            payload["type"] = lesson.type.value.upper()
         return payload
 
-    def solve_skill(self, lesson: dict) -> None:
-        """Solve skill session.
+    def wait_until(self, endtime: int) -> None:
+        """Block until the given end time has passed.
+
+        Args:
+            endtime (int): end time as unix timestamp
+        """
+        waittime = endtime - time.time()
+        if waittime > 0:
+            log.info("Waiting %.1f seconds before sending", waittime)
+            with metrics.WAIT_SECONDS.time():
+                time.sleep(waittime)
+
+    def send_at(
+        self, reqs: list[dict], url: str, endtime: int, idempotent: bool = False
+    ) -> dict:
+        """Send batch requests once the end time has passed.
 
         Args:
-            lesson (dict): lesson
+            reqs (list[dict]): batch requests
+            url (str): batch url
+            endtime (int): end time as unix timestamp
+            idempotent (bool): all requests can be repeated safely
+
+        Returns:
+            dict: response
+        """
+        with profiling.phase("wait"):
+            self.wait_until(endtime)
+        with profiling.phase("submit"):
+            return self.sender.send_batch_requests(reqs, url=url, idempotent=idempotent)
+
+    def prepare_skill(self, lesson: PathLevel, session: dict) -> tuple[list[dict], int]:
+        """Create the batch requests solving a skill session.
+
+        Args:
+            lesson (PathLevel): lesson
+            session (dict): fetched session
+
+        Returns:
+            tuple[list[dict], int]: batch requests and end time
         """
-        payload = self.create_fetch_session_payload(lesson=lesson)
-        session = self.api.fetch_session(payload)
         response = self.challenges.create_session_solution_response(
             session=session, skill=lesson
         )
         batch_request = self.create_batch_session_response(response, session["id"])
-        now = int(datetime.now(tz=timezone.utc).timestamp())
-        endtime = response["endTime"]
-        if now < endtime:
-            waittime = endtime - now
-            log.info("Waiting %s seconds before sending", waittime)
-            time.sleep(waittime)
-        self.api.send_batch_requests([batch_request], url=URL_BATCH)
+        return [batch_request, self.create_batch_status_request()], response["endTime"]
 
-    def solve_story(self, lesson: dict) -> None:
-        """Solve story.
+    def prepare_story(
+        self, lesson: PathLevel, story: StorySummary
+    ) -> tuple[list[dict], int]:
+        """Create the batch requests solving a story.
 
         Args:
-            lesson (dict): story lesson
+            lesson (PathLevel): story lesson
+            story (StorySummary): story summary
+
+        Returns:
+            tuple[list[dict], int]: batch requests and end time
         """
-        log.info("Solving story")
-        story_id = lesson["pathLevelMetadata"]["storyId"]
-        story = self.api.fetch_story(story_id)
         responses = self.create_batch_story_response(lesson, story)
-        now = int(datetime.now(tz=timezone.utc).timestamp())
-        endtime = json.loads(responses[0]["body"])["endTime"]
-        if now < endtime:
-            waittime = endtime - now
-            log.info("Need to wait for %s seconds before sending", waittime)
-            time.sleep(waittime)
-        self.api.send_batch_requests(responses, url=URL_BATCH_STORY)
-
-    def create_batch_story_response(self, lesson: dict, story: dict) -> list[dict]:
+        endtime = jsonlib.loads(responses[0]["body"])["endTime"]
+        return responses, endtime
+
+    def fetch_story_summary(self, lesson: PathLevel, course: dict) -> StorySummary:
+        """Get summary of a story from the story cache or fetch it.
+
+        Args:
+            lesson (PathLevel): story lesson
+            course (dict): course
+
+        Returns:
+            StorySummary: story summary
+        """
+        story_id = lesson.metadata["storyId"]
+        languages = (course["fromLanguage"], course["learningLanguage"])
+        if (story := self.stories.get(story_id, *languages)) is not None:
+            log.info("Using cached story")
+            return story
+        story = self.api.fetch_story_summary(story_id)
+        self.stories.put(story_id, story)
+        return story
+
+    def prepare_lesson(self, lesson: PathLevel, course: dict) -> PreparedLesson:
+        """Fetch and solve a skill session or story without sending it.
+        A solution of the lesson left in the journal by a previous run is
+        reused if it is still recent enough.
+
+        Args:
+            lesson (PathLevel): lesson
+            course (dict): course
+
+        Returns:
+            PreparedLesson: solved lesson
+        """
+        if self.journal is not None:
+            entry = self.journal.get(lesson.key)
+            if entry is not None and self.journal.is_reusable(entry):
+                log.info("Resuming lesson from journal (%s)", entry["phase"])
+                return PreparedLesson(
+                    lesson,
+                    entry["reqs"],
+                    entry["url"],
+                    entry["endtime"],
+                    entry.get("progress"),
+                    entry.get("session"),
+                )
+        self.record_phase(lesson, PLANNED, type=lesson.type.value)
+        progress = attempt = None
+        if lesson.type in SKILL_TYPES:
+            payload = self.create_fetch_session_payload(lesson=lesson)
+            with profiling.phase("session"):
+                session = self.api.fetch_session(payload)
+            attempt = session["id"]
+            self.record_phase(lesson, FETCHED, session=attempt)
+            with profiling.phase("solution"):
+                # count before solving, which strips the character names
+                progress = count_progress(self.challenges.count_challenges(session))
+                reqs, endtime = self.prepare_skill(lesson, session)
+            url = self.config.URL_BATCH
+        elif lesson.type == LessonType.STORY:
+            with profiling.phase("story"):
+                story = self.fetch_story_summary(lesson, course)
+            self.record_phase(lesson, FETCHED)
+            with profiling.phase("solution"):
+                reqs, endtime = self.prepare_story(lesson, story)
+            url = self.config.URL_BATCH_STORY
+        else:
+            raise RuntimeError(f"Cannot prepare lesson of type {lesson.type.value}")
+        self.record_phase(
+            lesson, SOLVED, reqs=reqs, url=url, endtime=endtime, progress=progress
+        )
+        return PreparedLesson(lesson, reqs, url, endtime, progress, attempt)
+
+    def submit_lesson(self, prepared: PreparedLesson) -> None:
+        """Wait for the end time of a prepared lesson and send it.
+
+        Args:
+            prepared (PreparedLesson): solved lesson
+        """
+        self.record_phase(prepared.lesson, SENT, sync=True)
+        self.send_at(prepared.reqs, prepared.url, prepared.endtime, prepared.idempotent)
+        self.complete_lesson(prepared)
+
+    def complete_lesson(self, prepared: PreparedLesson) -> None:
+        """Record a sent lesson and add its goals progress.
+
+        Args:
+            prepared (PreparedLesson): sent lesson
+        """
+        lesson = prepared.lesson
+        self.record_phase(lesson, ACKED, sync=True)
+        if lesson.type in SKILL_TYPES:
+            with profiling.phase("progress"):
+                self.update_progress(prepared.attempt or lesson.key, prepared.progress)
+            self.record_phase(lesson, PROGRESS)
+        if self.journal is not None:
+            self.journal.finish(lesson.key)
+        metrics.LESSONS.inc(1, lesson.type.value)
+
+    def record_phase(
+        self, lesson: PathLevel, phase: str, sync: bool = False, **fields: Any
+    ) -> None:
+        """Record in the journal that a lesson reached a phase.
+
+        Args:
+            lesson (PathLevel): lesson
+            phase (str): phase
+            sync (bool): fsync before returning
+            **fields (Any): data of the phase
+        """
+        if self.journal is not None:
+            self.journal.record(lesson.key, phase, sync, **fields)
+
+    def resume(self) -> None:
+        """Settle lessons the journal shows a previous run left unfinished.
+        Lessons sent before the path moved on have landed and only miss
+        their progress update. The solution of the active lesson is kept to
+        be sent again, everything else is dropped.
+        """
+        if self.journal is None or not (entries := self.journal.unfinished()):
+            return
+        status = self.api.fetch_user_status()
+        course = self.api.fetch_current_course(course_id=status["currentCourseId"])
+        active = self.get_next_lesson(course).key
+        for entry in entries:
+            key, phase = entry["key"], entry["phase"]
+            if phase in (ACKED, PROGRESS) or (phase == SENT and key != active):
+                log.info("Lesson %s was sent before the restart", key)
+                if entry["type"] in SKILL_TYPES and phase != PROGRESS:
+                    self.update_progress(
+                        entry.get("session", key), entry.get("progress")
+                    )
+                    self.journal.record(key, PROGRESS)
+            elif key == active and self.journal.is_reusable(entry):
+                log.info("Lesson %s will be resumed (%s)", key, phase)
+                continue
+            else:
+                log.info("Dropping lesson %s left at %s", key, phase)
+            self.journal.finish(key)
+
+    def create_batch_story_response(
+        self, lesson: PathLevel, story: StorySummary
+    ) -> list[dict]:
         """Create story response for batch request.
+        The start time is the local time the story is solved at, as the one
+        of a fetched story would be stale for cached stories.
 
         Args:
-            lesson (dict): lesson
-            story (dict): story
+            lesson (PathLevel): lesson
+            story (StorySummary): story summary
 
         Returns:
             list[dict]: batch story response payload
         """
         log.info("Creating batch story response")
         payload = STORY_PAYLOAD.copy()
-        # count number of challenges in story
-        challenges = [
-            e for e in story["elements"] if e["type"] not in ["HEADER", "LINE"]
-        ]
-        score = len(challenges) - 1
+        score = story.challenges - 1
         payload["score"] = score
         payload["maxScore"] = score
-        payload["pathLevelId"] = lesson["id"]
-        payload["fromLanguage"] = story["fromLanguage"]
-        payload["learningLanguage"] = story["learningLanguage"]
-        payload["expectedXp"] = story["baseXp"]
-        payload["startTime"] = story["startTime"]
-        payload["endTime"] = cast(int, payload["startTime"]) + random.randint(3, 7)
-        payload["pathLevelSpecifics"] = lesson["pathLevelMetadata"]
+        payload["pathLevelId"] = lesson.id
+        payload["fromLanguage"] = story.from_language
+        payload["learningLanguage"] = story.learning_language
+        payload["expectedXp"] = story.base_xp
+        start, end = span(self.timing.story_ms(story.challenges))
+        payload["startTime"] = start
+        payload["endTime"] = end
+        payload["pathLevelSpecifics"] = lesson.metadata
         log.info("Creating batch session response")
-        url = BATCH_URL_STORY_COMPLETE.format(
-            story_id=lesson["pathLevelMetadata"]["storyId"]
-        )
+        url = BATCH_URL_STORY_COMPLETE.format(story_id=lesson.metadata["storyId"])
         # we need at least two requests here, otherwise we get 500 response
         reqs = [
-            {"body": json.dumps(payload), "method": "POST", "url": url},
-            {"body": "", "method": "GET", "url": BATCH_URL_STATUS},
+            {"body": jsonlib.dumps(payload), "method": "POST", "url": url},
+            self.create_batch_status_request(),
         ]
         log.debug("Batch story response: %s", reqs)
         return reqs
 
-    def update_progress(self) -> None:
-        """Update progress."""
-        log.info("Updating progress")
-        status = self.api.fetch_user_status()
-        payload = {
-            "metric_updates": [
-                {"metric": "LESSONS", "quantity": 1},
-                {"metric": "PERFECT_LESSONS", "quantity": 1},
-                {"metric": "NINETY_ACCURACY_LESSONS", "quantity": 1},
-                {"metric": "SPEAK_CHALLENGES", "quantity": 2},
-                {"metric": "LISTEN_CHALLENGES", "quantity": 2},
-                {"metric": "BEA", "quantity": 1},
-                {"metric": "OSCAR", "quantity": 1},
-                {"metric": "FALSTAFF", "quantity": 1},
-                {"metric": "EDDY", "quantity": 1},
-                {"metric": "LUCY", "quantity": 1},
-                {"metric": "LILY", "quantity": 1},
-                {"metric": "JUNIOR", "quantity": 1},
-                {"metric": "LIN", "quantity": 1},
-                # todo theres some more here we might need
-            ],
-            "timestamp": datetime.now(tz=timezone.utc).strftime(
-                r"%Y-%m-%dT%H:%M:%S.%f"
-            )[:-3]
-            + "Z",  #  format: "2024-10-12T10:11:54.829Z",
-            "timezone": status["timezone"],
-        }
-        self.api.post_progress_update(payload=payload)
-
-    def solve_lesson(self, course: dict, lesson: dict) -> None:
+    def update_progress(self, attempt: str, progress: dict[str, int] | None) -> None:
+        """Add goals progress of a sent lesson to the progress sink.
+        The lesson is already saved at this point, so a failing goals update
+        is logged by the sink instead of failing the lesson.
+
+        Args:
+            attempt (str): id of the attempt, the session id
+            progress (dict[str, int] | None): quantity per metric, None if unknown
+        """
+        self.progress.add(attempt, progress or count_progress())
+
+    def solve_lesson(self, course: dict, lesson: PathLevel) -> None:
         """Solve lesson.
 
         Args:
             course (dict): course
-            lesson (dict): lesson
+            lesson (PathLevel): lesson
 
         """
-        log.debug("Lesson type: %s", lesson["type"])
-        if lesson["type"] in ["unit_review", "skill", "practice"]:
+        log.debug("Lesson type: %s", lesson.type)
+        if lesson.type in SKILL_TYPES:
             log.info("Found a skill session on the path.")
-            self.solve_skill(lesson)
-            self.update_progress()
-        elif lesson["type"] == "story":
+            self.submit_lesson(self.prepare_lesson(lesson, course))
+        elif lesson.type == LessonType.STORY:
             log.info("Found a story on the path.")
-            self.solve_story(lesson)
-        elif lesson["type"] == "chest":
+            log.info("Solving story")
+            self.submit_lesson(self.prepare_lesson(lesson, course))
+        elif lesson.type == LessonType.CHEST:
             log.info("Found a chest on the path.")
-            self.open_chest(course, lesson)
+            with profiling.phase("chest"):
+                opened = self.open_chests(course, lesson)
+            metrics.LESSONS.inc(len(opened), lesson.type.value)
         else:
             raise RuntimeError("Unknown lesson type")
+
+    def solve_next_lesson(
+        self, choose: Callable[[dict, PathLevel], PathLevel] | None = None
+    ) -> PathLevel:
+        """Solve the next lesson on the path of the current course.
+
+        Args:
+            choose (Callable[[dict, PathLevel], PathLevel] | None): picks the
+                lesson to solve given the course and the next lesson on the path
+
+        Returns:
+            PathLevel: solved lesson
+        """
+        with profiling.phase("status"):
+            status = self.api.fetch_user_status()
+        log.info(
+            "Doing course %s. Streak: %s. XP: %s",
+            status["currentCourseId"],
+            status["streak"],
+            status["totalXp"],
+        )
+        with profiling.phase("course"):
+            course = self.api.fetch_current_course(course_id=status["currentCourseId"])
+        with profiling.phase("next_lesson"):
+            lesson = self.get_next_lesson(course)
+        if choose is not None:
+            lesson = choose(course, lesson)
+        self.solve_lesson(course, lesson)
+        return lesson
+
+
+class AsyncSessions:
+    """Asyncio sessions class.
+    Wraps Sessions: the wait for the end time of a lesson is awaited while
+    fetching, solving and settling a lesson run in the default executor, so
+    many lessons can run on one event loop and still go through the
+    journal, the progress sink and the chest batching of Sessions.
+    """
+
+    def __init__(
+        self,
+        api: Api | None = None,
+        batcher: BatchCoalescer | None = None,
+        session: Sessions | None = None,
+    ):
+        """Create async sessions.
+
+        Args:
+            api (Api | None): api, ignored if session is given
+            batcher (BatchCoalescer | None): batcher, ignored if session is given
+            session (Sessions | None): sessions to wrap, a new one if None
+        """
+        self.session = session or Sessions(api, batcher)
+        self.config = self.session.config
+        self.aapi = AsyncApi(self.session.api)
+
+    async def wait_until(self, endtime: int) -> None:
+        """Wait until the given end time has passed.
+
+        Args:
+            endtime (int): end time as unix timestamp
+        """
+        waittime = endtime - time.time()
+        if waittime > 0:
+            log.info("Waiting %.1f seconds before sending", waittime)
+            with metrics.WAIT_SECONDS.time():
+                await asyncio.sleep(waittime)
+
+    async def send_at(
+        self, reqs: list[dict], url: str, endtime: int, idempotent: bool = False
+    ) -> dict:
+        """Send batch requests once the end time has passed.
+
+        Args:
+            reqs (list[dict]): batch requests
+            url (str): batch url
+            endtime (int): end time as unix timestamp
+            idempotent (bool): all requests can be repeated safely
+
+        Returns:
+            dict: response
+        """
+        sender = self.session.sender
+        await self.wait_until(endtime)
+        return await asyncio.to_thread(
+            sender.send_batch_requests, reqs, url, idempotent
+        )
+
+    async def submit_lesson(self, prepared: PreparedLesson) -> None:
+        """Wait for the end time of a prepared lesson and send it.
+
+        Args:
+            prepared (PreparedLesson): solved lesson
+        """
+        await asyncio.to_thread(self.session.record_phase, prepared.lesson, SENT, True)
+        await self.send_at(
+            prepared.reqs, prepared.url, prepared.endtime, prepared.idempotent
+        )
+        await asyncio.to_thread(self.session.complete_lesson, prepared)
+
+    async def solve_lesson(self, course: dict, lesson: PathLevel) -> None:
+        """Solve lesson.
+
+        Args:
+            course (dict): course
+            lesson (PathLevel): lesson
+        """
+        log.debug("Lesson type: %s", lesson.type)
+        if lesson.type in SKILL_TYPES or lesson.type == LessonType.STORY:
+            log.info("Found a %s on the path.", lesson.type.value)
+            prepared = await asyncio.to_thread(
+                self.session.prepare_lesson, lesson, course
+            )
+            await self.submit_lesson(prepared)
+        elif lesson.type == LessonType.CHEST:
+            log.info("Found a chest on the path.")
+            opened = await asyncio.to_thread(self.session.open_chests, course, lesson)
+            metrics.LESSONS.inc(len(opened), lesson.type.value)
+        else:
+            raise RuntimeError("Unknown lesson type")
+
+    async def solve_next_lesson(self) -> PathLevel:
+        """Solve the next lesson on the path of the current course.
+
+        Returns:
+            PathLevel: solved lesson
+        """
+        status = await self.aapi.fetch_user_status()
+        log.info(
+            "Doing course %s. Streak: %s. XP: %s",
+            status["currentCourseId"],
+            status["streak"],
+            status["totalXp"],
+        )
+        course = await self.aapi.fetch_current_course(
+            course_id=status["currentCourseId"]
+        )
+        lesson = self.session.get_next_lesson(course)
+        await self.solve_lesson(course, lesson)
+        return lesson
+
+    async def resume(self) -> None:
+        """Settle lessons the journal shows a previous run left unfinished."""
+        await asyncio.to_thread(self.session.resume)
+
+    async def close(self) -> None:
+        """Post pending progress and close the journal."""
+        await asyncio.to_thread(self.session.progress.close)
+        if self.session.journal is not None:
+            await asyncio.to_thread(self.session.journal.close)
@@ -0,0 +1,205 @@
+"""Story cache"""
+
+from dataclasses import dataclass
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+from duobot.config import Config
+
+log = logging.getLogger(__name__)
+
+STORY_CACHE_PATH = Config.STORY_CACHE_PATH
+STORY_CACHE_SIZE = Config.STORY_CACHE_SIZE
+STORY_SKIP_ELEMENTS = ("HEADER", "LINE")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stories (
+    story_id TEXT NOT NULL,
+    from_language TEXT NOT NULL,
+    learning_language TEXT NOT NULL,
+    challenges INTEGER NOT NULL,
+    base_xp INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (story_id, from_language, learning_language)
+)
+"""
+
+
+@dataclass
+class StorySummary:
+    """Fields of a story needed to complete it"""
+
+    challenges: int
+    base_xp: int
+    from_language: str
+    learning_language: str
+
+    @classmethod
+    def from_story(cls, story: dict) -> "StorySummary":
+        """Summarize fetched story.
+
+        Args:
+            story (dict): story
+
+        Returns:
+            StorySummary: summary
+        """
+        challenges = sum(
+            1 for e in story["elements"] if e["type"] not in STORY_SKIP_ELEMENTS
+        )
+        return cls(
+            challenges=challenges,
+            base_xp=story["baseXp"],
+            from_language=story["fromLanguage"],
+            learning_language=story["learningLanguage"],
+        )
+
+
+def story_pairs_hook(pairs: list[tuple[str, Any]]) -> Any:
+    """Summarize a story while decoding it.
+    Every nested object is reduced to its type, so the elements of the
+    story end up as a list of type names. The story root, the object with
+    elements and baseXp, becomes the summary.
+
+    Args:
+        pairs (list[tuple[str, Any]]): key value pairs of an object
+
+    Returns:
+        Any: StorySummary for the root, type or None for nested objects
+    """
+    obj = dict(pairs)
+    if "elements" in obj and "baseXp" in obj:
+        return StorySummary(
+            challenges=sum(1 for e in obj["elements"] if e not in STORY_SKIP_ELEMENTS),
+            base_xp=obj["baseXp"],
+            from_language=obj["fromLanguage"],
+            learning_language=obj["learningLanguage"],
+        )
+    return obj.get("type")
+
+
+class StoryCache:
+    """Story cache class.
+    Keeps story summaries in a sqlite database keyed by story id and course
+    languages. Story content does not change, so entries never expire and
+    are only evicted least recently used once the cache is full. sqlite
+    locking makes the file safe to share between processes, errors are
+    logged and treated as misses.
+    """
+
+    def __init__(
+        self, path: str = STORY_CACHE_PATH, max_entries: int = STORY_CACHE_SIZE
+    ):
+        """Open or create cache database.
+
+        Args:
+            path (str): database file, ":memory:" for a private cache
+            max_entries (int): number of stories to keep
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db: sqlite3.Connection | None = None
+        try:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.db = sqlite3.connect(
+                path, timeout=5, isolation_level=None, check_same_thread=False
+            )
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            log.warning("Story cache %s unavailable: %s", path, e)
+            self.db = None
+
+    def close(self) -> None:
+        """Close database."""
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def get(
+        self, story_id: str, from_language: str, learning_language: str
+    ) -> StorySummary | None:
+        """Get story summary and mark it as recently used.
+
+        Args:
+            story_id (str): story id
+            from_language (str): language of the learner
+            learning_language (str): language being learned
+
+        Returns:
+            StorySummary | None: summary or None if not cached
+        """
+        key = (story_id, from_language, learning_language)
+        row = None
+        with self.lock:
+            if self.db is not None:
+                try:
+                    row = self.db.execute(
+                        "SELECT challenges, base_xp FROM stories WHERE story_id = ? "
+                        "AND from_language = ? AND learning_language = ?",
+                        key,
+                    ).fetchone()
+                    if row is not None:
+                        self.db.execute(
+                            "UPDATE stories SET last_used = ? WHERE story_id = ? "
+                            "AND from_language = ? AND learning_language = ?",
+                            (time.time(), *key),
+                        )
+                except sqlite3.Error as e:
+                    log.warning("Reading story cache failed: %s", e)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return StorySummary(row[0], row[1], from_language, learning_language)
+
+    def put(self, story_id: str, summary: StorySummary) -> None:
+        """Store story summary, evicting the least recently used ones if full.
+
+        Args:
+            story_id (str): story id
+            summary (StorySummary): summary
+        """
+        with self.lock:
+            if self.db is None:
+                return
+            try:
+                self.db.execute("BEGIN IMMEDIATE")
+                self.db.execute(
+                    "INSERT OR REPLACE INTO stories VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        story_id,
+                        summary.from_language,
+                        summary.learning_language,
+                        summary.challenges,
+                        summary.base_xp,
+                        time.time(),
+                    ),
+                )
+                self.db.execute(
+                    "DELETE FROM stories WHERE rowid IN (SELECT rowid FROM stories "
+                    "ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+                self.db.execute("COMMIT")
+            except sqlite3.Error as e:
+                log.warning("Writing story cache failed: %s", e)
+                if self.db.in_transaction:
+                    self.db.execute("ROLLBACK")
+
+    def stats(self) -> dict[str, int]:
+        """Get cache statistics.
+
+        Returns:
+            dict[str, int]: hits and misses
+        """
+        return {"hits": self.hits, "misses": self.misses}
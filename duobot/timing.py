@@ -0,0 +1,110 @@
+"""Lesson timing"""
+
+import random
+import time
+
+from duobot.config import Config
+
+CHALLENGE_MIN_MS = Config.CHALLENGE_MIN_MS
+CHALLENGE_MIN_MS_DEFAULT = Config.CHALLENGE_MIN_MS_DEFAULT
+CHALLENGE_MS_PER_WORD = Config.CHALLENGE_MS_PER_WORD
+STORY_MIN_MS = Config.STORY_MIN_MS
+STORY_MS_PER_CHALLENGE = Config.STORY_MS_PER_CHALLENGE
+TIMING_DISTRIBUTION = Config.TIMING_DISTRIBUTION
+TIMING_SPREAD = Config.TIMING_SPREAD
+DISTRIBUTIONS = ("fixed", "uniform", "exponential")
+
+
+class Timing:
+    """Timing class.
+    Computes the shortest plausible time a user takes for a challenge or a
+    story. The minimum of a challenge type grows with the words of the
+    prompt and is stretched by a share drawn from the configured
+    distribution, but never reaches the time taken cutoff of the session.
+    Durations are kept in milliseconds, see span for the whole seconds sent
+    as start and end time.
+    """
+
+    def __init__(
+        self,
+        distribution: str = TIMING_DISTRIBUTION,
+        spread: float = TIMING_SPREAD,
+        rnd: random.Random | None = None,
+    ):
+        """Create timing.
+
+        Args:
+            distribution (str): distribution of the share added to the minimum,
+                fixed, uniform or exponential
+            spread (float): mean share added to the minimum
+            rnd (random.Random | None): random generator, a new one if None
+        """
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown timing distribution {distribution}")
+        self.distribution = distribution
+        self.spread = spread
+        self.random = rnd or random.Random()
+
+    def stretch(self) -> float:
+        """Draw factor applied to a minimum duration.
+
+        Returns:
+            float: factor of at least 1
+        """
+        if self.spread <= 0:
+            return 1.0
+        if self.distribution == "fixed":
+            return 1.0 + self.spread
+        if self.distribution == "uniform":
+            return 1.0 + self.random.uniform(0, 2 * self.spread)
+        return 1.0 + self.random.expovariate(1 / self.spread)
+
+    def challenge_ms(self, challenge: dict, cutoff: int | None = None) -> int:
+        """Get time taken for a challenge.
+
+        Args:
+            challenge (dict): challenge
+            cutoff (int | None): challengeTimeTakenCutoff of the session in ms
+
+        Returns:
+            int: milliseconds
+        """
+        minimum = CHALLENGE_MIN_MS.get(challenge.get("type"), CHALLENGE_MIN_MS_DEFAULT)
+        if isinstance(prompt := challenge.get("prompt"), str):
+            minimum += CHALLENGE_MS_PER_WORD * len(prompt.split())
+        ms = int(minimum * self.stretch())
+        if cutoff:
+            ms = min(ms, cutoff - 1)
+        return ms
+
+    def story_ms(self, challenges: int) -> int:
+        """Get time taken for a story.
+
+        Args:
+            challenges (int): questions of the story the user answers
+
+        Returns:
+            int: milliseconds
+        """
+        return int(
+            (STORY_MIN_MS + STORY_MS_PER_CHALLENGE * challenges) * self.stretch()
+        )
+
+
+def span(duration_ms: int, start_ms: int | None = None) -> tuple[int, int]:
+    """Get start and end time in whole seconds covering a duration.
+    Start is rounded down like every start time sent, the duration is
+    rounded up, so end minus start is never shorter than the duration but
+    the end is not pushed further out than needed.
+
+    Args:
+        duration_ms (int): duration in ms
+        start_ms (int | None): start as unix timestamp in ms, now if None
+
+    Returns:
+        tuple[int, int]: start and end as unix timestamps
+    """
+    if start_ms is None:
+        start_ms = time.time_ns() // 1_000_000
+    start = start_ms // 1000
+    return start, start - (-duration_ms // 1000)
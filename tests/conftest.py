@@ -0,0 +1,48 @@
+"""Shared fixtures"""
+
+import pytest
+
+from duobot.api import Api
+from duobot.config import Config
+from duobot.sessions import Sessions
+from duobot.storycache import StoryCache
+from stub import StubServer
+
+
+class InstantSessions(Sessions):
+    """Sessions submitting lessons without waiting for their end time"""
+
+    def wait_until(self, endtime: float) -> None:
+        pass
+
+
+@pytest.fixture
+def server():
+    server = StubServer(seed=1).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def config(server):
+    config = Config(
+        USER_ID="1",
+        AUTH="Bearer test",
+        BASE_HOST=server.url,
+        STORIES_HOST=server.url,
+        GOALS_HOST=server.url,
+    )
+    config.DELAY_BETWEEN_LESSONS = 0
+    return config
+
+
+@pytest.fixture
+def api(config):
+    api = Api(config)
+    yield api
+    api.close()
+
+
+@pytest.fixture
+def session(api):
+    return InstantSessions(api, stories=StoryCache(":memory:"))
@@ -0,0 +1,63 @@
+"""Async sessions tests"""
+
+import asyncio
+
+from duobot import main
+from duobot.api import Api
+from duobot.config import Config
+from duobot.journal import Journal
+from duobot.progress import ProgressSink
+from duobot.sessions import AsyncSessions
+from duobot.storycache import StoryCache
+
+from conftest import InstantSessions
+
+
+class InstantAsyncSessions(AsyncSessions):
+    """Async sessions submitting lessons without waiting for their end time"""
+
+    async def wait_until(self, endtime: float) -> None:
+        pass
+
+
+def create_session(server, user_id, tmp_path):
+    config = Config(
+        USER_ID=user_id,
+        AUTH="Bearer test",
+        BASE_HOST=server.url,
+        STORIES_HOST=server.url,
+        GOALS_HOST=server.url,
+    )
+    api = Api(config)
+    session = InstantSessions(
+        api,
+        stories=StoryCache(":memory:"),
+        journal=Journal(tmp_path / f"{user_id}.jsonl"),
+        progress=ProgressSink(api, flush_lessons=100),
+    )
+    return InstantAsyncSessions(session=session)
+
+
+def test_start_async_solves_lessons(server, tmp_path):
+    server.layout = ["skill", "chest", "chest", "story"]
+    session = create_session(server, "1", tmp_path)
+    asyncio.run(main.start_async(6, session))
+
+    account = server.account("1")
+    # four skill sessions, both chests in one batch, the story
+    assert account.active_level()["debugName"] == "Unit 2 skill 0"
+    assert account.status()["totalXp"] > 0
+    assert session.session.progress.lessons == []
+    assert session.session.progress.updates == 1
+    assert Journal(tmp_path / "1.jsonl").unfinished() == []
+
+
+def test_start_async_runs_accounts_concurrently(server, tmp_path):
+    sessions = [create_session(server, str(i), tmp_path) for i in range(1, 4)]
+
+    async def run():
+        await asyncio.gather(*(main.start_async(3, s) for s in sessions))
+
+    asyncio.run(run())
+    for i in range(1, 4):
+        assert server.account(str(i)).status()["totalXp"] > 0
@@ -0,0 +1,90 @@
+"""Batch coalescer tests"""
+
+import threading
+import time
+import types
+
+import pytest
+
+from duobot.batching import BatchCoalescer
+
+URL_BATCH = "/batch"
+
+
+class BatchApi:
+    """Api answering batches after a delay and recording their sizes"""
+
+    config = types.SimpleNamespace(URL_BATCH=URL_BATCH)
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batches: list[int] = []
+
+    def send_batch_requests(self, reqs, url, idempotent=False):
+        self.batches.append(len(reqs))
+        time.sleep(self.delay)
+        return {"responses": [{"status": 200, "body": r["url"]} for r in reqs]}
+
+
+def chest(i: int) -> dict:
+    return {"method": "PATCH", "url": f"/rewards/{i}", "body": "{}"}
+
+
+def test_single_caller_does_not_wait_for_window():
+    api = BatchApi()
+    batcher = BatchCoalescer(api, window=5)
+    ts_start = time.monotonic()
+    for i in range(3):
+        response = batcher.send_batch_requests([chest(i)], URL_BATCH, True)
+        assert response == {"responses": [{"status": 200, "body": f"/rewards/{i}"}]}
+    assert time.monotonic() - ts_start < 1
+    assert api.batches == [1, 1, 1]
+    assert batcher.stats() == {"batches": 3, "requests": 3}
+
+
+def test_requests_of_one_caller_go_in_one_batch():
+    api = BatchApi()
+    batcher = BatchCoalescer(api, window=5)
+    response = batcher.send_batch_requests([chest(0), chest(1)], URL_BATCH, True)
+    assert [r["body"] for r in response["responses"]] == ["/rewards/0", "/rewards/1"]
+    assert api.batches == [2]
+
+
+def test_concurrent_callers_are_coalesced():
+    api = BatchApi(delay=0.2)
+    batcher = BatchCoalescer(api, window=0.1)
+    responses = {}
+
+    def send(i):
+        responses[i] = batcher.send_batch_requests([chest(i)], URL_BATCH, True)
+
+    first = threading.Thread(target=send, args=(0,))
+    first.start()
+    time.sleep(0.05)
+    others = [threading.Thread(target=send, args=(i,)) for i in range(1, 5)]
+    for thread in others:
+        thread.start()
+    for thread in [first, *others]:
+        thread.join()
+    assert api.batches == [1, 4]
+    assert {i: r["responses"][0]["body"] for i, r in responses.items()} == {
+        i: f"/rewards/{i}" for i in range(5)
+    }
+    assert batcher.callers == 0
+
+
+def test_not_idempotent_batches_are_sent_unchanged():
+    api = BatchApi()
+    batcher = BatchCoalescer(api)
+    batcher.send_batch_requests([chest(0)], URL_BATCH, idempotent=False)
+    assert api.batches == [1]
+    assert batcher.stats() == {"batches": 0, "requests": 0}
+
+
+def test_failed_batch_fails_every_caller():
+    api = BatchApi()
+    api.send_batch_requests = lambda reqs, url, idempotent: 1 / 0
+    batcher = BatchCoalescer(api)
+    with pytest.raises(ZeroDivisionError):
+        batcher.send_batch_requests([chest(0)], URL_BATCH, True)
+    assert batcher.callers == 0
@@ -0,0 +1,120 @@
+"""Response cache tests"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import pytest
+
+from duobot.api import Api
+from duobot.cache import ResponseCache
+from duobot.config import Config
+from duobot.daemon import Daemon
+from duobot.fleet import Account
+from duobot.storycache import StoryCache
+
+from conftest import InstantSessions
+
+ETAG = '"v1"'
+
+
+class ETagHandler(BaseHTTPRequestHandler):
+    """Handler answering conditional requests with 304"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.hits.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.end_headers()
+            return
+        body = b'{"totalXp": 10}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def etag_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ETagHandler)
+    server.hits = []
+    threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_entry_expires_after_ttl(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("duobot.cache.time.monotonic", lambda: now)
+    cache = ResponseCache({"status": 300})
+    cache.store("/status", "status", b"{}", {"ETag": ETAG})
+    entry = cache.get("/status")
+    assert entry.is_fresh()
+    now += 300
+    assert not entry.is_fresh()
+    assert entry.validators() == {"If-None-Match": ETAG}
+    cache.refresh(entry)
+    assert entry.is_fresh()
+
+
+def test_invalidate_drops_only_given_endpoints():
+    cache = ResponseCache({"status": 300, "course": 300})
+    cache.store("/status", "status", b"{}", {})
+    cache.store("/course", "course", b"{}", {})
+    cache.invalidate("status")
+    assert cache.get("/status") is None
+    assert cache.get("/course") is not None
+
+
+def test_expired_entry_is_revalidated(etag_server):
+    url = f"http://127.0.0.1:{etag_server.server_port}/status"
+    config = Config(USER_ID="1", AUTH="Bearer test")
+    config.CACHE_TTLS = {"status": 300}
+    api = Api(config)
+    assert api.send_request("get", url, endpoint="status") == {"totalXp": 10}
+    assert api.send_request("get", url, endpoint="status") == {"totalXp": 10}
+    assert etag_server.hits == [None]
+
+    api.cache.get(url).expires = 0
+    assert api.send_request("get", url, endpoint="status") == {"totalXp": 10}
+    assert etag_server.hits == [None, ETAG]
+    assert api.cache.get(url).is_fresh()
+    assert api.cache_stats() == {
+        "hits": 1,
+        "misses": 1,
+        "revalidations": 1,
+        "entries": 1,
+    }
+    api.close()
+
+
+class SeenXpSessions(InstantSessions):
+    """Sessions recording the xp of the status every lesson starts with"""
+
+    seen: list[int]
+
+    def solve_next_lesson(self, choose=None):
+        self.seen.append(self.api.fetch_user_status()["totalXp"])
+        return super().solve_next_lesson(choose)
+
+
+def test_daemon_job_does_not_use_stale_status(server, config, monkeypatch):
+    monkeypatch.setattr("duobot.daemon.StoryCache", lambda: StoryCache(":memory:"))
+    daemon = Daemon([Account("a", "1", "Bearer test")], workers=1)
+    session = SeenXpSessions(Api(config))
+    session.seen = []
+    daemon.sessions["a"] = session
+    session.api.fetch_user_status()
+    # the account earned xp elsewhere while the daemon was idle
+    server.account("1").xp = 500
+    daemon.submit("a", 1)
+    daemon.drain()
+    daemon.wait()
+    assert daemon.jobs[1].state == "done"
+    assert session.seen == [500]
@@ -0,0 +1,108 @@
+"""Journal tests"""
+
+from collections import Counter
+
+import pytest
+
+from duobot import main
+from duobot.api import Api
+from duobot.journal import ACKED, SENT, SOLVED, Journal
+from duobot.storycache import StoryCache
+
+from conftest import InstantSessions
+
+
+class Killed(Exception):
+    """Stands in for the process being killed"""
+
+
+class CountingApi(Api):
+    """Api counting the lessons it fetches and sends"""
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.calls = Counter()
+
+    def fetch_session(self, payload):
+        self.calls["fetch_session"] += 1
+        return super().fetch_session(payload)
+
+    def send_batch_requests(self, reqs, url, idempotent=False):
+        self.calls["send_batch_requests"] += 1
+        return super().send_batch_requests(reqs, url, idempotent)
+
+
+class KilledSessions(InstantSessions):
+    """Sessions killed once the lesson reached a phase"""
+
+    kill_at: str | None = None
+
+    def record_phase(self, lesson, phase, sync=False, **fields):
+        super().record_phase(lesson, phase, sync, **fields)
+        if phase == self.kill_at:
+            raise Killed(phase)
+
+    def send_at(self, reqs, url, endtime, idempotent=False):
+        response = super().send_at(reqs, url, endtime, idempotent)
+        if self.kill_at == "after_send":
+            raise Killed("after_send")
+        return response
+
+
+def create_session(config, path, kill_at=None):
+    session = KilledSessions(
+        CountingApi(config), stories=StoryCache(":memory:"), journal=Journal(path)
+    )
+    session.kill_at = kill_at
+    return session
+
+
+@pytest.mark.parametrize("kill_at", ["after_send", ACKED])
+def test_resume_skips_lessons_already_sent(server, config, tmp_path, kill_at):
+    path = tmp_path / "1.jsonl"
+    killed = create_session(config, path, kill_at)
+    with pytest.raises(Killed):
+        killed.solve_next_lesson()
+    xp = server.account("1").status()["totalXp"]
+
+    # the killed run never closes its journal, records are on disk already
+    session = create_session(config, path)
+    main.start(1, session=session)
+
+    assert session.api.calls == {"fetch_session": 1, "send_batch_requests": 1}
+    assert server.account("1").status()["totalXp"] - xp == 10
+    assert Journal(path).unfinished() == []
+    killed.journal.close()
+
+
+def test_resume_sends_solution_of_lesson_killed_before_sending(
+    server, config, tmp_path
+):
+    path = tmp_path / "1.jsonl"
+    killed = create_session(config, path, SOLVED)
+    with pytest.raises(Killed):
+        killed.solve_next_lesson()
+    key = killed.journal.unfinished()[0]["key"]
+    assert killed.api.calls == {"fetch_session": 1}
+
+    session = create_session(config, path)
+    session.resume()
+    assert [entry["key"] for entry in session.journal.unfinished()] == [key]
+    session.solve_next_lesson()
+
+    assert session.api.calls == {"send_batch_requests": 1}
+    assert session.journal.unfinished() == []
+    session.journal.close()
+    killed.journal.close()
+
+
+def test_replay_skips_torn_record(tmp_path):
+    path = tmp_path / "1.jsonl"
+    journal = Journal(path)
+    journal.record("a", SENT, type="skill")
+    journal.close()
+    with open(path, "ab") as f:
+        f.write(b'{"key": "b", "pha')
+    journal = Journal(path)
+    assert [entry["key"] for entry in journal.unfinished()] == ["a"]
+    journal.close()
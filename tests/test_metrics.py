@@ -0,0 +1,28 @@
+"""Metrics tests"""
+
+import pytest
+import requests
+
+from duobot import metrics
+
+
+def test_cache_hits_are_not_timed_as_requests(api):
+    requests = metrics.REQUESTS.get("fetch_user_status", "ok")
+    hits = metrics.REQUESTS.get("fetch_user_status", "cache")
+    timed = metrics.REQUEST_SECONDS.count("fetch_user_status")
+
+    api.fetch_user_status()
+    api.fetch_user_status()
+
+    assert metrics.REQUESTS.get("fetch_user_status", "ok") == requests + 1
+    assert metrics.REQUESTS.get("fetch_user_status", "cache") == hits + 1
+    assert metrics.REQUEST_SECONDS.count("fetch_user_status") == timed + 1
+
+
+def test_failed_requests_are_counted(api, server):
+    errors = metrics.REQUESTS.get("fetch_session", "error")
+    server.error_rate = 1.0
+    api.retry.attempts = 1
+    with pytest.raises(requests.exceptions.HTTPError):
+        api.fetch_session({})
+    assert metrics.REQUESTS.get("fetch_session", "error") == errors + 1
@@ -0,0 +1,25 @@
+"""Goals progress tests"""
+
+from duobot.challenges import ChallengeCounts
+from duobot.progress import count_progress
+
+
+def test_count_progress_without_counts():
+    assert count_progress() == {
+        "LESSONS": 1,
+        "PERFECT_LESSONS": 1,
+        "NINETY_ACCURACY_LESSONS": 1,
+    }
+
+
+def test_count_progress_counts_listen_speak_only_as_speak():
+    counts = ChallengeCounts(types={"listenSpeak": 2, "listenTap": 3, "speak": 1})
+    quantities = count_progress(counts)
+    assert quantities["SPEAK_CHALLENGES"] == 3
+    assert quantities["LISTEN_CHALLENGES"] == 3
+
+
+def test_count_progress_ignores_other_types():
+    quantities = count_progress(ChallengeCounts(types={"translate": 4}))
+    assert "SPEAK_CHALLENGES" not in quantities
+    assert "LISTEN_CHALLENGES" not in quantities
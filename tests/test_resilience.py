@@ -0,0 +1,208 @@
+"""Retry and circuit breaker tests"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from duobot.api import Api
+from duobot.config import Config
+from duobot.resilience import CircuitBreaker, CircuitOpenError, Outage, RetryPolicy
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """Handler answering with the next status of the server script"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def answer(self):
+        self.server.hits.append(self.command)
+        status = self.server.script.pop(0) if self.server.script else 200
+        body = b"{}"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = answer
+
+
+@pytest.fixture
+def scripted():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ScriptedHandler)
+    server.script, server.hits = [], []
+    threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fast_api():
+    api = Api(Config(USER_ID="1", AUTH="Bearer test"), retry=RetryPolicy(backoff=0))
+    yield api
+    api.close()
+
+
+def not_connected() -> requests.exceptions.ConnectionError:
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.exceptions.ConnectionError(MaxRetryError(None, "/", reason))
+
+
+@pytest.mark.parametrize(
+    "status, idempotent, retry",
+    [
+        (429, False, True),
+        (503, False, True),
+        (500, False, False),
+        (502, False, False),
+        (504, False, False),
+        (500, True, True),
+        (404, True, False),
+    ],
+)
+def test_retry_status(status, idempotent, retry):
+    assert RetryPolicy().should_retry_status(status, idempotent, 0) is retry
+
+
+def test_retry_status_stops_after_attempts():
+    policy = RetryPolicy(attempts=2)
+    assert policy.should_retry_status(503, False, 0)
+    assert not policy.should_retry_status(503, False, 1)
+
+
+@pytest.mark.parametrize(
+    "error, idempotent, retry",
+    [
+        (not_connected(), False, True),
+        (requests.exceptions.ConnectTimeout(), False, True),
+        (requests.exceptions.ReadTimeout(), False, False),
+        (requests.exceptions.ChunkedEncodingError(), False, False),
+        (requests.exceptions.ConnectionError(), False, False),
+        (requests.exceptions.ReadTimeout(), True, True),
+        (requests.exceptions.ChunkedEncodingError(), True, True),
+        (requests.exceptions.InvalidURL(), True, False),
+    ],
+)
+def test_retry_error(error, idempotent, retry):
+    assert RetryPolicy().should_retry_error(error, idempotent, 0) is retry
+
+
+def test_delay_honours_retry_after():
+    policy = RetryPolicy(backoff=0, backoff_max=30)
+    assert policy.delay(0) == 0
+    assert policy.delay(0, "7") == 7
+    assert policy.delay(0, "3600") == 30
+
+
+@pytest.mark.parametrize(
+    "script, idempotent, hits",
+    [
+        ([503, 200], False, 2),
+        ([429, 429, 200], False, 3),
+        ([200], False, 1),
+        ([500, 200], True, 2),
+    ],
+)
+def test_send_with_retry_retries(fast_api, scripted, script, idempotent, hits):
+    scripted.script = script
+    url = f"http://127.0.0.1:{scripted.server_port}/"
+    response, content = fast_api.send_with_retry("POST", url, b"{}", {}, idempotent)
+    assert response.status_code == 200
+    assert content == b"{}"
+    assert len(scripted.hits) == hits
+
+
+@pytest.mark.parametrize("status", [500, 502, 504])
+def test_send_with_retry_does_not_repeat_post(fast_api, scripted, status):
+    scripted.script = [status, 200]
+    url = f"http://127.0.0.1:{scripted.server_port}/"
+    with pytest.raises(requests.exceptions.HTTPError):
+        fast_api.send_with_retry("POST", url, b"{}", {}, False)
+    assert len(scripted.hits) == 1
+
+
+def test_send_with_retry_gives_up_after_attempts(fast_api, scripted):
+    scripted.script = [503] * 10
+    url = f"http://127.0.0.1:{scripted.server_port}/"
+    with pytest.raises(requests.exceptions.HTTPError):
+        fast_api.send_with_retry("GET", url, None, {}, True)
+    assert len(scripted.hits) == fast_api.retry.attempts
+
+
+def test_send_with_retry_retries_post_never_connected(fast_api, scripted):
+    url = f"http://127.0.0.1:{scripted.server_port}/"
+    scripted.shutdown()
+    scripted.server_close()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        fast_api.send_with_retry("POST", url, b"{}", {}, False)
+    assert fast_api.breaker(url).failures == fast_api.retry.attempts
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker("host", threshold=2, reset=60)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.check() is False
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_breaker_success_resets_failures():
+    breaker = CircuitBreaker("host", threshold=2, reset=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_breaker_probe_closes_circuit():
+    breaker = CircuitBreaker("host", threshold=1, reset=0)
+    breaker.record_failure()
+    assert breaker.state == "half-open"
+    assert breaker.check() is True
+    # only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.check() is False
+
+
+def test_breaker_failed_probe_reopens_circuit():
+    breaker = CircuitBreaker("host", threshold=1, reset=60)
+    breaker.record_failure()
+    breaker.opened_at -= 60
+    assert breaker.check() is True
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_breaker_probe_without_result_lets_next_probe_through():
+    breaker = CircuitBreaker("host", threshold=1, reset=0)
+    breaker.record_failure()
+    assert breaker.check() is True
+    breaker.end_probe()
+    assert breaker.check() is True
+
+
+def test_outage_gives_up_after_max_outage(monkeypatch):
+    slept = []
+    monkeypatch.setattr("duobot.resilience.time.sleep", slept.append)
+    outage = Outage(max_outage=60)
+    outage.pause(CircuitOpenError("host", 30))
+    outage.pause(CircuitOpenError("host", 30))
+    with pytest.raises(RuntimeError, match="giving up"):
+        outage.pause(CircuitOpenError("host", 30))
+    assert slept == [30, 30]
+    outage.reset()
+    outage.pause(CircuitOpenError("host", 30))
+    assert slept == [30, 30, 30]
@@ -0,0 +1,9 @@
+"""Sessions tests"""
+
+from duobot import main
+
+
+def test_lessons_earn_xp(server, session):
+    xp = server.account("1").status()["totalXp"]
+    main.start(3, session=session)
+    assert server.account("1").status()["totalXp"] > xp